@@ -0,0 +1,357 @@
+import argparse
+from datetime import datetime, timezone
+import json
+import os
+from pathlib import Path
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Any, Callable, Dict
+
+from stand_ins import StandInServer
+from synthetic_trip import REPO_ROOT, SyntheticTripConfig, generate_trip, parse_resolutions
+
+sys.path.insert(0, str(REPO_ROOT.joinpath("src")))
+
+from data_parser import DataParser
+from elevation_api import ElevationAPI
+from elevation_providers import OpenTopoDataProvider, TokenBucket
+from html_generator import HTMLGenerator
+from map_manager import MapManager
+from models.trip import Trip
+from pdf_generator import PDFGenerator
+from photo_manager import PhotoManager
+from photo_metadata_cache import PhotoMetadataCache
+from profiler import Profiler
+
+RESULTS_VERSION = 1
+DEFAULT_WORK_DIRECTORY = Path(tempfile.gettempdir()).joinpath("travel_book_benchmarks")
+
+
+class BenchmarkRunner:
+    """
+    Runs each benchmark `repeat` times, after its setup, and keeps the wall
+    time of every run with the median CPU time, I/O and the peak RSS of the
+    process measured by the profiler.
+    """
+
+    def __init__(self, repeat: int):
+        self.repeat = max(1, repeat)
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    def run(
+        self,
+        name: str,
+        function: Callable[[], Any],
+        setup: Callable[[], Any] | None = None,
+        items: Dict[str, int] | None = None,
+    ):
+        profiler = Profiler(enabled=True)
+        for _ in range(self.repeat):
+            if setup:
+                setup()
+            with profiler.span(name):
+                function()
+
+        runs = [event for event in profiler.events if event["ph"] == "X"]
+        wall_times = [event["dur"] / 1_000_000 for event in runs]
+
+        def median_of(key: str) -> float | None:
+            values = [event["args"][key] for event in runs if key in event["args"]]
+            return round(statistics.median(values), 3) if values else None
+
+        self.results[name] = {
+            "runs": len(runs),
+            "wall_s": [round(wall_time, 6) for wall_time in wall_times],
+            "median_s": round(statistics.median(wall_times), 6),
+            "min_s": round(min(wall_times), 6),
+            "cpu_ms": median_of("process_cpu_ms"),
+            "read_bytes": median_of("read_bytes"),
+            "written_bytes": median_of("written_bytes"),
+            # High-water mark of the whole harness process at the end of the benchmark
+            "peak_rss_kb": max(event["args"].get("peak_rss_kb", 0) for event in runs),
+            "items": items or {},
+        }
+        print(f"ℹ️ {name}: {self.results[name]['median_s']:.4f}s (median of {len(runs)})")
+
+    def skip(self, name: str, reason: str):
+        self.results[name] = {"skipped": reason}
+        print(f"ℹ️ {name}: skipped ({reason})")
+
+
+def is_chromium_available() -> bool:
+    try:
+        from playwright.sync_api import sync_playwright
+
+        with sync_playwright() as p:
+            p.chromium.launch().close()
+        return True
+    except Exception:
+        return False
+
+
+def run_benchmarks(
+    config: SyntheticTripConfig, work_path: Path, repeat: int, workers: int, no_pdf: bool
+) -> Dict[str, Dict[str, Any]]:
+    trip_path = generate_trip(config, work_path.joinpath("trip"))
+    output_path = work_path.joinpath("output")
+    shutil.rmtree(output_path, ignore_errors=True)
+    output_path.mkdir(parents=True)
+
+    runner = BenchmarkRunner(repeat)
+    photos_count = config.steps * config.photos_per_step
+    state: Dict[str, Any] = {}
+
+    def parse() -> Trip:
+        state["trip"] = DataParser().load(trip_path)
+        return state["trip"]
+
+    runner.run("data_parser.load", parse, items={"steps": config.steps})
+
+    # Photos are copied and probed again by each run, with an empty metadata cache
+    photos_path = output_path.joinpath("assets/images/photos")
+    metadata_cache_path = work_path.joinpath("metadata_cache")
+
+    def setup_ingest():
+        shutil.rmtree(photos_path, ignore_errors=True)
+        shutil.rmtree(metadata_cache_path, ignore_errors=True)
+        metadata_cache_path.mkdir(parents=True)
+        parse()
+        state["photo_manager"] = PhotoManager(
+            workers=workers, metadata_cache=PhotoMetadataCache(metadata_cache_path)
+        )
+
+    runner.run(
+        "photo_manager.ingest",
+        lambda: state["photo_manager"].load_from_polarsteps_export(
+            trip_path, photos_path, state["trip"]
+        ),
+        setup=setup_ingest,
+        items={"steps": config.steps, "photos": photos_count},
+    )
+
+    trip: Trip = state["trip"]
+    photo_manager: PhotoManager = state["photo_manager"]
+    trip.compute_default_photos_by_pages()
+    photo_manager.save_photos_pages(trip, output_path)
+
+    runner.run(
+        "photo_manager.load_layout",
+        lambda: photo_manager.load_photos_pages(trip, output_path),
+        items={"steps": config.steps, "photos": photos_count},
+    )
+
+    runner.run(
+        "trip.get_template_vars",
+        lambda: trip.get_template_vars(output_path, "fr"),
+        # Derived fields are cached by the trip once computed
+        setup=trip.invalidate_derived_fields,
+        items={"steps": config.steps},
+    )
+
+    locations = [step.get_lat_lon_as_tuple() for step in trip.steps]
+    elevations_cache_path = work_path.joinpath("elevations_cache")
+
+    with StandInServer() as server:
+
+        def create_elevation_api() -> ElevationAPI:
+            if "elevation_api" in state:
+                state["elevation_api"].close()
+            provider = OpenTopoDataProvider()
+            provider.api_url = server.elevation_api_url
+            # Measures the requests and the cache, not the waits of the public API rate limit
+            provider.rate_limiter = TokenBucket(rate=1_000_000, capacity=1_000_000)
+            provider.max_calls_per_day = sys.maxsize
+            return ElevationAPI(elevations_cache_path, provider=provider)
+
+        def setup_elevations():
+            shutil.rmtree(elevations_cache_path, ignore_errors=True)
+            elevations_cache_path.mkdir(parents=True)
+            state["elevation_api"] = create_elevation_api()
+
+        runner.run(
+            "elevation_api.get_elevation",
+            lambda: state["elevation_api"].get_elevation(locations),
+            setup=setup_elevations,
+            items={"locations": len(locations)},
+        )
+        runner.run(
+            "elevation_api.get_elevation_cached",
+            lambda: state["elevation_api"].get_elevation(locations),
+            setup=lambda: state.update(elevation_api=create_elevation_api()),
+            items={"locations": len(locations)},
+        )
+
+        maps_cache_path = work_path.joinpath("maps_cache")
+        maps_path = output_path.joinpath("assets/images/maps")
+
+        def create_map_manager() -> MapManager:
+            return MapManager(cache_path=maps_cache_path, data_source=server.maps_data_source)
+
+        def setup_maps():
+            shutil.rmtree(maps_cache_path, ignore_errors=True)
+            shutil.rmtree(maps_path, ignore_errors=True)
+            state["map_manager"] = create_map_manager()
+
+        countries = {"countries": len(set(config.countries))}
+        runner.run(
+            "map_manager.download",
+            lambda: state["map_manager"].download_maps_from_trip(trip, maps_path),
+            setup=setup_maps,
+            items=countries,
+        )
+        runner.run(
+            "map_manager.download_cached",
+            lambda: state["map_manager"].download_maps_from_trip(trip, maps_path),
+            setup=lambda: state.update(map_manager=create_map_manager()),
+            items=countries,
+        )
+
+    map_manager: MapManager = state["map_manager"]
+    runner.run(
+        "map_manager.calculate_position_percentages",
+        lambda: map_manager.calculate_position_percentages(trip.steps),
+        items={"steps": config.steps},
+    )
+
+    for step, elevation, position in zip(
+        trip.steps,
+        state["elevation_api"].get_elevation(locations),
+        map_manager.calculate_position_percentages(trip.steps),
+    ):
+        step.elevation = int(elevation) if elevation is not None else None
+        step.position_percentage = position
+    state.pop("elevation_api").close()
+
+    html_file_path = output_path.joinpath("travel_book.html")
+    html_generator = HTMLGenerator()
+    runner.run(
+        "html_generator.generate",
+        lambda: html_generator.generate(trip, html_file_path),
+        items={"steps": config.steps},
+    )
+
+    # Steps reused from the fragments cache filled by the first generation
+    cached_html_generator = HTMLGenerator(cache_path=work_path.joinpath("html_cache"))
+    cached_html_generator.generate(trip, html_file_path)
+    runner.run(
+        "html_generator.generate_cached",
+        lambda: cached_html_generator.generate(trip, html_file_path),
+        items={"steps": config.steps},
+    )
+
+    if no_pdf:
+        runner.skip("pdf_generator.generate", "--no_pdf")
+    elif not is_chromium_available():
+        runner.skip("pdf_generator.generate", "Chromium is not available")
+    else:
+        pdf_generator = PDFGenerator(paper_format="A4", workers=workers)
+        runner.run(
+            "pdf_generator.generate",
+            lambda: pdf_generator.generate(html_file_path, output_path.joinpath("travel_book.pdf")),
+            items={"steps": config.steps},
+        )
+
+    return runner.results
+
+
+def get_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(results: Dict[str, Any], baseline: Dict[str, Any]):
+    """Prints the median time of each benchmark relative to a previous results file."""
+    print(f"ℹ️ Compared to commit {baseline.get('commit')}:")
+    for name, result in results["benchmarks"].items():
+        baseline_result = baseline.get("benchmarks", {}).get(name, {})
+        if "median_s" not in result or "median_s" not in baseline_result:
+            continue
+        ratio = result["median_s"] / baseline_result["median_s"] if baseline_result["median_s"] else 0
+        print(f"  - {name}: {baseline_result['median_s']:.4f}s -> {result['median_s']:.4f}s (x{ratio:.2f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the stages of the travel book on a synthetic trip."
+    )
+    parser.add_argument("--steps", default=200, type=int, help="Number of steps of the trip.")
+    parser.add_argument("--photos_per_step", default=5, type=int, help="Number of photos of each step.")
+    parser.add_argument(
+        "--resolutions",
+        default="1600x1200,1200x1600",
+        type=str,
+        help="Comma separated WIDTHxHEIGHT resolutions of the photos.",
+    )
+    parser.add_argument(
+        "--countries",
+        default="fr,it,es",
+        type=str,
+        help="Comma separated country codes the steps are spread over.",
+    )
+    parser.add_argument("--seed", default=0, type=int, help="Seed of the synthetic trip.")
+    parser.add_argument("--repeat", default=3, type=int, help="Number of runs of each benchmark.")
+    parser.add_argument("--workers", default=1, type=int, help="Workers used by the photos and PDF stages.")
+    parser.add_argument("--no_pdf", action="store_true", help="Skip the PDF benchmark.")
+    parser.add_argument(
+        "--work_directory",
+        default=DEFAULT_WORK_DIRECTORY,
+        type=Path,
+        help="Directory of the synthetic trip, reused between runs, and of the outputs.",
+    )
+    parser.add_argument(
+        "--output",
+        default=Path("benchmark_results.json"),
+        type=Path,
+        help="File the results are written to.",
+    )
+    parser.add_argument("--compare", default=None, type=Path, help="Previous results file to compare with.")
+    args = parser.parse_args()
+
+    output_path = args.output.resolve()
+    compare_path = args.compare.resolve() if args.compare else None
+
+    config = SyntheticTripConfig(
+        steps=args.steps,
+        photos_per_step=args.photos_per_step,
+        resolutions=parse_resolutions(args.resolutions),
+        countries=args.countries.split(","),
+        seed=args.seed,
+    )
+    benchmarks = run_benchmarks(
+        config, args.work_directory.resolve(), args.repeat, args.workers, args.no_pdf
+    )
+
+    results = {
+        "version": RESULTS_VERSION,
+        "commit": get_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": config.to_dict() | {"repeat": args.repeat, "workers": args.workers},
+        "benchmarks": benchmarks,
+    }
+
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"✅ Benchmark results written to '{output_path}'")
+
+    if compare_path:
+        with open(compare_path, "r") as f:
+            print_comparison(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import math
+import re
+import threading
+from urllib.parse import parse_qs, urlparse
+
+MAP_PATH_PATTERN = re.compile(r"^/all/([a-z]{2})/vector\.svg$")
+# Outline points of the synthetic maps, about the size of a detailed mapsicon map
+MAP_OUTLINE_POINTS = 4000
+
+
+def get_synthetic_elevation(lat: float, lon: float) -> float:
+    return round(1000 + 800 * math.sin(math.radians(lat) * 40) * math.cos(math.radians(lon) * 40), 1)
+
+
+def get_synthetic_map(country_code: str) -> str:
+    """
+    Potrace-like SVG as served by mapsicon: a black outline scaled by its
+    group transform, drawn with relative curves.
+    """
+    seed = int(hashlib.sha256(country_code.encode()).hexdigest()[:8], 16)
+    points = []
+    for index in range(MAP_OUTLINE_POINTS):
+        angle = 2 * math.pi * index / MAP_OUTLINE_POINTS
+        radius = 4000 + 600 * math.sin(angle * (3 + seed % 5)) + 150 * math.sin(angle * 47)
+        points.append((5120 + radius * math.cos(angle), 5120 + radius * math.sin(angle)))
+
+    commands = [f"M{points[0][0]:.0f} {points[0][1]:.0f}"]
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        dx, dy = x1 - x0, y1 - y0
+        commands.append(f"c{dx / 3:.0f} {dy / 3:.0f} {2 * dx / 3:.0f} {2 * dy / 3:.0f} {dx:.0f} {dy:.0f}")
+    commands.append("z")
+
+    return (
+        '<?xml version="1.0" standalone="no"?>\n'
+        '<svg version="1.0" xmlns="http://www.w3.org/2000/svg" width="1024.000000pt" '
+        'height="1024.000000pt" viewBox="0 0 1024.000000 1024.000000" '
+        'preserveAspectRatio="xMidYMid meet">\n'
+        '<g transform="translate(0.000000,1024.000000) scale(0.100000,-0.100000)" '
+        'fill="#000000" stroke="none">\n'
+        f'<path d="{" ".join(commands)}"/>\n'
+        "</g>\n</svg>\n"
+    )
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Serves the opentopodata API (`/v1/<dataset>?locations=lat,lon|...`) and
+    the mapsicon maps (`/all/<country_code>/vector.svg`), with ETags.
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        with self.server.request_count_lock:
+            self.server.request_count += 1
+
+        if url.path.startswith("/v1/"):
+            locations = parse_qs(url.query).get("locations", [""])[0]
+            results = []
+            for location in filter(None, locations.split("|")):
+                lat, lon = map(float, location.split(","))
+                results.append(
+                    {
+                        "elevation": get_synthetic_elevation(lat, lon),
+                        "location": {"lat": lat, "lng": lon},
+                    }
+                )
+            self._send(200, json.dumps({"results": results, "status": "OK"}).encode(), "application/json")
+            return
+
+        match = MAP_PATH_PATTERN.match(url.path)
+        if not match:
+            self._send(404, b"Not found", "text/plain")
+            return
+
+        svg = get_synthetic_map(match.group(1)).encode()
+        etag = f'"{hashlib.sha256(svg).hexdigest()[:16]}"'
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, b"", "image/svg+xml", etag)
+            return
+        self._send(200, svg, "image/svg+xml", etag)
+
+    def _send(self, status: int, body: bytes, content_type: str, etag: str | None = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer:
+    """Local HTTP server replacing opentopodata and mapsicon, run in a background thread."""
+
+    def __init__(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        self.server.request_count = 0
+        self.server.request_count_lock = threading.Lock()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def elevation_api_url(self) -> str:
+        return f"{self.url}/v1/aster30m"
+
+    @property
+    def maps_data_source(self) -> str:
+        return self.url + "/all/{country_code}/vector.svg"
+
+    @property
+    def request_count(self) -> int:
+        return self.server.request_count
+
+    def __enter__(self) -> "StandInServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+        return False
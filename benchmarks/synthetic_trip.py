@@ -0,0 +1,195 @@
+import argparse
+import io
+import json
+from pathlib import Path
+import random
+import shutil
+from typing import Any, Dict, List, Tuple
+from PIL import Image
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+COUNTRY_BOUNDING_BOXES_PATH = REPO_ROOT.joinpath("data/country_bounding_boxes.json")
+CONFIG_FILE_NAME = "synthetic_trip.json"
+# Exports written by another version of the generator are generated again
+GENERATOR_VERSION = 1
+TRIP_START_TIMESTAMP = 1_700_000_000
+STEP_INTERVAL_IN_SECONDS = 36 * 60 * 60
+WEATHER_CONDITIONS = ["clear-day", "cloudy", "partly-cloudy-day", "rain"]
+# Distinct images generated for each resolution, the photos of the trip being copies of them
+IMAGE_VARIANTS = 4
+EXIF_ORIENTATION_TAG = 0x0112
+# Country names as exported by Polarsteps, other countries being exported without a name
+COUNTRY_NAMES = {
+    "be": "Belgium",
+    "ch": "Switzerland",
+    "de": "Germany",
+    "es": "Spain",
+    "fr": "France",
+    "gb": "United Kingdom",
+    "gr": "Greece",
+    "it": "Italy",
+    "jp": "Japan",
+    "nl": "Netherlands",
+    "no": "Norway",
+    "pt": "Portugal",
+    "us": "United States",
+}
+LOREM_IPSUM = (
+    "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor "
+    "incididunt ut labore et dolore magna aliqua. Ut enim ad minim veniam, quis nostrud "
+    "exercitation ullamco laboris nisi ut aliquip ex ea commodo consequat. "
+)
+
+
+class SyntheticTripConfig:
+    def __init__(
+        self,
+        steps: int = 200,
+        photos_per_step: int = 5,
+        resolutions: List[Tuple[int, int]] | None = None,
+        countries: List[str] | None = None,
+        seed: int = 0,
+    ):
+        self.steps = steps
+        self.photos_per_step = photos_per_step
+        self.resolutions = resolutions or [(1600, 1200), (1200, 1600)]
+        self.countries = [country_code.lower() for country_code in countries or ["fr", "it", "es"]]
+        self.seed = seed
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "steps": self.steps,
+            "photos_per_step": self.photos_per_step,
+            "resolutions": [list(resolution) for resolution in self.resolutions],
+            "countries": self.countries,
+            "seed": self.seed,
+        }
+
+
+def parse_resolutions(resolutions: str) -> List[Tuple[int, int]]:
+    """Parses a comma separated list of WIDTHxHEIGHT resolutions."""
+    parsed: List[Tuple[int, int]] = []
+    for resolution in resolutions.split(","):
+        width, height = resolution.lower().split("x")
+        parsed.append((int(width), int(height)))
+    return parsed
+
+
+def generate_trip(config: SyntheticTripConfig, trip_path: Path, force: bool = False) -> Path:
+    """
+    Writes a Polarsteps-like export to trip_path: a trip.json with the steps
+    spread over the countries of the config, and a directory of JPEG photos
+    per step. An export generated with the same config is reused.
+    """
+    config_path = trip_path.joinpath(CONFIG_FILE_NAME)
+    if not force and config_path.exists():
+        with open(config_path, "r") as f:
+            if json.load(f) == config.to_dict() | {"version": GENERATOR_VERSION}:
+                return trip_path
+
+    shutil.rmtree(trip_path, ignore_errors=True)
+    trip_path.mkdir(parents=True)
+    rng = random.Random(config.seed)
+
+    with open(COUNTRY_BOUNDING_BOXES_PATH, "r") as f:
+        country_bounding_boxes = json.load(f)
+    unknown_countries = set(config.countries) - set(country_bounding_boxes)
+    if unknown_countries:
+        raise ValueError(f"Unknown country code(s): {', '.join(sorted(unknown_countries))}")
+
+    images = _generate_images(config, rng)
+    steps: List[Dict[str, Any]] = []
+
+    for index in range(config.steps):
+        country_code = config.countries[index % len(config.countries)]
+        bounding_box = country_bounding_boxes[country_code]
+        step = _generate_step(index, country_code, bounding_box, rng)
+        steps.append(step)
+
+        photos_path = trip_path.joinpath(f"{step['slug']}_{step['id']}", "photos")
+        photos_path.mkdir(parents=True)
+        for photo_index in range(config.photos_per_step):
+            image = images[rng.randrange(len(images))]
+            photos_path.joinpath(f"photo_{photo_index:03d}.jpg").write_bytes(image)
+
+    trip = {
+        "id": 1,
+        "name": "Synthetic trip",
+        "start_date": TRIP_START_TIMESTAMP,
+        "end_date": TRIP_START_TIMESTAMP + config.steps * STEP_INTERVAL_IN_SECONDS,
+        "all_steps": steps,
+    }
+    with open(trip_path.joinpath("trip.json"), "w") as f:
+        json.dump(trip, f)
+
+    with open(config_path, "w") as f:
+        json.dump(config.to_dict() | {"version": GENERATOR_VERSION}, f)
+
+    return trip_path
+
+
+def _generate_step(
+    index: int, country_code: str, bounding_box: Dict[str, Dict[str, float]], rng: random.Random
+) -> Dict[str, Any]:
+    sw, ne = bounding_box["sw"], bounding_box["ne"]
+    step_id = 100_000 + index
+    return {
+        "id": step_id,
+        "slug": f"step-{index}",
+        "display_name": f"Step {index}",
+        "description": LOREM_IPSUM * rng.randint(0, 8),
+        "start_time": TRIP_START_TIMESTAMP + index * STEP_INTERVAL_IN_SECONDS,
+        "weather_condition": rng.choice(WEATHER_CONDITIONS),
+        "weather_temperature": round(rng.uniform(-10, 35), 1),
+        "location": {
+            "detail": COUNTRY_NAMES.get(country_code, ""),
+            "country_code": country_code.upper(),
+            "lat": rng.uniform(sw["lat"], ne["lat"]),
+            "lon": rng.uniform(sw["lon"], ne["lon"]),
+        },
+    }
+
+
+def _generate_images(config: SyntheticTripConfig, rng: random.Random) -> List[bytes]:
+    """
+    JPEG files of noise, so they compress and decode like photos. Some are
+    rotated by their EXIF orientation, like portrait photos of a phone.
+    """
+    images: List[bytes] = []
+    for width, height in config.resolutions:
+        for variant in range(IMAGE_VARIANTS):
+            image = Image.merge(
+                "RGB", [Image.effect_noise((width, height), rng.randint(32, 96)) for _ in range(3)]
+            )
+            exif = Image.Exif()
+            if variant % 2:
+                exif[EXIF_ORIENTATION_TAG] = 6
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=85, exif=exif)
+            images.append(buffer.getvalue())
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Polarsteps export.")
+    parser.add_argument("output_directory", type=Path)
+    parser.add_argument("--steps", default=200, type=int)
+    parser.add_argument("--photos_per_step", default=5, type=int)
+    parser.add_argument("--resolutions", default="1600x1200,1200x1600", type=str)
+    parser.add_argument("--countries", default="fr,it,es", type=str)
+    parser.add_argument("--seed", default=0, type=int)
+    args = parser.parse_args()
+
+    config = SyntheticTripConfig(
+        steps=args.steps,
+        photos_per_step=args.photos_per_step,
+        resolutions=parse_resolutions(args.resolutions),
+        countries=args.countries.split(","),
+        seed=args.seed,
+    )
+    generate_trip(config, args.output_directory, force=True)
+    print(f"✅ Synthetic trip written to '{args.output_directory}'")
+
+
+if __name__ == "__main__":
+    main()
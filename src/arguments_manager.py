@@ -1,25 +1,64 @@
 import argparse
-from typing import Set
+from pathlib import Path
+from typing import List, Set
+
+from build_config import BuildConfig, parse_step_ranges
+
+# Options of a build left to their default values
+DEFAULT_CONFIG = BuildConfig()
 
 
 class ArgumentManager():
-    _instance = None
-    debug = False
-    no_pdf = False
-    step_indices: Set[int] | None = None
-    paper_format: str | None = None
+    """
+    Command line adapter: parses the arguments of the script into the config
+    of a build, plus the options of the script itself (watch and batch modes).
+    """
 
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(ArgumentManager, cls).__new__(cls)
-            cls._instance._initialize()
-        return cls._instance
+    # Set from the parsed arguments, whose defaults are those of BuildConfig
+    debug: bool
+    trip_directory: str
+    output_directory: str
+    no_pdf: bool
+    step_indices: Set[int] | None = None
+    paper_format: str
+    locale: str
+    workers: int
+    incremental_sync: bool
+    no_derivatives: bool
+    dpi: int
+    pdf_workers: int
+    pdf_shards: int | None
+    pdf_shard_memory_mb: int | None
+    incremental_pdf: bool
+    watch: bool
+    elevation_cache_tolerance_m: float
+    elevation_dem_directory: str | None
+    simplify_maps: bool
+    inline_maps: bool
+    offline: bool
+    flags_directory: str | None
+    profile: bool
+    batch: str | None
+    batch_workers: int
+    max_browsers: int
 
-    def _initialize(self):
+    def __init__(self, argv: List[str] | None = None):
         self.parser = argparse.ArgumentParser()
         self.parser.add_argument(
             "--debug", action="store_true", help="Enable DEBUG mode"
         )
+        self.parser.add_argument(
+            "--trip_directory",
+            default=str(DEFAULT_CONFIG.data_path),
+            type=str,
+            help="Directory of the Polarsteps export of the trip.",
+        )
+        self.parser.add_argument(
+            "--output_directory",
+            default=str(DEFAULT_CONFIG.output_path),
+            type=str,
+            help="Directory the travel book is written to.",
+        )
         self.parser.add_argument(
             "--step_ranges",
             default=None,
@@ -33,33 +72,154 @@ class ArgumentManager():
         )
         self.parser.add_argument(
             "--paper_format",
-            default="A4",
+            default=DEFAULT_CONFIG.paper_format,
             type=str,
             help="Specify paper format for the PDF. See https://playwright.dev/python/docs/api/class-page#page-pdf",
         )
-        self.args = self.parser.parse_args()
+        self.parser.add_argument(
+            "--locale",
+            default=DEFAULT_CONFIG.locale,
+            type=str,
+            help="Locale of the month names printed on the steps, e.g. fr_FR.UTF-8 or en_US.UTF-8.",
+        )
+        self.parser.add_argument(
+            "--workers",
+            default=DEFAULT_CONFIG.workers,
+            type=int,
+            help="Number of workers used to copy and probe photos. Use 1 to process photos one at a time.",
+        )
+        self.parser.add_argument(
+            "--incremental_sync",
+            action="store_true",
+            help="Only copy new or changed photos and assets, and remove photos that are no longer part of the travel book.",
+        )
+        self.parser.add_argument(
+            "--dpi",
+            default=DEFAULT_CONFIG.dpi,
+            type=int,
+            help="Print resolution used to resize photos to the size they are displayed at.",
+        )
+        self.parser.add_argument(
+            "--no-derivatives",
+            action="store_true",
+            help="Don't resize photos for print, use the original files in the travel book.",
+        )
+        self.parser.add_argument(
+            "--pdf_workers",
+            default=DEFAULT_CONFIG.pdf_workers,
+            type=int,
+            help="Number of Chromium processes printing the PDF in parallel.",
+        )
+        self.parser.add_argument(
+            "--pdf_shards",
+            default=DEFAULT_CONFIG.pdf_shards,
+            type=int,
+            help="Number of parts the book is split into (at step boundaries) to be printed. Defaults to the number of PDF workers.",
+        )
+        self.parser.add_argument(
+            "--pdf_shard_memory_mb",
+            default=DEFAULT_CONFIG.pdf_shard_memory_mb,
+            type=int,
+            help="Memory limit in MB of each Chromium process printing a part of the book.",
+        )
+        self.parser.add_argument(
+            "--incremental_pdf",
+            action="store_true",
+            help="Print each step to a cached PDF and only print again the steps that changed.",
+        )
+        self.parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Keep running and update the travel book when the trip, the photos layout or the templates change.",
+        )
+        self.parser.add_argument(
+            "--elevation_cache_tolerance_m",
+            default=DEFAULT_CONFIG.elevation_cache_tolerance_m,
+            type=float,
+            help="Distance in meters under which a cached elevation is reused for a step. Use 0 to only reuse exact coordinates.",
+        )
+        self.parser.add_argument(
+            "--elevation_dem_directory",
+            default=None,
+            type=str,
+            help="Directory of SRTM .hgt tiles to read elevations from, instead of the opentopodata API.",
+        )
+        self.parser.add_argument(
+            "--simplify_maps",
+            action="store_true",
+            help="Round the coordinates of the country maps to the print resolution and drop the details smaller than a printed pixel.",
+        )
+        self.parser.add_argument(
+            "--inline_maps",
+            action="store_true",
+            help="Embed each country map once in the HTML and reference it from the steps, instead of loading the SVG file for every step.",
+        )
+        self.parser.add_argument(
+            "--offline",
+            action="store_true",
+            help="Load the flags and fonts from local files reduced to what the trip uses, instead of CDNs.",
+        )
+        self.parser.add_argument(
+            "--flags_directory",
+            default=None,
+            type=str,
+            help="Local copy of flag-icons (or its flags/4x3 directory) the --offline flags are read from, instead of downloading them.",
+        )
+        self.parser.add_argument(
+            "--profile",
+            action="store_true",
+            help="Record the time, CPU, memory and I/O of each stage and hot loop of the build to a Chrome trace file.",
+        )
+        self.parser.add_argument(
+            "--batch",
+            default=None,
+            type=str,
+            help="File listing the trips to build, one per line: the export directory and the output directory.",
+        )
+        self.parser.add_argument(
+            "--batch_workers",
+            default=1,
+            type=int,
+            help="Number of trips of the batch built in parallel, each by its own process.",
+        )
+        self.parser.add_argument(
+            "--max_browsers",
+            default=1,
+            type=int,
+            help="Maximum number of Chromium instances printing the PDFs of the batch at the same time, counting the --pdf_workers of each trip.",
+        )
+        self.args = self.parser.parse_args(argv)
         self.__dict__.update(vars(self.args))
 
         if self.args.step_ranges:
-            self.step_indices = self.parse_step_ranges(self.args.step_ranges)
+            self.step_indices = parse_step_ranges(self.args.step_ranges)
 
-    def parse_step_ranges(self, step_ranges: str) -> Set[int]:
-        """Parses step ranges string and returns a set of indices."""
-        ranges: Set[int] = set()
-        
-        # Split the ranges by comma (if multiple ranges are provided)
-        parts = step_ranges.split(',')
-        
-        for part in parts:
-            if '-' in part:
-                # Handle range like 1-20
-                start, end = map(int, part.split('-'))
-                ranges.update(range(start, end + 1))
-            else:
-                # Handle single step like '5'
-                ranges.add(int(part))
-        
-        return ranges
+    def get_build_config(self) -> BuildConfig:
+        return BuildConfig(
+            data_path=Path(self.trip_directory),
+            output_path=Path(self.output_directory),
+            step_indices=self.step_indices,
+            paper_format=self.paper_format,
+            locale=self.locale,
+            no_pdf=self.no_pdf,
+            workers=self.workers,
+            incremental_sync=self.incremental_sync,
+            no_derivatives=self.no_derivatives,
+            dpi=self.dpi,
+            pdf_workers=self.pdf_workers,
+            pdf_shards=self.pdf_shards,
+            pdf_shard_memory_mb=self.pdf_shard_memory_mb,
+            incremental_pdf=self.incremental_pdf,
+            elevation_cache_tolerance_m=self.elevation_cache_tolerance_m,
+            elevation_dem_directory=(
+                Path(self.elevation_dem_directory) if self.elevation_dem_directory else None
+            ),
+            simplify_maps=self.simplify_maps,
+            inline_maps=self.inline_maps,
+            offline=self.offline,
+            flags_directory=Path(self.flags_directory) if self.flags_directory else None,
+            profile=self.profile,
+        )
 
     def get_args(self):
         return self.args
@@ -0,0 +1,210 @@
+import hashlib
+import html
+import os
+from pathlib import Path
+import re
+import shutil
+import string
+import threading
+from typing import List, Set
+from fontTools import subset
+import requests
+
+from models.trip import Trip
+
+FLAGS_SOURCE = "https://cdn.jsdelivr.net/gh/lipis/flag-icons@7.2.3/flags/4x3/{country_code}.svg"
+BUNDLE_DIRECTORY = "assets/bundle"
+FLAGS_CSS_FILE_NAME = "flags.css"
+FONTS_CSS_FILE_NAME = "fonts.css"
+# Rules of flag-icons.css shared by all the flags
+FLAGS_BASE_CSS = """.fi {
+  background-size: contain;
+  background-position: 50%;
+  background-repeat: no-repeat;
+  position: relative;
+  display: inline-block;
+  width: 1.333333em;
+  line-height: 1em;
+}
+
+.fi:before {
+  content: " ";
+}
+"""
+FONT_FACE_URL_PATTERN = re.compile(r"""url\(["']?([^"')]+\.woff2)["']?\)""")
+HTML_TAG_PATTERN = re.compile(r"<[^>]*>")
+# Local copy of the font loaded from Google Fonts by the stylesheet
+NOTO_SERIF_FONT_FACE = """
+@font-face {
+  font-family: "Noto Serif";
+  src: url("NotoSerif.woff2") format("woff2");
+  font-display: swap;
+}
+"""
+
+
+def get_flags_directory(flags_directory: Path) -> Path:
+    """Directory of the 4x3 flags, in a flag-icons repository or package, or given directly."""
+    for flags_path in (flags_directory.joinpath("flags", "4x3"), flags_directory.joinpath("4x3")):
+        if flags_path.is_dir():
+            return flags_path
+    return flags_directory
+
+
+class AssetBundler:
+    """
+    Writes the stylesheets and files the travel book loads from CDNs, reduced
+    to what the trip uses, so the book renders without network access: the
+    flags of the countries of the trip, and the local fonts subset to the
+    characters of the book.
+
+    Flags are read from flags_directory, a local copy of flag-icons, when
+    given, so bundling needs no network access. Otherwise they are downloaded
+    once into the cache.
+    """
+
+    def __init__(
+        self,
+        cache_path: Path,
+        flags_source: str = FLAGS_SOURCE,
+        flags_directory: Path | None = None,
+    ):
+        self.cache_path = cache_path
+        self.flags_source = flags_source
+        self.flags_directory = get_flags_directory(flags_directory) if flags_directory else None
+        self.session = requests.Session()
+
+    def bundle(self, trip: Trip, html_file_path: Path, fonts_path: Path):
+        bundle_path = html_file_path.parent.joinpath(BUNDLE_DIRECTORY)
+        bundle_path.mkdir(parents=True, exist_ok=True)
+
+        used_files = {FLAGS_CSS_FILE_NAME, FONTS_CSS_FILE_NAME}
+        used_files.update(self._bundle_flags(trip, bundle_path))
+
+        with open(html_file_path, "r") as f:
+            characters = self._get_characters(f.read())
+        used_files.update(self._bundle_fonts(fonts_path, characters, bundle_path))
+
+        for filename in os.listdir(bundle_path):
+            if filename not in used_files:
+                bundle_path.joinpath(filename).unlink()
+
+    def _bundle_flags(self, trip: Trip, bundle_path: Path) -> List[str]:
+        """Writes flags.css with the flags of the countries of the trip only."""
+        flags_cache_path = self.cache_path.joinpath("flags")
+        flags_cache_path.mkdir(parents=True, exist_ok=True)
+
+        css_rules = [FLAGS_BASE_CSS]
+        flag_files: List[str] = []
+
+        country_codes = {step.country_code.lower() for step in trip.steps} - {"00"}
+        for country_code in sorted(country_codes):
+            flag_path = self._get_flag(country_code, flags_cache_path)
+            if not flag_path:
+                continue
+
+            flag_file = f"flag-{country_code}.svg"
+            shutil.copy2(flag_path, bundle_path.joinpath(flag_file))
+            flag_files.append(flag_file)
+            css_rules.append(f".fi-{country_code} {{\n  background-image: url({flag_file});\n}}\n")
+
+        self._write(bundle_path.joinpath(FLAGS_CSS_FILE_NAME), "\n".join(css_rules))
+        return flag_files
+
+    def _get_flag(self, country_code: str, flags_cache_path: Path) -> Path | None:
+        if self.flags_directory:
+            flag_path = self.flags_directory.joinpath(f"{country_code}.svg")
+            if not flag_path.exists():
+                print(f"ℹ️ No flag of country '{country_code}' in '{self.flags_directory}'")
+                return None
+            return flag_path
+
+        flag_path = flags_cache_path.joinpath(f"{country_code}.svg")
+        # Flags of a released version of flag-icons never change
+        if not flag_path.exists() and not self._download_flag(country_code, flag_path):
+            print(
+                f"ℹ️ Failed to download the flag of country '{country_code}'. Use --flags_directory to read the flags from a local copy of flag-icons."
+            )
+            return None
+        return flag_path
+
+    def _download_flag(self, country_code: str, flag_path: Path) -> bool:
+        try:
+            response = self.session.get(
+                self.flags_source.format(country_code=country_code), timeout=30
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException:
+            return False
+
+        tmp_path = flag_path.with_name(f"{flag_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(response.content)
+        os.replace(tmp_path, flag_path)
+        return True
+
+    def _get_characters(self, book_html: str) -> str:
+        """
+        Characters the fonts must contain: those of the text of the book, in
+        both cases as some text is uppercased by the stylesheet, and ASCII.
+        """
+        text = html.unescape(HTML_TAG_PATTERN.sub(" ", book_html))
+        characters: Set[str] = set(string.printable)
+        for character in set(text):
+            characters.update(character, character.upper(), character.lower())
+        return "".join(sorted(characters))
+
+    def _bundle_fonts(self, fonts_path: Path, characters: str, bundle_path: Path) -> List[str]:
+        """
+        Writes fonts.css with the fonts of fonts_path subset to the characters.
+        Subset fonts are named after a hash of the font and of the characters.
+        """
+        with open(fonts_path.joinpath(FONTS_CSS_FILE_NAME), "r") as f:
+            fonts_css = f.read() + NOTO_SERIF_FONT_FACE
+
+        fonts_cache_path = self.cache_path.joinpath("fonts")
+        fonts_cache_path.mkdir(parents=True, exist_ok=True)
+        font_files: List[str] = []
+
+        def subset_font(match: re.Match) -> str:
+            font_path = fonts_path.joinpath(match.group(1))
+            digest = hashlib.sha256(font_path.read_bytes())
+            digest.update(characters.encode())
+            font_file = f"{font_path.stem}.{digest.hexdigest()[:16]}.woff2"
+
+            subset_path = fonts_cache_path.joinpath(font_file)
+            if not subset_path.exists():
+                self._subset_font(font_path, characters, subset_path)
+
+            if font_file not in font_files:
+                shutil.copy2(subset_path, bundle_path.joinpath(font_file))
+                font_files.append(font_file)
+            return f'url("{font_file}")'
+
+        self._write(
+            bundle_path.joinpath(FONTS_CSS_FILE_NAME),
+            FONT_FACE_URL_PATTERN.sub(subset_font, fonts_css),
+        )
+        return font_files
+
+    def _subset_font(self, font_path: Path, characters: str, subset_path: Path):
+        options = subset.Options()
+        options.flavor = "woff2"
+        options.layout_features = ["*"]
+        # FontForge timestamps, which fontTools cannot subset
+        options.drop_tables += ["FFTM"]
+
+        font = subset.load_font(str(font_path), options)
+        subsetter = subset.Subsetter(options)
+        subsetter.populate(text=characters)
+        subsetter.subset(font)
+
+        tmp_path = subset_path.with_name(f"{subset_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        subset.save_font(font, str(tmp_path), options)
+        os.replace(tmp_path, subset_path)
+
+    def _write(self, file_path: Path, content: str):
+        # Keep the file untouched when unchanged, as the PDF cache depends on its mtime
+        if file_path.exists() and file_path.read_text() == content:
+            return
+        file_path.write_text(content)
@@ -0,0 +1,239 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+from multiprocessing.synchronize import Lock, Semaphore
+from multiprocessing.util import Finalize
+from pathlib import Path
+import shlex
+import traceback
+from typing import List
+from playwright.sync_api import Browser, Playwright, sync_playwright
+
+from build_config import BuildConfig
+from constants import CACHE_PATH
+from elevation_providers import ElevationProvider, LocalDEMProvider, OpenTopoDataProvider
+from html_generator import HTMLGenerator
+from map_manager import MapManager
+from pdf_generator import launch_browser
+from profiler import Profiler
+from travel_book_builder import TravelBookBuilder
+
+
+class BatchTrip:
+    def __init__(self, data_path: Path, output_path: Path):
+        self.data_path = data_path
+        self.output_path = output_path
+
+
+def read_batch_file(batch_file_path: Path) -> List[BatchTrip]:
+    """
+    Reads a batch file: one line per trip with its export directory and its
+    output directory, quoted if they contain spaces. Empty lines and lines
+    starting with # are ignored. Relative paths are relative to the file.
+    """
+    trips: List[BatchTrip] = []
+    with open(batch_file_path, "r") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+
+            paths = shlex.split(line)
+            if len(paths) != 2:
+                raise ValueError(
+                    f"Line {line_number} of '{batch_file_path}' should contain an export directory and an output directory"
+                )
+            data_path, output_path = (
+                batch_file_path.parent.joinpath(path).resolve() for path in paths
+            )
+            trips.append(BatchTrip(data_path, output_path))
+
+    return trips
+
+
+class BrowserSlots:
+    """
+    Takes `count` slots of the semaphore of the batch browsers, for a trip
+    printing its PDF with several Chromium processes. Slots are taken under a
+    lock, so two trips never wait for each other holding part of theirs.
+    """
+
+    def __init__(self, semaphore: Semaphore, lock: Lock, count: int):
+        self.semaphore = semaphore
+        self.lock = lock
+        self.count = count
+
+    def __enter__(self):
+        with self.lock:
+            for _ in range(self.count):
+                self.semaphore.acquire()
+
+    def __exit__(self, *exc_info):
+        for _ in range(self.count):
+            self.semaphore.release()
+        return False
+
+
+class BatchWorker:
+    """
+    Resources of a worker process of a batch, shared by the trips it builds:
+    the country bounding boxes and the geodesic of the map manager, the
+    compiled templates, the elevation provider with its share of the API rate
+    limits, and a browser when each worker can keep one open. The shared
+    resources record to the profiler of the worker, whose trace is started
+    again for each trip.
+    """
+
+    def __init__(
+        self,
+        config: BuildConfig,
+        cache_path: Path,
+        browser_slots: BrowserSlots,
+        processes: int,
+        keep_browser: bool,
+    ):
+        self.config = config
+        self.cache_path = cache_path
+        # A worker keeping its browser open does not need to wait for a slot
+        self.browser_slots = None if keep_browser else browser_slots
+        self.keep_browser = keep_browser and not config.no_pdf
+        self.profiler = Profiler(enabled=config.profile)
+        self.map_manager = MapManager(
+            cache_path=cache_path,
+            simplify_dpi=config.dpi if config.simplify_maps else None,
+            profiler=self.profiler,
+        )
+        self.templates_env = HTMLGenerator.create_environment()
+        self.elevation_provider: ElevationProvider = (
+            LocalDEMProvider(config.elevation_dem_directory, profiler=self.profiler)
+            if config.elevation_dem_directory
+            else OpenTopoDataProvider(processes=processes, profiler=self.profiler)
+        )
+        self._playwright: Playwright | None = None
+        self._browser: Browser | None = None
+
+    def build(self, trip: BatchTrip):
+        # Trips are built one at a time by a worker, each with its own trace
+        self.profiler.reset()
+        # The browser is launched by the main thread of the worker process, which
+        # runs the inline pdf stage of the build
+        builder = TravelBookBuilder(
+            self.config.with_paths(trip.data_path, trip.output_path),
+            shared_cache_path=self.cache_path,
+            map_manager=self.map_manager,
+            templates_env=self.templates_env,
+            elevation_provider=self.elevation_provider,
+            browser=self._get_browser(),
+            browser_slots=self.browser_slots,
+            profiler=self.profiler,
+        )
+        try:
+            builder.build()
+        finally:
+            builder.close()
+
+    def _get_browser(self) -> Browser | None:
+        if not self.keep_browser:
+            return None
+        if self._browser is None:
+            self._playwright = sync_playwright().start()
+            self._browser = launch_browser(self._playwright, self.config.pdf_shard_memory_mb)
+        return self._browser
+
+    def stop(self):
+        if self._browser:
+            self._browser.close()
+            self._browser = None
+        if self._playwright:
+            self._playwright.stop()
+            self._playwright = None
+
+
+# Resources of the current worker process, set by the pool initializer
+_worker: BatchWorker | None = None
+
+
+def _init_worker(
+    config: BuildConfig,
+    cache_path: Path,
+    browser_semaphore: Semaphore,
+    browser_lock: Lock,
+    processes: int,
+    keep_browser: bool,
+):
+    global _worker
+    # Each printing trip starts pdf_workers Chromium processes
+    browser_slots = BrowserSlots(browser_semaphore, browser_lock, config.pdf_workers)
+    _worker = BatchWorker(config, cache_path, browser_slots, processes, keep_browser)
+    # Pool workers exit without running atexit handlers, but run finalizers
+    Finalize(None, _worker.stop, exitpriority=10)
+
+
+def _build_trip(trip: BatchTrip):
+    _worker.build(trip)
+
+
+class BatchBuilder:
+    """
+    Builds the travel books of several trips in a pool of processes. Each
+    process loads the read-only resources once for all the trips it builds,
+    the caches of maps and elevations are shared by all the trips, and at most
+    max_browsers Chromium instances print PDFs at the same time, a trip
+    printing with pdf_workers of them. Every trip is built with the options of
+    config, and its own paths.
+    """
+
+    def __init__(
+        self,
+        config: BuildConfig,
+        trips: List[BatchTrip],
+        workers: int = 1,
+        max_browsers: int = 1,
+        cache_path: Path = CACHE_PATH,
+    ):
+        self.trips = trips
+        self.workers = max(1, min(workers, len(trips)))
+        self.max_browsers = max(1, max_browsers)
+        self.cache_path = cache_path
+
+        self.config = config
+        if config.pdf_workers > self.max_browsers:
+            print(
+                f"ℹ️ Printing each PDF with {self.max_browsers} Chromium processes instead of {config.pdf_workers}, the batch allowing {self.max_browsers} browsers"
+            )
+            self.config = BuildConfig(**(vars(config) | {"pdf_workers": self.max_browsers}))
+
+    def build(self) -> List[BatchTrip]:
+        """Builds all the trips and returns those that failed."""
+        context = multiprocessing.get_context()
+        browser_semaphore = context.Semaphore(self.max_browsers)
+        browser_lock = context.Lock()
+        # Workers keep their browser open when there are enough browsers for all of
+        # them. A kept browser only prints the PDFs printed without other processes.
+        keep_browser = self.config.pdf_workers == 1 and self.workers <= self.max_browsers
+        failed_trips: List[BatchTrip] = []
+
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(
+                self.config,
+                self.cache_path,
+                browser_semaphore,
+                browser_lock,
+                self.workers,
+                keep_browser,
+            ),
+        ) as executor:
+            futures = {executor.submit(_build_trip, trip): trip for trip in self.trips}
+
+            for future in as_completed(futures):
+                trip = futures[future]
+                try:
+                    future.result()
+                    print(f"✅ Travel book of '{trip.data_path}' written to '{trip.output_path}'")
+                except Exception:
+                    traceback.print_exc()
+                    print(f"❌ Failed to build the travel book of '{trip.data_path}'")
+                    failed_trips.append(trip)
+
+        return failed_trips
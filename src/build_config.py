@@ -0,0 +1,98 @@
+import os
+from pathlib import Path
+from typing import Set
+
+from constants import OUTPUT_PATH, TRIP_DATA_PATH
+from translations import MONTHS
+
+DEFAULT_LOCALE = "fr_FR.UTF-8"
+
+
+def parse_step_ranges(step_ranges: str) -> Set[int]:
+    """Parses step ranges string and returns a set of indices."""
+    ranges: Set[int] = set()
+
+    # Split the ranges by comma (if multiple ranges are provided)
+    parts = step_ranges.split(',')
+
+    for part in parts:
+        if '-' in part:
+            # Handle range like 1-20
+            start, end = map(int, part.split('-'))
+            ranges.update(range(start, end + 1))
+        else:
+            # Handle single step like '5'
+            ranges.add(int(part))
+
+    return ranges
+
+
+class BuildConfig:
+    """
+    Options of the build of one travel book. Each build reads its own config,
+    so builds with different options may run at the same time in one process.
+    The locale only selects the language of the month names: the process
+    locale is left untouched.
+    """
+
+    def __init__(
+        self,
+        data_path: Path = TRIP_DATA_PATH,
+        output_path: Path = OUTPUT_PATH,
+        step_indices: Set[int] | None = None,
+        paper_format: str = "A4",
+        locale: str = DEFAULT_LOCALE,
+        no_pdf: bool = False,
+        workers: int = os.cpu_count() or 1,
+        incremental_sync: bool = False,
+        no_derivatives: bool = False,
+        dpi: int = 300,
+        pdf_workers: int = 1,
+        pdf_shards: int | None = None,
+        pdf_shard_memory_mb: int | None = None,
+        incremental_pdf: bool = False,
+        elevation_cache_tolerance_m: float = 15,
+        elevation_dem_directory: Path | None = None,
+        simplify_maps: bool = False,
+        inline_maps: bool = False,
+        offline: bool = False,
+        flags_directory: Path | None = None,
+        profile: bool = False,
+    ):
+        self.data_path = Path(data_path)
+        self.output_path = Path(output_path)
+        self.step_indices = step_indices
+        self.paper_format = paper_format
+        self.locale = locale
+        self.no_pdf = no_pdf
+        self.workers = workers
+        self.incremental_sync = incremental_sync
+        self.no_derivatives = no_derivatives
+        self.dpi = dpi
+        self.pdf_workers = pdf_workers
+        self.pdf_shards = pdf_shards
+        self.pdf_shard_memory_mb = pdf_shard_memory_mb
+        self.incremental_pdf = incremental_pdf
+        self.elevation_cache_tolerance_m = elevation_cache_tolerance_m
+        self.elevation_dem_directory = (
+            Path(elevation_dem_directory) if elevation_dem_directory else None
+        )
+        self.simplify_maps = simplify_maps
+        self.inline_maps = inline_maps
+        self.offline = offline
+        self.flags_directory = Path(flags_directory) if flags_directory else None
+        self.profile = profile
+
+        if self.language not in MONTHS:
+            raise ValueError(
+                f"Unsupported locale '{locale}', supported languages: {', '.join(sorted(MONTHS))}"
+            )
+
+    @property
+    def language(self) -> str:
+        """Language of the locale, e.g. "fr" for "fr_FR.UTF-8"."""
+        return self.locale.split(".")[0].split("_")[0].lower()
+
+    def with_paths(self, data_path: Path, output_path: Path) -> "BuildConfig":
+        """Copy of the config building another trip with the same options."""
+        return BuildConfig(**(vars(self) | {"data_path": data_path, "output_path": output_path}))
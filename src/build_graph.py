@@ -0,0 +1,232 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import hashlib
+import json
+import os
+from pathlib import Path
+import threading
+from typing import Any, Callable, Dict, Iterable, List
+
+from file_sync import hash_file
+from profiler import Profiler
+
+BUILD_GRAPH_FILE_NAME = "build_graph.json"
+# Stored states of another version are dropped, to change the format of stage results
+BUILD_GRAPH_VERSION = 2
+
+
+class Stage:
+    """
+    Step of the build. Its fingerprint is a hash of the content of its input
+    files, of its parameters and of the fingerprints of the stages it depends
+    on.
+
+    `run` does the work and returns a JSON serializable result. When a
+    cacheable stage is skipped, `apply` replays the result stored by its last
+    run on the in-memory state. Results for which `is_complete` returns False
+    (a failed download for instance) are not stored, so the stage runs again.
+    Stages using objects bound to a thread, like a Playwright browser, run
+    `inline` in the thread running the graph instead of a worker thread.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        run: Callable[[], Any],
+        dependencies: Iterable[str] = (),
+        inputs: Callable[[], Iterable[Path]] = lambda: [],
+        params: Callable[[], Any] = lambda: None,
+        outputs: Callable[[], Iterable[Path]] = lambda: [],
+        apply: Callable[[Any], None] | None = None,
+        is_complete: Callable[[Any], bool] = lambda result: True,
+        cacheable: bool = True,
+        inline: bool = False,
+    ):
+        self.name = name
+        self.run = run
+        self.dependencies = list(dependencies)
+        self.inputs = inputs
+        self.params = params
+        self.outputs = outputs
+        self.apply = apply
+        self.is_complete = is_complete
+        self.cacheable = cacheable
+        self.inline = inline
+
+
+class BuildGraph:
+    """
+    Runs stages once their dependencies are done, independent stages running
+    concurrently. A stage is skipped when its fingerprint matches the one of
+    its last run and its outputs exist. Fingerprints and results are stored in
+    a file, so unchanged stages are skipped across builds.
+    """
+
+    def __init__(self, cache_path: Path, workers: int = 4, profiler: Profiler | None = None):
+        self.state_path = cache_path.joinpath(BUILD_GRAPH_FILE_NAME)
+        self.workers = max(1, workers)
+        self.profiler = profiler or Profiler()
+        self.state: Dict[str, Dict[str, Any]] = self._load_state()
+        # Last run of the stages whose effects are in memory in this process
+        self.in_memory: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def run(self, stages: List[Stage]):
+        stages_by_name = {stage.name: stage for stage in stages}
+        fingerprints: Dict[str, str] = {}
+        pending = list(stages)
+        running: Dict[Future, Stage] = {}
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                while pending or running:
+                    ready = [
+                        stage
+                        for stage in pending
+                        if all(
+                            dependency in fingerprints or dependency not in stages_by_name
+                            for dependency in stage.dependencies
+                        )
+                    ]
+                    for stage in ready:
+                        pending.remove(stage)
+                        if stage.inline:
+                            fingerprints[stage.name] = self._run_profiled_stage(
+                                stage, dict(fingerprints)
+                            )
+                            continue
+                        future = executor.submit(
+                            self._run_profiled_stage, stage, dict(fingerprints)
+                        )
+                        running[future] = stage
+
+                    if not running:
+                        # Inline stages may have made other stages ready
+                        if ready:
+                            continue
+                        raise ValueError(
+                            f"Stages with unknown or cyclic dependencies: {[stage.name for stage in pending]}"
+                        )
+
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        stage = running.pop(future)
+                        # Raises the error of a failed stage
+                        fingerprints[stage.name] = future.result()
+        finally:
+            self._save_state()
+
+    def _run_profiled_stage(self, stage: Stage, fingerprints: Dict[str, str]) -> str:
+        with self.profiler.span(stage.name, category="stage") as span:
+            result_fingerprint, ran = self._run_stage(stage, fingerprints)
+            span.add(skipped=int(not ran))
+        return result_fingerprint
+
+    def _run_stage(self, stage: Stage, fingerprints: Dict[str, str]) -> tuple[str, bool]:
+        """
+        Runs or skips a stage. Returns the fingerprint of its result, which
+        dependent stages are fingerprinted with, and whether the stage ran.
+        """
+        fingerprint = self._get_fingerprint(stage, fingerprints)
+        outputs_exist = all(os.path.exists(path) for path in stage.outputs())
+
+        with self._lock:
+            in_memory = self.in_memory.get(stage.name)
+            stored = self.state["stages"].get(stage.name)
+
+        if outputs_exist and in_memory and in_memory["fingerprint"] == fingerprint:
+            return in_memory["result_fingerprint"], False
+
+        if outputs_exist and stage.cacheable and stored and stored["fingerprint"] == fingerprint:
+            # A single write, so messages of concurrent stages are not mixed up
+            print(f"ℹ️ Skipping '{stage.name}': its inputs did not change.\n", end="")
+            if stage.apply:
+                stage.apply(stored["result"])
+            with self._lock:
+                self.in_memory[stage.name] = stored
+            return stored["result_fingerprint"], False
+
+        result = stage.run()
+        # Stages may write their own inputs (like the photos layout file)
+        fingerprint = self._get_fingerprint(stage, fingerprints)
+        entry = {
+            "fingerprint": fingerprint,
+            "result_fingerprint": hashlib.sha256(
+                (fingerprint + json.dumps(result, sort_keys=True, default=str)).encode()
+            ).hexdigest(),
+            "result": result,
+        }
+
+        with self._lock:
+            self.in_memory[stage.name] = entry
+            if stage.cacheable and stage.is_complete(result):
+                self.state["stages"][stage.name] = entry
+            else:
+                self.state["stages"].pop(stage.name, None)
+
+        return entry["result_fingerprint"], True
+
+    def _get_fingerprint(self, stage: Stage, fingerprints: Dict[str, str]) -> str:
+        digest = hashlib.sha256(stage.name.encode())
+        digest.update(json.dumps(stage.params(), sort_keys=True, default=str).encode())
+        for dependency in sorted(stage.dependencies):
+            digest.update(f"{dependency}={fingerprints.get(dependency)}".encode())
+        for path in stage.inputs():
+            digest.update(self._get_path_hash(Path(path)).encode())
+        return digest.hexdigest()
+
+    def _get_path_hash(self, path: Path) -> str:
+        """Hash of the content of a file, or of all the files of a directory."""
+        if path.is_dir():
+            digest = hashlib.sha256(str(path).encode())
+            for directory, directory_names, filenames in os.walk(path):
+                directory_names.sort()
+                for filename in sorted(filenames):
+                    file_path = Path(directory, filename)
+                    digest.update(f"{file_path}={self._get_file_hash(file_path)}".encode())
+            return digest.hexdigest()
+
+        return f"{path}={self._get_file_hash(path)}"
+
+    def _get_file_hash(self, path: Path) -> str:
+        """Content hash of a file, only computed again when its size or mtime changed."""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return "missing"
+
+        key = str(path)
+        with self._lock:
+            entry = self.state["files"].get(key)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["hash"]
+
+        content_hash = hash_file(path)
+        with self._lock:
+            self.state["files"][key] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "hash": content_hash,
+            }
+        return content_hash
+
+    def _load_state(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.state_path, "r") as f:
+                state = json.load(f)
+            if state.get("version") == BUILD_GRAPH_VERSION:
+                return state
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        return {"version": BUILD_GRAPH_VERSION, "files": {}, "stages": {}}
+
+    def _save_state(self):
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_name(self.state_path.name + ".tmp")
+        with self._lock:
+            # Forget the files that were removed
+            self.state["files"] = {
+                key: entry for key, entry in self.state["files"].items() if os.path.exists(key)
+            }
+            with open(tmp_path, "w") as f:
+                json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
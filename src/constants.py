@@ -5,5 +5,8 @@ CURRENT_FILE_PATH = Path(__file__).resolve().parent
 OUTPUT_PATH = CURRENT_FILE_PATH.parent.joinpath("travel_book")
 HTML_FILE_NAME = "travel_book.html"
 PDF_FILE_NAME = "travel_book.pdf"
+PROFILE_FILE_NAME = "profile.json"
 DATA_PATH = CURRENT_FILE_PATH.parent.joinpath("data")
 TRIP_DATA_PATH = DATA_PATH.joinpath("polarsteps-trip")
+CACHE_DIRECTORY = "cache"
+CACHE_PATH = OUTPUT_PATH.joinpath(CACHE_DIRECTORY)
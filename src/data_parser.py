@@ -1,41 +1,109 @@
 import os
 import json
 from pathlib import Path
+from typing import Any, Dict, Iterator, Set, TextIO, Tuple
 
-from arguments_manager import ArgumentManager
 from models.step import Step
 from models.trip import Trip
 
+READ_CHUNK_SIZE = 1024 * 1024
+TRIP_FIELDS = {"id", "name", "start_date", "end_date"}
+
+
+class JSONStreamReader:
+    """
+    Reads a JSON document from a file chunk by chunk. Values are decoded one
+    at a time with the C decoder, so only the value being read is in memory.
+    """
+
+    def __init__(self, file: TextIO):
+        self.file = file
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def peek(self) -> str:
+        """Returns the next non-whitespace character, or "" at the end of the file."""
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position].isspace():
+                self.position += 1
+            if self.position < len(self.buffer) or not self._fill():
+                return self.buffer[self.position : self.position + 1]
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(
+                f"Invalid JSON: expected '{char}' but got '{self.peek()}' in {self.file.name}"
+            )
+        self.position += 1
+
+    def read_value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # A number ending the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def iter_object(self) -> Iterator[str]:
+        """Yields the keys of an object. Each value must be read before the next key."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.position += 1
+            return
+        while True:
+            key = self.read_value()
+            self.expect(":")
+            yield key
+            if self.peek() == "}":
+                self.position += 1
+                return
+            self.expect(",")
+
+    def iter_array(self) -> Iterator[None]:
+        """Yields once per element of an array. Each element must be read before the next one."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.position += 1
+            return
+        while True:
+            yield None
+            if self.peek() == "]":
+                self.position += 1
+                return
+            self.expect(",")
+
+    def _fill(self) -> bool:
+        chunk = self.file.read(READ_CHUNK_SIZE)
+        self.buffer = self.buffer[self.position :] + chunk
+        self.position = 0
+        self.eof = not chunk
+        return bool(chunk)
+
 
 class DataParser:
-    def load(self, data_path: Path) -> Trip:
+    def load(self, data_path: Path, step_indices: Set[int] | None = None) -> Trip:
         file_path = data_path.joinpath("trip.json")
 
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"The file {file_path} does not exist.")
 
+        data: Dict[str, Any] = {}
+        steps = []
+
         with open(file_path, "r") as file:
-            data = json.load(file)
-
-        step_indices = ArgumentManager().step_indices
-
-        steps = [
-            Step(
-                name=step["display_name"],
-                description=step["description"],
-                country=step["location"]["detail"],
-                country_code=step["location"]["country_code"],
-                weather_condition=step["weather_condition"],
-                weather_temperature=step["weather_temperature"],
-                start_time=step["start_time"],
-                lat=step["location"]["lat"],
-                lon=step["location"]["lon"],
-                slug=step["slug"],
-                id=step["id"],
-            )
-            for i, step in enumerate(data["all_steps"], start=1)
-            if not step_indices or i in step_indices
-        ]
+            for key, value in self._iter_trip_json(file, step_indices):
+                if key == "all_steps":
+                    steps.append(self._build_step(value))
+                else:
+                    data[key] = value
 
         return Trip(
             id=data["id"],
@@ -44,3 +112,39 @@ class DataParser:
             start_date=data["start_date"],
             end_date=data["end_date"],
         )
+
+    def _iter_trip_json(
+        self, file: TextIO, step_indices: set[int] | None
+    ) -> Iterator[Tuple[str, Any]]:
+        """
+        Streams the trip fields and the selected steps of a trip.json file.
+        Other fields and steps are decoded one by one and dropped right away.
+        """
+        reader = JSONStreamReader(file)
+
+        for key in reader.iter_object():
+            if key != "all_steps":
+                value = reader.read_value()
+                if key in TRIP_FIELDS:
+                    yield key, value
+                continue
+
+            for i, _ in enumerate(reader.iter_array(), start=1):
+                step = reader.read_value()
+                if not step_indices or i in step_indices:
+                    yield key, step
+
+    def _build_step(self, step: Dict[str, Any]) -> Step:
+        return Step(
+            name=step["display_name"],
+            description=step["description"],
+            country=step["location"]["detail"],
+            country_code=step["location"]["country_code"],
+            weather_condition=step["weather_condition"],
+            weather_temperature=step["weather_temperature"],
+            start_time=step["start_time"],
+            lat=step["location"]["lat"],
+            lon=step["location"]["lon"],
+            slug=step["slug"],
+            id=step["id"],
+        )
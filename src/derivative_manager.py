@@ -0,0 +1,161 @@
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+import hashlib
+import os
+from pathlib import Path
+from typing import List, Set, Tuple
+from PIL import Image, ImageOps
+
+from models.photo import ROTATED_ORIENTATIONS, Photo
+from models.trip import Trip
+
+MM_PER_INCH = 25.4
+JPEG_QUALITY = 85
+
+# Portrait page sizes in millimeters of the formats supported by Playwright's page.pdf
+PAPER_SIZES = {
+    "letter": (215.9, 279.4),
+    "legal": (215.9, 355.6),
+    "tabloid": (279.4, 431.8),
+    "ledger": (431.8, 279.4),
+    "a0": (841, 1189),
+    "a1": (594, 841),
+    "a2": (420, 594),
+    "a3": (297, 420),
+    "a4": (210, 297),
+    "a5": (148, 210),
+    "a6": (105, 148),
+}
+
+
+class PhotoSlot(Enum):
+    """Fraction of the printed page (width, height) a photo is displayed in."""
+
+    FULL_PAGE = (1, 1)
+    HALF_PAGE = (0.5, 1)
+    QUARTER_PAGE = (0.5, 0.5)
+
+    @staticmethod
+    def from_page_layout(page_length: int, position: int):
+        if page_length == 1:
+            return PhotoSlot.FULL_PAGE
+        if page_length == 2:
+            return PhotoSlot.HALF_PAGE
+        # Pages of 3 or 4 photos are two columns of two photos. The third photo
+        # of a 3 photos page is alone in its column.
+        if page_length == 3 and position == 2:
+            return PhotoSlot.HALF_PAGE
+        return PhotoSlot.QUARTER_PAGE
+
+
+class DerivativeManager:
+    """
+    Creates print-resolution copies of the photos, sized to the slot they are
+    displayed in, so Chromium neither decodes nor embeds full camera files.
+    """
+
+    def __init__(self, output_path: Path, paper_format: str, dpi: int, workers: int = 1):
+        self.output_path = output_path
+        self.paper_format = paper_format
+        self.dpi = dpi
+        self.workers = max(1, workers)
+
+    def generate(self, trip: Trip):
+        page_size = self.get_page_size_in_pixels()
+        if not page_size:
+            print(
+                f"ℹ️ Unknown paper format '{self.paper_format}'. Using original photos..."
+            )
+            return
+
+        self.output_path.mkdir(parents=True, exist_ok=True)
+
+        targets: List[Tuple[Photo, int]] = []
+        for step in trip.steps:
+            if step.cover_photo:
+                targets.append(
+                    (step.cover_photo, self._get_slot_height(PhotoSlot.HALF_PAGE, page_size))
+                )
+            for page in step.photos_by_pages:
+                for position, photo in enumerate(page):
+                    slot = PhotoSlot.from_page_layout(len(page), position)
+                    targets.append((photo, self._get_slot_height(slot, page_size)))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            derivative_paths = list(
+                executor.map(lambda target: self._create_derivative(*target), targets)
+            )
+
+        used_derivatives: Set[str] = set()
+        for (photo, _), derivative_path in zip(targets, derivative_paths):
+            photo.derivative_path = derivative_path
+            if derivative_path:
+                used_derivatives.add(derivative_path.name)
+
+        self._remove_unused_derivatives(used_derivatives)
+
+    def get_page_size_in_pixels(self) -> Tuple[int, int] | None:
+        paper_size = PAPER_SIZES.get(self.paper_format.lower())
+        if not paper_size:
+            return None
+
+        # The book is printed in landscape
+        height, width = paper_size
+        return (
+            round(width / MM_PER_INCH * self.dpi),
+            round(height / MM_PER_INCH * self.dpi),
+        )
+
+    def _get_slot_height(self, slot: PhotoSlot, page_size: Tuple[int, int]) -> int:
+        # Photos are drawn with `background-size: auto 100%`, so only the slot
+        # height drives the displayed resolution.
+        return round(page_size[1] * slot.value[1])
+
+    def _create_derivative(self, photo: Photo, target_height: int) -> Path | None:
+        try:
+            # Photos already small enough are used as is, without opening them
+            if photo.metadata and photo.metadata.get_displayed_size()[1] <= target_height:
+                return None
+
+            stat = os.stat(photo.path)
+            key = hashlib.sha256(
+                f"{photo.path}|{stat.st_size}|{stat.st_mtime_ns}|{target_height}|{JPEG_QUALITY}".encode()
+            ).hexdigest()[:16]
+            derivative_path = self.output_path.joinpath(f"{Path(photo.path).stem}_{key}.jpg")
+
+            if derivative_path.exists():
+                return derivative_path
+
+            with Image.open(photo.path) as img:
+                orientation = img.getexif().get(0x0112, 1)
+                width, height = img.size
+                if orientation in ROTATED_ORIENTATIONS:
+                    width, height = height, width
+
+                if height <= target_height:
+                    return None
+
+                target_width = max(1, round(width * target_height / height))
+                draft_size = (
+                    (target_height, target_width)
+                    if orientation in ROTATED_ORIENTATIONS
+                    else (target_width, target_height)
+                )
+                # Lets the JPEG decoder downscale while decoding
+                img.draft("RGB", draft_size)
+                resized = ImageOps.exif_transpose(img).convert("RGB")
+                resized = resized.resize((target_width, target_height), Image.Resampling.LANCZOS)
+
+            tmp_path = derivative_path.with_name(f".{derivative_path.name}.tmp")
+            resized.save(tmp_path, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+            os.replace(tmp_path, derivative_path)
+            return derivative_path
+
+        except Exception:
+            print(f"ℹ️ Unable to create a print version of '{photo.id}'. Using original photo...")
+            return None
+
+    def _remove_unused_derivatives(self, used_derivatives: Set[str]):
+        for filename in os.listdir(self.output_path):
+            if filename not in used_derivatives:
+                self.output_path.joinpath(filename).unlink(missing_ok=True)
@@ -1,115 +1,88 @@
-from itertools import islice
 from pathlib import Path
-from typing import Any, Dict, List, Tuple, Iterator, Optional
-import requests
-import time
-import json
-import os
+from typing import Dict, List, Tuple, Optional
 
-CACHE_FILE_NAME = "elevation_cache.json"
+from elevation_cache import ElevationCache
+from elevation_providers import ElevationProvider, OpenTopoDataProvider
+from profiler import Profiler
 
 
 class ElevationAPI:
-    def __init__(self, cache_directory: Path) -> None:
-        self.api_url: str = "https://api.opentopodata.org/v1/aster30m"
-        self.max_locations_per_request: int = 100
-        self.max_calls_per_day: int = 1000
-        self.calls_made: int = 0
-        self.cache_file = cache_directory.joinpath(CACHE_FILE_NAME)
-
-        # Load cache from file if it exists
-        self.cache: Dict[str, Optional[float]] = self._load_cache()
+    def __init__(
+        self,
+        cache_directory: Path,
+        provider: ElevationProvider | None = None,
+        cache_tolerance_in_meters: float = 0,
+        profiler: Profiler | None = None,
+    ) -> None:
+        self.profiler = profiler or Profiler()
+        self.provider = provider or OpenTopoDataProvider(profiler=self.profiler)
+        self.cache = ElevationCache(cache_directory, tolerance_in_meters=cache_tolerance_in_meters)
+
+    def close(self) -> None:
+        self.cache.close()
 
     def get_elevation(
         self, locations: List[Tuple[float, float]]
     ) -> List[Optional[float]]:
         """
-        Get the elevation for a list of locations in batches, using a caching layer and respecting API limitations.
+        Get the elevation for a list of locations from the provider, using a caching layer.
 
         :param locations: A list of tuples where each tuple contains (latitude, longitude)
         :return: A list of elevations corresponding to each location
         """
-        all_elevations: List[Optional[float]] = []
-        locations_to_query: List[Tuple[float, float]] = []
+        return self.get_elevation_with_failures(locations)[0]
+
+    def get_elevation_with_failures(
+        self, locations: List[Tuple[float, float]]
+    ) -> Tuple[List[Optional[float]], List[int]]:
+        """
+        Like get_elevation, also returning the indexes of the locations the
+        provider failed to look up. Other None elevations have no data (at sea
+        for instance).
+        """
+        all_elevations: List[Optional[float]] = [None] * len(locations)
+        # Indexes of the locations to query, by location, so duplicates are queried once
+        indexes_to_query: Dict[Tuple[float, float], List[int]] = {}
 
         # First, check if locations are in cache
-        for loc in locations:
-            lat, lon = loc
-            key: str = f"{lat},{lon}"
-            if key in self.cache:
-                all_elevations.append(self.cache[key])
+        with self.profiler.span("elevations.cache_lookup", category="elevations") as span:
+            cached_elevations = (
+                self.cache.get_many(locations) if self.provider.cache_results else {}
+            )
+            span.add(locations=len(locations), hits=len(cached_elevations))
+        for index, loc in enumerate(locations):
+            if index in cached_elevations:
+                all_elevations[index] = cached_elevations[index]
             else:
-                locations_to_query.append(loc)
+                indexes_to_query.setdefault(loc, []).append(index)
 
         # Process only locations that were not found in cache
-        location_batches: Iterator[List[Tuple[float, float]]] = self._chunks(
-            locations_to_query, self.max_locations_per_request
+        locations_to_query = list(indexes_to_query)
+        with self.profiler.span("elevations.provider", category="elevations") as span:
+            found_elevations = self.provider.get_elevations(locations_to_query)
+            span.add(locations=len(locations_to_query), found=len(found_elevations))
+
+        for query_index, elevation in found_elevations.items():
+            # Results are written back at the index of the requested location
+            for index in indexes_to_query[locations_to_query[query_index]]:
+                all_elevations[index] = elevation
+
+        # Cache the results
+        if self.provider.cache_results:
+            with self.profiler.span(
+                "elevations.cache_write", category="elevations", locations=len(found_elevations)
+            ):
+                self.cache.set_many(
+                    [
+                        (*locations_to_query[query_index], elevation)
+                        for query_index, elevation in found_elevations.items()
+                    ]
+                )
+
+        failed_indexes = sorted(
+            index
+            for query_index, location in enumerate(locations_to_query)
+            if query_index not in found_elevations
+            for index in indexes_to_query[location]
         )
-
-        for batch in location_batches:
-            if self.calls_made >= self.max_calls_per_day:
-                print("Reached the maximum number of API calls for today.")
-                break
-
-            # Prepare the locations string for the API request
-            locations_param: str = "|".join([f"{lat},{lon}" for lat, lon in batch])
-            url: str = f"{self.api_url}?locations={locations_param}"
-
-            try:
-                response = requests.get(url)
-                response.raise_for_status()
-                data: Dict[str, Any] = response.json()
-
-                if "results" in data:
-                    for loc, result in zip(batch, data["results"]):
-                        lat, lon = loc
-                        elevation: Optional[float] = result.get("elevation")
-                        all_elevations.append(elevation)
-
-                        # Cache the result
-                        key = f"{lat},{lon}"
-                        self.cache[key] = elevation
-                else:
-                    all_elevations.extend([None] * len(batch))
-
-                self.calls_made += 1
-
-                # Respect the API rate limit (1 call per second)
-                time.sleep(1)
-
-            except requests.exceptions.RequestException as e:
-                print(f"An error occurred: {e}")
-                all_elevations.extend(
-                    [None] * len(batch)
-                )  # Return None for each location in case of an error
-
-        # Save updated cache to file
-        self._save_cache()
-
-        return all_elevations
-
-    def _chunks(
-        self, data: List[Tuple[float, float]], size: int
-    ) -> Iterator[List[Tuple[float, float]]]:
-        """
-        Yield successive n-sized chunks from a list.
-        """
-        iterator = iter(data)
-        for first in iterator:
-            yield [first] + list(islice(iterator, size - 1))
-
-    def _load_cache(self) -> Dict[str, Optional[float]]:
-        """
-        Load the cache from a JSON file if it exists, otherwise return an empty dictionary.
-        """
-        if os.path.exists(self.cache_file):
-            with open(self.cache_file, "r") as f:
-                return json.load(f)
-        return {}
-
-    def _save_cache(self) -> None:
-        """
-        Save the cache to a JSON file.
-        """
-        with open(self.cache_file, "w") as f:
-            json.dump(self.cache, f)
+        return all_elevations, failed_indexes
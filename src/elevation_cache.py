@@ -0,0 +1,146 @@
+from contextlib import closing
+import json
+import math
+from pathlib import Path
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+CACHE_FILE_NAME = "elevation_cache.sqlite"
+LEGACY_CACHE_FILE_NAME = "elevation_cache.json"
+METERS_PER_DEGREE_OF_LATITUDE = 111_320
+# Number of points looked up per query, to keep temporary tables small
+LOOKUP_CHUNK_SIZE = 5000
+
+
+class ElevationCache:
+    """
+    Elevations stored in a SQLite database in WAL mode, so several builds can
+    read and write the cache at the same time. A cached point is reused for
+    any location closer than `tolerance_in_meters`.
+    """
+
+    def __init__(self, cache_directory: Path, tolerance_in_meters: float = 0) -> None:
+        self.cache_file = cache_directory.joinpath(CACHE_FILE_NAME)
+        self.tolerance_in_meters = tolerance_in_meters
+        self._lock = threading.Lock()
+
+        cache_directory.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.cache_file, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS elevations (
+                    lat REAL NOT NULL,
+                    lon REAL NOT NULL,
+                    elevation REAL,
+                    PRIMARY KEY (lat, lon)
+                )
+                """
+            )
+
+        self._import_legacy_cache(cache_directory.joinpath(LEGACY_CACHE_FILE_NAME))
+
+    def get_many(self, locations: List[Tuple[float, float]]) -> Dict[int, Optional[float]]:
+        """
+        Look up many locations at once. Returns the cached elevation (which may
+        be None if the API had no data) by index of the locations found.
+        """
+        found: Dict[int, Optional[float]] = {}
+        for offset in range(0, len(locations), LOOKUP_CHUNK_SIZE):
+            chunk = locations[offset : offset + LOOKUP_CHUNK_SIZE]
+            for index, elevation in self._get_chunk(chunk):
+                found[offset + index] = elevation
+        return found
+
+    def set_many(self, elevations: List[Tuple[float, float, Optional[float]]]) -> None:
+        """Store (lat, lon, elevation) rows in a single transaction."""
+        with self._lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO elevations (lat, lon, elevation) VALUES (?, ?, ?)",
+                elevations,
+            )
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def _get_chunk(
+        self, locations: List[Tuple[float, float]]
+    ) -> Iterator[Tuple[int, Optional[float]]]:
+        with self._lock, closing(self.connection.cursor()) as cursor:
+            cursor.execute(
+                """
+                CREATE TEMP TABLE IF NOT EXISTS lookups (
+                    idx INTEGER PRIMARY KEY,
+                    lat REAL, lon REAL, lon_scale REAL,
+                    lat_min REAL, lat_max REAL, lon_min REAL, lon_max REAL
+                )
+                """
+            )
+            cursor.execute("DELETE FROM lookups")
+            cursor.executemany(
+                "INSERT INTO lookups VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (index, lat, lon, self._get_lon_scale(lat), *self._get_bounds(lat, lon))
+                    for index, (lat, lon) in enumerate(locations)
+                ),
+            )
+            # Squared distances in degrees of latitude, a degree of longitude
+            # being shorter by cos(lat)
+            rows = cursor.execute(
+                """
+                SELECT l.idx, e.elevation,
+                       (e.lat - l.lat) * (e.lat - l.lat)
+                       + (e.lon - l.lon) * l.lon_scale * (e.lon - l.lon) * l.lon_scale
+                FROM lookups l
+                JOIN elevations e
+                  ON e.lat BETWEEN l.lat_min AND l.lat_max
+                 AND e.lon BETWEEN l.lon_min AND l.lon_max
+                """
+            ).fetchall()
+            self.connection.commit()
+
+        # Keep the closest cached point of each location
+        closest: Dict[int, Tuple[float, Optional[float]]] = {}
+        for index, elevation, distance in rows:
+            if index not in closest or distance < closest[index][0]:
+                closest[index] = (distance, elevation)
+
+        for index, (_, elevation) in closest.items():
+            yield index, elevation
+
+    def _get_lon_scale(self, lat: float) -> float:
+        """Length of a degree of longitude at lat, in degrees of latitude."""
+        return max(math.cos(math.radians(lat)), 1e-6)
+
+    def _get_bounds(self, lat: float, lon: float) -> Tuple[float, float, float, float]:
+        lat_tolerance = self.tolerance_in_meters / METERS_PER_DEGREE_OF_LATITUDE
+        lon_tolerance = lat_tolerance / self._get_lon_scale(lat)
+        return (
+            lat - lat_tolerance,
+            lat + lat_tolerance,
+            lon - lon_tolerance,
+            lon + lon_tolerance,
+        )
+
+    def _import_legacy_cache(self, legacy_cache_file: Path) -> None:
+        """Import the elevations of the former JSON cache, once."""
+        # Another build may import the file at the same time and rename it first
+        try:
+            with open(legacy_cache_file, "r") as f:
+                legacy_cache: Dict[str, Optional[float]] = json.load(f)
+        except FileNotFoundError:
+            return
+
+        self.set_many(
+            [
+                (*map(float, key.split(",")), elevation)
+                for key, elevation in legacy_cache.items()
+            ]
+        )
+        try:
+            legacy_cache_file.rename(legacy_cache_file.with_suffix(".json.imported"))
+        except FileNotFoundError:
+            pass
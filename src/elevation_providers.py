@@ -0,0 +1,260 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import math
+import os
+from pathlib import Path
+import re
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+import numpy as np
+import requests
+
+from profiler import Profiler
+
+T = TypeVar("T")
+
+HGT_FILE_NAME_PATTERN = re.compile(r"^([NS])(\d{2})([EW])(\d{3})\.hgt$", re.IGNORECASE)
+HGT_VOID_VALUE = -32768
+
+
+class TokenBucket:
+    """Thread-safe rate limiter allowing `rate` acquisitions per second, with bursts of `capacity`."""
+
+    def __init__(self, rate: float, capacity: int = 1) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens: float = capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            # Reserve a token, waiting outside of the lock if it is not available yet
+            self.tokens -= 1
+            wait_time = -self.tokens / self.rate if self.tokens < 0 else 0
+
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+class ElevationProvider(ABC):
+    """Source of elevations used by ElevationAPI."""
+
+    # Whether the elevations are worth storing in the elevation cache
+    cache_results = True
+
+    @abstractmethod
+    def get_elevations(
+        self, locations: List[Tuple[float, float]]
+    ) -> Dict[int, Optional[float]]:
+        """
+        Return the elevation (None if there is no data) by index of the
+        locations that could be looked up. Locations missing from the result
+        failed and may be retried later.
+        """
+
+
+class OpenTopoDataProvider(ElevationProvider):
+    """
+    Elevations of the opentopodata API, queried in batches within its rate
+    limits. Processes querying the API at the same time each get an equal
+    share of the limits.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_requests: int = 2,
+        profiler: Profiler | None = None,
+        processes: int = 1,
+    ) -> None:
+        self.api_url: str = "https://api.opentopodata.org/v1/aster30m"
+        self.max_locations_per_request: int = 100
+        self.max_calls_per_day: int = 1000 // max(1, processes)
+        self.max_calls_per_second: float = 1 / max(1, processes)
+        self.max_concurrent_requests = max_concurrent_requests
+        self.calls_made: int = 0
+        self.rate_limiter = TokenBucket(rate=self.max_calls_per_second)
+        # A single session keeps the connection to the API alive between calls
+        self.session = requests.Session()
+        self.profiler = profiler or Profiler()
+
+    def get_elevations(
+        self, locations: List[Tuple[float, float]]
+    ) -> Dict[int, Optional[float]]:
+        index_batches: List[List[int]] = list(
+            self._chunks(list(range(len(locations))), self.max_locations_per_request)
+        )
+
+        remaining_calls = self.max_calls_per_day - self.calls_made
+        if len(index_batches) > remaining_calls:
+            print("Reached the maximum number of API calls for today.")
+            index_batches = index_batches[: max(0, remaining_calls)]
+        self.calls_made += len(index_batches)
+
+        found: Dict[int, Optional[float]] = {}
+        location_batches = [[locations[index] for index in batch] for batch in index_batches]
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_requests) as executor:
+            for batch, elevations in zip(
+                index_batches, executor.map(self._fetch_batch, location_batches)
+            ):
+                if elevations is not None:
+                    found.update(zip(batch, elevations))
+
+        return found
+
+    def _fetch_batch(
+        self, batch: List[Tuple[float, float]]
+    ) -> Optional[List[Optional[float]]]:
+        """
+        Query the API for a batch of locations once the rate limiter allows it.
+        Returns None if the API call failed.
+        """
+        # Prepare the locations string for the API request
+        locations_param: str = "|".join([f"{lat},{lon}" for lat, lon in batch])
+        url: str = f"{self.api_url}?locations={locations_param}"
+
+        # Respect the API rate limit (1 call per second)
+        with self.profiler.span("elevations.rate_limit_wait", category="elevations"):
+            self.rate_limiter.acquire()
+
+        with self.profiler.span(
+            "elevations.request", category="elevations", locations=len(batch)
+        ) as span:
+            try:
+                response = self.session.get(url, timeout=30)
+                response.raise_for_status()
+                data: Dict[str, Any] = response.json()
+            except requests.exceptions.RequestException as e:
+                print(f"An error occurred: {e}")
+                return None
+            span.add(response_bytes=len(response.content))
+
+        if "results" not in data:
+            return None
+
+        return [result.get("elevation") for result in data["results"]]
+
+    def _chunks(self, data: List[T], size: int) -> Iterator[List[T]]:
+        """
+        Yield successive n-sized chunks from a list.
+        """
+        iterator = iter(data)
+        for first in iterator:
+            yield [first] + list(islice(iterator, size - 1))
+
+
+class LocalDEMProvider(ElevationProvider):
+    """
+    Elevations read from SRTM `.hgt` tiles (1 or 3 arc-second) in a directory.
+    Tiles are memory-mapped and all the locations of a tile are sampled at once
+    with a bilinear interpolation.
+    """
+
+    cache_results = False
+
+    def __init__(self, dem_directory: Path, profiler: Profiler | None = None) -> None:
+        self.profiler = profiler or Profiler()
+        self.tile_paths: Dict[Tuple[int, int], Path] = {}
+        self.tiles: Dict[Tuple[int, int], np.memmap] = {}
+
+        for filename in os.listdir(dem_directory):
+            match = HGT_FILE_NAME_PATTERN.match(filename)
+            if not match:
+                continue
+            lat_hemisphere, lat, lon_hemisphere, lon = match.groups()
+            tile_origin = (
+                -int(lat) if lat_hemisphere.upper() == "S" else int(lat),
+                -int(lon) if lon_hemisphere.upper() == "W" else int(lon),
+            )
+            self.tile_paths[tile_origin] = dem_directory.joinpath(filename)
+
+        if not self.tile_paths:
+            print(f"ℹ️ No SRTM .hgt tile found in '{dem_directory}'")
+
+    def get_elevations(
+        self, locations: List[Tuple[float, float]]
+    ) -> Dict[int, Optional[float]]:
+        if not locations:
+            return {}
+
+        coordinates = np.asarray(locations, dtype=np.float64)
+        lats, lons = coordinates[:, 0], coordinates[:, 1]
+        tile_lats = np.floor(lats).astype(np.int64)
+        tile_lons = np.floor(lons).astype(np.int64)
+
+        found: Dict[int, Optional[float]] = {}
+        tile_origins = np.unique(np.stack([tile_lats, tile_lons], axis=1), axis=0)
+
+        for tile_lat, tile_lon in tile_origins.tolist():
+            indexes = np.flatnonzero((tile_lats == tile_lat) & (tile_lons == tile_lon))
+            tile = self._get_tile(tile_lat, tile_lon)
+            if tile is None:
+                # SRTM has no tile over the sea: the elevation is known to be missing
+                found.update((int(index), None) for index in indexes)
+                continue
+
+            with self.profiler.span(
+                "elevations.dem_tile", category="elevations", locations=len(indexes)
+            ):
+                elevations = self._interpolate(
+                    tile, lats[indexes] - tile_lat, lons[indexes] - tile_lon
+                )
+            found.update(
+                (index, None if math.isnan(elevation) else elevation)
+                for index, elevation in zip(indexes.tolist(), elevations.tolist())
+            )
+
+        return found
+
+    def _get_tile(self, tile_lat: int, tile_lon: int) -> np.memmap | None:
+        tile_origin = (tile_lat, tile_lon)
+        if tile_origin not in self.tiles:
+            tile_path = self.tile_paths.get(tile_origin)
+            if tile_path is None:
+                return None
+
+            # Tiles are square grids of big-endian 16 bits integers, from north to south
+            size = math.isqrt(os.path.getsize(tile_path) // 2)
+            self.tiles[tile_origin] = np.memmap(
+                tile_path, dtype=">i2", mode="r", shape=(size, size)
+            )
+
+        return self.tiles[tile_origin]
+
+    def _interpolate(
+        self, tile: np.memmap, lat_offsets: np.ndarray, lon_offsets: np.ndarray
+    ) -> np.ndarray:
+        """Bilinear interpolation of the tile at offsets in degrees from its south-west corner."""
+        last = tile.shape[0] - 1
+        rows = (1 - lat_offsets) * last
+        cols = lon_offsets * last
+
+        top = np.clip(np.floor(rows).astype(np.int64), 0, last - 1)
+        left = np.clip(np.floor(cols).astype(np.int64), 0, last - 1)
+        row_weights = rows - top
+        col_weights = cols - left
+
+        corners = [
+            tile[top, left],
+            tile[top, left + 1],
+            tile[top + 1, left],
+            tile[top + 1, left + 1],
+        ]
+        top_left, top_right, bottom_left, bottom_right = (
+            np.where(corner == HGT_VOID_VALUE, np.nan, corner.astype(np.float64))
+            for corner in corners
+        )
+
+        return (
+            top_left * (1 - row_weights) * (1 - col_weights)
+            + top_right * (1 - row_weights) * col_weights
+            + bottom_left * row_weights * (1 - col_weights)
+            + bottom_right * row_weights * col_weights
+        )
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+import threading
+from typing import Any, Dict, Set
+
+MANIFEST_FILE_NAME = ".sync_manifest.json"
+HASH_CHUNK_SIZE = 1024 * 1024
+# ioctl request number of FICLONE on Linux (copy-on-write clone of a whole file)
+FICLONE = 0x40049409
+
+
+def hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_unchanged_copy(src: str | Path, dst: str | Path) -> bool:
+    """Returns True when dst exists with the same size and mtime as src."""
+    try:
+        src_stat = os.stat(src)
+        dst_stat = os.stat(dst)
+    except FileNotFoundError:
+        return False
+    return (
+        src_stat.st_size == dst_stat.st_size
+        and src_stat.st_mtime_ns == dst_stat.st_mtime_ns
+    )
+
+
+def copy_if_changed(src: str, dst: str) -> str:
+    """`shutil.copytree` copy function that skips files already up to date."""
+    if not is_unchanged_copy(src, dst):
+        shutil.copy2(src, dst)
+    return dst
+
+
+def _reflink(src: Path, dst: Path) -> None:
+    import fcntl
+
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+    shutil.copystat(src, dst)
+
+
+def link_or_copy(src: Path, dst: Path) -> None:
+    """
+    Materializes src at dst using the cheapest method the filesystem supports:
+    a reflink, then a hardlink, then a regular copy. The file is written next
+    to dst first so an interrupted run never leaves a truncated photo behind.
+    """
+    tmp_path = dst.with_name(f".{dst.name}.tmp")
+    tmp_path.unlink(missing_ok=True)
+
+    try:
+        _reflink(src, tmp_path)
+    except (ImportError, OSError):
+        tmp_path.unlink(missing_ok=True)
+        try:
+            os.link(src, tmp_path)
+        except OSError:
+            shutil.copy2(src, tmp_path)
+
+    os.replace(tmp_path, dst)
+
+
+class FileSyncManifest:
+    """
+    Keeps a directory in sync with a set of source files. Each output file is
+    recorded with the size, mtime and content hash of its source so unchanged
+    files are skipped on the next run.
+    """
+
+    def __init__(self, output_path: Path):
+        self.output_path = output_path
+        self.manifest_path = output_path.joinpath(MANIFEST_FILE_NAME)
+        self.entries: Dict[str, Dict[str, Any]] = self._load()
+        self.synced: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def sync(self, source_path: Path, destination_path: Path) -> None:
+        key = destination_path.name
+        stat = os.stat(source_path)
+
+        with self._lock:
+            self.synced.add(key)
+            entry = self.entries.get(key)
+
+        if entry and entry["source"] == str(source_path) and destination_path.exists():
+            if entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                return
+
+            # Source was touched: only re-materialize it if its content changed.
+            content_hash = hash_file(source_path)
+            if entry["size"] == stat.st_size and entry["hash"] == content_hash:
+                with self._lock:
+                    entry["mtime_ns"] = stat.st_mtime_ns
+                return
+        else:
+            content_hash = hash_file(source_path)
+
+        link_or_copy(source_path, destination_path)
+
+        with self._lock:
+            self.entries[key] = {
+                "source": str(source_path),
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "hash": content_hash,
+            }
+
+    def remove_stale(self) -> int:
+        """Removes every output file that was not synced during this run."""
+        removed = 0
+        for filename in os.listdir(self.output_path):
+            if filename == MANIFEST_FILE_NAME or filename in self.synced:
+                continue
+            file_path = self.output_path.joinpath(filename)
+            if file_path.is_file():
+                file_path.unlink()
+                removed += 1
+
+        self.entries = {
+            key: entry for key, entry in self.entries.items() if key in self.synced
+        }
+        return removed
+
+    def save(self) -> None:
+        tmp_path = self.manifest_path.with_name(self.manifest_path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.manifest_path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
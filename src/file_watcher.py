@@ -0,0 +1,43 @@
+import os
+from pathlib import Path
+from typing import Dict, List, Set, Tuple
+
+
+class FileWatcher:
+    """Detects changes of files, or of any file within directories, by polling their mtimes."""
+
+    def __init__(self, paths_by_group: Dict[str, List[Path]]):
+        self.paths_by_group = paths_by_group
+        self.snapshots = {group: self._snapshot(paths) for group, paths in paths_by_group.items()}
+
+    def poll(self) -> Set[str]:
+        """Returns the groups with files added, removed or modified since the last poll."""
+        changed_groups: Set[str] = set()
+        for group, paths in self.paths_by_group.items():
+            snapshot = self._snapshot(paths)
+            if snapshot != self.snapshots[group]:
+                changed_groups.add(group)
+                self.snapshots[group] = snapshot
+        return changed_groups
+
+    def reset(self):
+        """Forgets changes made until now, such as files written by a build."""
+        self.poll()
+
+    def _snapshot(self, paths: List[Path]) -> Dict[str, Tuple[int, int]]:
+        snapshot: Dict[str, Tuple[int, int]] = {}
+        for path in paths:
+            if path.is_dir():
+                for root, _, filenames in os.walk(path):
+                    for filename in filenames:
+                        self._add_to_snapshot(snapshot, os.path.join(root, filename))
+            else:
+                self._add_to_snapshot(snapshot, str(path))
+        return snapshot
+
+    def _add_to_snapshot(self, snapshot: Dict[str, Tuple[int, int]], file_path: str):
+        try:
+            stat = os.stat(file_path)
+            snapshot[file_path] = (stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            pass
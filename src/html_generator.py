@@ -1,32 +1,212 @@
+import hashlib
+import json
+import os
 from pathlib import Path
+import re
 import shutil
+from typing import Any, Dict, Iterator, List, Set
 from jinja2 import Environment, FileSystemLoader, select_autoescape
+from markupsafe import Markup
 
+from file_sync import copy_if_changed
 from models.trip import Trip
+from profiler import Profiler
+
+FRAGMENTS_CACHE_DIRECTORY_NAME = "html_fragments"
+MAPS_DIRECTORY = "assets/images/maps"
+SVG_ROOT_PATTERN = re.compile(r"<svg\b([^>]*)>(.*)</svg>", re.DOTALL)
+SVG_ATTRIBUTE_PATTERN = re.compile(r'\b(viewBox|preserveAspectRatio)="([^"]*)"')
 
 
 class HTMLGenerator:
     CURRENT_FILE_PATH = Path(__file__).resolve().parent
+    TEMPLATES_PATH = CURRENT_FILE_PATH.joinpath("templates")
     TEMPLATE_VARS = {"project_root": CURRENT_FILE_PATH.parent}
 
-    def __init__(self):
+    def __init__(
+        self,
+        incremental_sync: bool = False,
+        cache_path: Path | None = None,
+        inline_maps: bool = False,
+        offline: bool = False,
+        language: str = "fr",
+        profiler: Profiler | None = None,
+        env: Environment | None = None,
+    ):
+        self.incremental_sync = incremental_sync
+        self.profiler = profiler or Profiler()
+        self.inline_maps = inline_maps
+        self.offline = offline
+        self.language = language
+        self.fragments_cache_path = (
+            cache_path.joinpath(FRAGMENTS_CACHE_DIRECTORY_NAME) if cache_path else None
+        )
+
+        # Generators of several books may share an environment, so templates are compiled once
+        self.env = env or self.create_environment()
 
-        env = Environment(
-            loader=FileSystemLoader(self.CURRENT_FILE_PATH.joinpath("templates")),
+    @classmethod
+    def create_environment(cls) -> Environment:
+        return Environment(
+            loader=FileSystemLoader(cls.TEMPLATES_PATH),
             autoescape=select_autoescape(),
         )
-        self.template = env.get_template("index.html")
+
+    @property
+    def template(self):
+        # Templates are reloaded by the environment when their files change
+        return self.env.get_template("index.html")
+
+    @property
+    def step_template(self):
+        return self.env.get_template("step/step_pages.html")
 
     def generate(self, trip: Trip, output_file_path: Path):
-        template_vars = trip.get_template_vars() | self.TEMPLATE_VARS
+        with self.profiler.span("html.generate", category="html", steps=len(trip.steps)):
+            self._generate(trip, output_file_path)
+
+    def _generate(self, trip: Trip, output_file_path: Path):
+        render_vars = self.TEMPLATE_VARS | {
+            "inline_maps": self.inline_maps,
+            "offline": self.offline,
+        }
+        maps_sprite = None
+        if self.inline_maps:
+            with self.profiler.span("html.maps_sprite", category="html"):
+                maps_sprite, render_vars["map_view_boxes"] = self._render_maps_sprite(
+                    trip, output_file_path.parent.joinpath(MAPS_DIRECTORY)
+                )
+
+        with self.profiler.span("html.template_vars", category="html", steps=len(trip.steps)):
+            template_vars = trip.get_template_vars(output_file_path.parent, self.language) | render_vars
+        used_fragments: Set[str] = set()
+        steps_html = self._render_steps(template_vars["steps"], render_vars, used_fragments)
+
+        # The document is streamed to the file as it is rendered, steps being
+        # rendered lazily one after another.
+        tmp_file_path = output_file_path.with_name(output_file_path.name + ".tmp")
+        with self.profiler.span("html.render", category="html"):
+            with open(tmp_file_path, "w") as out_file:
+                out_file.writelines(
+                    self.template.generate(
+                        template_vars | {"steps_html": steps_html, "maps_sprite": maps_sprite}
+                    )
+                )
+            os.replace(tmp_file_path, output_file_path)
+
+        self._remove_unused_fragments(used_fragments)
+
+        with self.profiler.span("html.copy_assets", category="html"):
+            shutil.copytree(
+                self.CURRENT_FILE_PATH.parent.joinpath("assets"),
+                Path(output_file_path).parent.joinpath("assets"),
+                dirs_exist_ok=True,
+                copy_function=copy_if_changed if self.incremental_sync else shutil.copy2,
+            )
+
+    def _render_maps_sprite(
+        self, trip: Trip, maps_path: Path
+    ) -> tuple[Markup, Dict[str, str]]:
+        """
+        Returns an SVG sprite with a `<symbol>` per country map of the trip, so
+        each map is parsed and drawn once however many steps show it, and the
+        view box of each map.
+        """
+        symbols: List[str] = []
+        view_boxes: Dict[str, str] = {}
+
+        for country_code in sorted({step.country_code.lower() for step in trip.steps}):
+            try:
+                with open(maps_path.joinpath(f"{country_code}.svg"), "r") as f:
+                    svg_root = SVG_ROOT_PATTERN.search(f.read())
+            except FileNotFoundError:
+                continue
 
-        html_as_str = self.template.render(template_vars)
+            if not svg_root:
+                continue
 
-        with open(output_file_path, "w") as out_file:
-            out_file.write(html_as_str)
+            attributes = dict(SVG_ATTRIBUTE_PATTERN.findall(svg_root.group(1)))
+            view_boxes[country_code] = attributes.get("viewBox", "")
+            symbol_attributes = "".join(
+                f' {name}="{value}"' for name, value in attributes.items()
+            )
+            symbols.append(
+                f'<symbol id="map-{country_code}"{symbol_attributes}>{svg_root.group(2)}</symbol>'
+            )
 
-        shutil.copytree(
-            self.CURRENT_FILE_PATH.parent.joinpath("assets"),
-            Path(output_file_path).parent.joinpath("assets"),
-            dirs_exist_ok=True,
+        sprite = (
+            '<svg class="maps-sprite" xmlns="http://www.w3.org/2000/svg" aria-hidden="true">'
+            + "".join(symbols)
+            + "</svg>"
         )
+        return Markup(sprite), view_boxes
+
+    def _render_steps(
+        self,
+        steps_vars: List[Dict[str, Any]],
+        render_vars: Dict[str, Any],
+        used_fragments: Set[str],
+    ) -> Iterator[Markup]:
+        """
+        Renders the pages of each step, reusing the fragments cached by previous
+        builds for steps whose template vars and templates did not change.
+        """
+        if not self.fragments_cache_path:
+            for step_vars in steps_vars:
+                yield Markup(self._render_step(step_vars, render_vars))
+            return
+
+        self.fragments_cache_path.mkdir(parents=True, exist_ok=True)
+        templates_hash = self._get_templates_hash()
+
+        for step_vars in steps_vars:
+            fragment_name = self._get_fragment_key(step_vars, render_vars, templates_hash) + ".html"
+            fragment_path = self.fragments_cache_path.joinpath(fragment_name)
+            used_fragments.add(fragment_name)
+
+            try:
+                with self.profiler.span("html.reuse_step", category="html", steps=1):
+                    with open(fragment_path, "r") as f:
+                        step_html = f.read()
+                yield Markup(step_html)
+                continue
+            except FileNotFoundError:
+                pass
+
+            step_html = self._render_step(step_vars, render_vars)
+            tmp_fragment_path = fragment_path.with_name(fragment_name + ".tmp")
+            with open(tmp_fragment_path, "w") as f:
+                f.write(step_html)
+            os.replace(tmp_fragment_path, fragment_path)
+
+            yield Markup(step_html)
+
+    def _render_step(self, step_vars: Dict[str, Any], render_vars: Dict[str, Any]) -> str:
+        with self.profiler.span("html.render_step", category="html", steps=1):
+            return self.step_template.render(render_vars | {"step": step_vars})
+
+    def _get_fragment_key(
+        self, step_vars: Dict[str, Any], render_vars: Dict[str, Any], templates_hash: str
+    ) -> str:
+        digest = hashlib.sha256(templates_hash.encode())
+        digest.update(
+            json.dumps(
+                render_vars | {"step": step_vars}, sort_keys=True, default=str
+            ).encode()
+        )
+        return digest.hexdigest()
+
+    def _get_templates_hash(self) -> str:
+        digest = hashlib.sha256()
+        for template_path in sorted(self.TEMPLATES_PATH.rglob("*.html")):
+            digest.update(str(template_path.relative_to(self.TEMPLATES_PATH)).encode())
+            digest.update(template_path.read_bytes())
+        return digest.hexdigest()
+
+    def _remove_unused_fragments(self, used_fragments: Set[str]):
+        if not self.fragments_cache_path or not self.fragments_cache_path.exists():
+            return
+
+        for filename in os.listdir(self.fragments_cache_path):
+            if filename not in used_fragments:
+                self.fragments_cache_path.joinpath(filename).unlink(missing_ok=True)
@@ -1,67 +1,40 @@
-import locale
 from pathlib import Path
+from typing import List
 
 
 from arguments_manager import ArgumentManager
-from constants import HTML_FILE_NAME, OUTPUT_PATH, PDF_FILE_NAME, TRIP_DATA_PATH
-from data_parser import DataParser
-from elevation_api import ElevationAPI
-from html_generator import HTMLGenerator
-from map_manager import MapManager
-from pdf_generator import PDFGenerator
-from photo_manager import PhotoManager
-
-locale.setlocale(locale.LC_TIME, "fr_FR.UTF-8")
-
-
-def main():
-    ArgumentManager()
-
-    data_parser = DataParser()
-    html_generator = HTMLGenerator()
-    map_manager = MapManager()
-    pdf_generator = PDFGenerator()
-    photo_manager = PhotoManager()
-
-    # Parse data
-    trip = data_parser.load(TRIP_DATA_PATH)
-
-    # Load photo
-    photo_manager.load_from_polarsteps_export(
-        TRIP_DATA_PATH, Path(OUTPUT_PATH).joinpath("assets/images/photos"), trip
-    )
-    photo_manager.load_photos_pages(trip, OUTPUT_PATH)
-    photo_manager.save_photos_pages(trip, OUTPUT_PATH)
-
-    # Get elevation
-    locations = [step.get_lat_lon_as_tuple() for step in trip.steps]
-    elevation_api = ElevationAPI(cache_directory=OUTPUT_PATH)
-    elevations = elevation_api.get_elevation(locations)
-
-    for step, elevation in zip(trip.steps, elevations):
-        if elevation is not None:
-            step.elevation = int(elevation)
-
-    # Maps managment
-    map_manager.download_maps_from_trip(
-        trip, OUTPUT_PATH.joinpath("assets/images/maps")
-    )
-    map_manager.update_style(OUTPUT_PATH.joinpath("assets/images/maps"))
-
-    for step in trip.steps:
-        step.position_percentage = map_manager.calculate_position_percentage(step)
-
-    # HTML generation
-    html_generator.generate(trip, OUTPUT_PATH.joinpath(HTML_FILE_NAME))
-
-    # PDF generation
-    if not ArgumentManager().no_pdf:
-        pdf_generator.generate(
-            OUTPUT_PATH.joinpath(HTML_FILE_NAME),
-            OUTPUT_PATH.joinpath(PDF_FILE_NAME),
-        )
+from batch_builder import BatchBuilder, read_batch_file
+from constants import CACHE_DIRECTORY
+from travel_book_builder import TravelBookBuilder, build_travel_book
+
+
+def main(argv: List[str] | None = None):
+    args = ArgumentManager(argv)
+    config = args.get_build_config()
+
+    if args.batch:
+        trips = read_batch_file(Path(args.batch))
+        failed_trips = BatchBuilder(
+            config,
+            trips,
+            workers=args.batch_workers,
+            max_browsers=args.max_browsers,
+            cache_path=config.output_path.joinpath(CACHE_DIRECTORY),
+        ).build()
+        if failed_trips:
+            print(f"❌ {len(failed_trips)} of {len(trips)} travel books failed to build")
+            raise SystemExit(1)
+        print(f"✅ {len(trips)} travel books have been successfully generated !")
+        return
+
+    if args.watch:
+        TravelBookBuilder(config).watch()
+        return
+
+    build_travel_book(config)
 
     print("✅ Travel book has been successfully generated !")
 
 
-main()
+if __name__ == "__main__":
+    main()
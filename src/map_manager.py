@@ -1,33 +1,161 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import json
 import os
 from pathlib import Path
-import re
-from typing import Set
+import threading
+import time
+from typing import Any, Dict, List
+import numpy as np
 from pyproj import Geod
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+from constants import DATA_PATH
+from file_sync import is_unchanged_copy, link_or_copy
 from models.step import Step
 from models.trip import Trip
+from profiler import Profiler
+from svg_simplifier import simplify_svg
 
 DATA_SOURCE = "https://raw.githubusercontent.com/djaiss/mapsicon/master/all/{country_code}/vector.svg"
 FILL_COLOR = "#f3f5f7"
 STROKE_COLOR = "#c6cdd7"
 STROKE_WIDTH = 80
-COUNTRY_BOUNDING_BOXES_PATH = "data/country_bounding_boxes.json"
+COUNTRY_BOUNDING_BOXES_PATH = DATA_PATH.joinpath("country_bounding_boxes.json")
+COUNTRY_EXTENTS_PATH = DATA_PATH.joinpath("country_extents_cache.json")
+MAPS_CACHE_DIRECTORY_NAME = "maps"
+MAPS_CACHE_INDEX_FILE_NAME = "index.json"
+# Cached maps are used without any request during this interval, then revalidated
+MAP_REVALIDATION_INTERVAL_IN_SECONDS = 7 * 24 * 60 * 60
+MAX_CONCURRENT_DOWNLOADS = 8
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_BACKOFF_FACTOR = 0.5
+# Height of the maps in the printed book, in CSS pixels (see `.step-map` in style.css)
+MAP_PRINTED_SIZE_IN_PX = 348 * 0.35
+CSS_PX_PER_INCH = 96
 
 
 class MapManager:
-    def __init__(self):
+    """
+    Country maps and the positions of the steps on them. A map manager may be
+    shared by builds running in threads: the index of the cached maps is local
+    to each download, and the country extents are guarded by a lock.
+    """
+
+    def __init__(
+        self,
+        cache_path: Path | None = None,
+        max_concurrent_downloads: int = MAX_CONCURRENT_DOWNLOADS,
+        data_source: str = DATA_SOURCE,
+        simplify_dpi: int | None = None,
+        profiler: Profiler | None = None,
+    ):
+        self.cache_path = cache_path
+        self.profiler = profiler or Profiler()
+        # Number of printed pixels across a map, when maps are simplified
+        self.simplify_resolution = (
+            MAP_PRINTED_SIZE_IN_PX / CSS_PX_PER_INCH * simplify_dpi if simplify_dpi else None
+        )
+        # Styled maps are cached by the version of the style applied to them
+        self.style_key = hashlib.sha256(
+            f"{FILL_COLOR}|{STROKE_COLOR}|{STROKE_WIDTH}|{self.simplify_resolution}".encode()
+        ).hexdigest()[:12]
+        self.max_concurrent_downloads = max_concurrent_downloads
+        self.data_source = data_source
+        self.session = self._create_session()
+        self._maps_index_lock = threading.Lock()
+
         with open(COUNTRY_BOUNDING_BOXES_PATH, "r") as f:
             self.country_bounding_boxes = json.load(f)
         self.geod = Geod(ellps="WGS84")
+        self.country_extents = self._load_country_extents()
+        self._country_extents_changed = False
+        self._country_extents_lock = threading.Lock()
 
     def calculate_position_percentage(self, step: Step) -> tuple[float, float] | None:
-        bounding_box = self.country_bounding_boxes.get(step.country_code.lower())
+        return self.calculate_position_percentages([step])[0]
+
+    def calculate_position_percentages(
+        self, steps: List[Step]
+    ) -> List[tuple[float, float] | None]:
+        """
+        Returns the position of each step on the map of its country, as
+        percentages from the top-left corner. Steps are grouped by country and
+        the distances of each group are computed in a single geodesic call.
+        """
+        with self.profiler.span("maps.positions", category="maps", steps=len(steps)):
+            return self._calculate_position_percentages(steps)
+
+    def _calculate_position_percentages(
+        self, steps: List[Step]
+    ) -> List[tuple[float, float] | None]:
+        positions: List[tuple[float, float] | None] = [None] * len(steps)
+        indexes_by_country: Dict[str, List[int]] = {}
+        for index, step in enumerate(steps):
+            indexes_by_country.setdefault(step.country_code.lower(), []).append(index)
+
+        for country_code, indexes in indexes_by_country.items():
+            extents = self._get_country_extents(country_code)
+
+            if not extents:
+                for index in indexes:
+                    print(f"ℹ️ No country bounding box data found for step '{steps[index].name}'")
+                    positions[index] = (0, 0)
+                continue
+
+            sw = self.country_bounding_boxes[country_code]["sw"]
+            mid_lat = extents["mid_lat"]
+            total_lat_distance = extents["total_lat_distance"]
+            total_lon_distance = extents["total_lon_distance"]
+
+            # Calculate the maximum of the two distances for square scaling
+            max_distance = max(total_lat_distance, total_lon_distance)
+            min_distance = min(total_lat_distance, total_lon_distance)
+            diff_distance = max_distance - min_distance
 
+            # Calculate the distance from the southwest to the steps latitude and longitude
+            count = len(indexes)
+            lats = np.array([steps[index].lat for index in indexes], dtype=np.float64)
+            lons = np.array([steps[index].lon for index in indexes], dtype=np.float64)
+            sw_lats = np.full(count, sw["lat"], dtype=np.float64)
+            sw_lons = np.full(count, sw["lon"], dtype=np.float64)
+            mid_lats = np.full(count, mid_lat, dtype=np.float64)
+
+            _, _, lat_distances = self.geod.inv(sw_lons, sw_lats, sw_lons, lats)
+            _, _, lon_distances = self.geod.inv(sw_lons, mid_lats, lons, mid_lats)
+
+            if max_distance == total_lat_distance:
+                lon_distances += diff_distance / 2
+            else:
+                lat_distances += diff_distance / 2
+
+            # Calculate the relative position as a percentage (compared to top-left corner)
+            lat_percentages = (lat_distances / max_distance * 100).tolist()
+            lon_percentages = (lon_distances / max_distance * 100).tolist()
+
+            for index, lat_percentage, lon_percentage in zip(
+                indexes, lat_percentages, lon_percentages
+            ):
+                positions[index] = (lat_percentage, lon_percentage)
+
+        self._save_country_extents()
+        return positions
+
+    def _get_country_extents(self, country_code: str) -> Dict[str, Any] | None:
+        """
+        Returns the height and width in meters of the bounding box of a country,
+        computed once and cached as long as the bounding box does not change.
+        """
+        bounding_box = self.country_bounding_boxes.get(country_code)
         if not bounding_box:
-            print(f"ℹ️ No country bounding box data found for step '{step.name}'")
-            return (0, 0)
+            return None
+
+        with self._country_extents_lock:
+            extents = self.country_extents.get(country_code)
+        if extents and extents["bounding_box"] == bounding_box:
+            return extents
 
         sw = bounding_box["sw"]
         ne = bounding_box["ne"]
@@ -39,67 +167,216 @@ class MapManager:
         _, _, total_lat_distance = self.geod.inv(sw["lon"], sw["lat"], sw["lon"], ne["lat"])
         _, _, total_lon_distance = self.geod.inv(sw["lon"], mid_lat, ne["lon"], mid_lat)
 
-        # Calculate the maximum of the two distances for square scaling
-        max_distance = max(total_lat_distance, total_lon_distance)
-        min_distance = min(total_lat_distance, total_lon_distance)
-        diff_distance = max_distance - min_distance
+        extents = {
+            "bounding_box": bounding_box,
+            "mid_lat": mid_lat,
+            "total_lat_distance": total_lat_distance,
+            "total_lon_distance": total_lon_distance,
+        }
+        with self._country_extents_lock:
+            self.country_extents[country_code] = extents
+            self._country_extents_changed = True
+        return extents
+
+    def _load_country_extents(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(COUNTRY_EXTENTS_PATH, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
 
-        # Calculate the distance from the southwest to the step's latitude and longitude
-        _, _, lat_distance = self.geod.inv(sw["lon"], sw["lat"], sw["lon"], step.lat)
-        _, _, lon_distance = self.geod.inv(sw["lon"], mid_lat, step.lon, mid_lat)
+    def _save_country_extents(self):
+        with self._country_extents_lock:
+            if not self._country_extents_changed:
+                return
 
-        if max_distance == total_lat_distance:
-            lon_distance += diff_distance / 2
-        else:
-            lat_distance += diff_distance / 2
+            # Keeps the extents saved meanwhile by other builds sharing the file
+            self.country_extents = self._load_country_extents() | self.country_extents
+            tmp_path = f"{COUNTRY_EXTENTS_PATH}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.country_extents, f)
+            os.replace(tmp_path, COUNTRY_EXTENTS_PATH)
+            self._country_extents_changed = False
 
-        # Calculate the relative position as a percentage (compared to top-left corner)
-        lat_percentage = (lat_distance / max_distance) * 100
-        lon_percentage = (lon_distance / max_distance) * 100
+    def style_map(self, svg: str) -> str:
+        """Applies the colors of the travel book to a mapsicon SVG, and simplifies it if enabled."""
+        svg = svg.replace(
+            'fill="#000000" stroke="none"',
+            f'fill="{FILL_COLOR}" stroke="{STROKE_COLOR}" stroke-width="{STROKE_WIDTH}"',
+        )
+        if self.simplify_resolution:
+            svg = simplify_svg(svg, self.simplify_resolution)
+        return svg
 
-        return lat_percentage, lon_percentage
+    def download_maps_from_trip(self, trip: Trip, output_path: Path):
+        """
+        Copies the styled map of each country of the trip to output_path. Maps
+        are kept in a content-addressed cache and downloaded concurrently, only
+        when they are missing or when their revalidation interval is over.
+        """
+        with self.profiler.span("maps.download", category="maps") as span:
+            countries = self._download_maps_from_trip(trip, output_path)
+            span.add(countries=countries)
 
-    def update_style(self, maps_path: Path):
-        for filename in os.listdir(maps_path):
-            if filename.endswith(".svg"):
-                file_path = maps_path.joinpath(filename)
+    def _download_maps_from_trip(self, trip: Trip, output_path: Path) -> int:
+        """Returns the number of countries of the trip."""
+        output_path.mkdir(parents=True, exist_ok=True)
 
-                # Read the content of the SVG file
-                with open(file_path, "r") as file:
-                    content = file.read()
+        maps_cache_path = (self.cache_path or output_path).joinpath(MAPS_CACHE_DIRECTORY_NAME)
+        maps_cache_path.joinpath("objects").mkdir(parents=True, exist_ok=True)
+        # Local to the download, as other builds may share the map manager
+        maps_index = self._load_maps_index(maps_cache_path)
 
-                # Use regex to replace fill="#000000" with the new FILL_COLOR
-                updated_content = re.sub(
-                    pattern=r'fill="#000000" stroke="none"',
-                    repl=f'fill="{FILL_COLOR}" stroke="{STROKE_COLOR}" stroke-width="{STROKE_WIDTH}"',
-                    string=content,
-                )
+        first_step_by_country: Dict[str, Step] = {}
+        for step in trip.steps:
+            first_step_by_country.setdefault(step.country_code.lower(), step)
 
-                # Write the updated content back to the file
-                with open(file_path, "w") as file:
-                    file.write(updated_content)
+        if not first_step_by_country:
+            return 0
 
-    def download_maps_from_trip(self, trip: Trip, output_path: Path):
-        output_path.mkdir(parents=True, exist_ok=True)
+        workers = min(self.max_concurrent_downloads, len(first_step_by_country))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            map_paths = executor.map(
+                lambda country_code: self._fetch_map(country_code, maps_cache_path, maps_index),
+                first_step_by_country,
+            )
 
-        downloaded_countries: Set[str] = set()
+            for (country_code, step), map_path in zip(first_step_by_country.items(), map_paths):
+                if map_path is None:
+                    print(f"ℹ️ Failed to download map for step '{step.name}'")
+                    continue
 
-        for step in trip.steps:
-            if step.country_code in downloaded_countries:
-                continue
+                output_map_path = output_path / f"{country_code}.svg"
+                if not is_unchanged_copy(map_path, output_map_path):
+                    link_or_copy(map_path, output_map_path)
+
+        self._save_maps_index(maps_cache_path, maps_index)
+        return len(first_step_by_country)
+
+    def _fetch_map(
+        self, country_code: str, maps_cache_path: Path, maps_index: Dict[str, Dict[str, Any]]
+    ) -> Path | None:
+        """
+        Returns the path of the styled map of a country, downloading it first
+        if needed. A stale map is still used when the download fails.
+        """
+        with self.profiler.span("maps.fetch", category="maps", maps=1, country=country_code):
+            map_path = self._fetch_raw_map(country_code, maps_cache_path, maps_index)
+        if map_path is None:
+            return None
+
+        styled_map_path = map_path.with_name(f"{map_path.stem}_{self.style_key}.svg")
+        if not styled_map_path.exists():
+            with self.profiler.span("maps.style", category="maps", maps=1, country=country_code):
+                with open(map_path, "r") as f:
+                    styled_svg = self.style_map(f.read())
+            tmp_path = styled_map_path.with_name(
+                f".{styled_map_path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+            )
+            with open(tmp_path, "w") as f:
+                f.write(styled_svg)
+            os.replace(tmp_path, styled_map_path)
+
+        return styled_map_path
+
+    def _fetch_raw_map(
+        self, country_code: str, maps_cache_path: Path, maps_index: Dict[str, Dict[str, Any]]
+    ) -> Path | None:
+        """Returns the path of the map of a country as downloaded."""
+        svg_url = self.data_source.format(country_code=country_code)
+
+        with self._maps_index_lock:
+            entry = maps_index.get(country_code)
+
+        cached_path: Path | None = None
+        if entry and entry["url"] == svg_url:
+            # Countries without a map are remembered with no hash
+            if entry["hash"]:
+                cached_path = maps_cache_path.joinpath("objects", f"{entry['hash']}.svg")
+            is_fresh = time.time() - entry["checked_at"] < MAP_REVALIDATION_INTERVAL_IN_SECONDS
+
+            if not entry["hash"] and is_fresh:
+                return None
+            if cached_path and not cached_path.exists():
+                cached_path = None
+            if cached_path and is_fresh:
+                return cached_path
+
+        headers: Dict[str, str] = {}
+        if cached_path:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        try:
+            response = self.session.get(svg_url, headers=headers, timeout=30)
+            if cached_path and response.status_code == 304:
+                with self._maps_index_lock:
+                    entry["checked_at"] = time.time()
+                return cached_path
+            if response.status_code == 404:
+                with self._maps_index_lock:
+                    maps_index[country_code] = {
+                        "url": svg_url,
+                        "hash": None,
+                        "checked_at": time.time(),
+                    }
+                return None
+            response.raise_for_status()
+        except requests.exceptions.RequestException:
+            return cached_path
 
-            svg_url = DATA_SOURCE.format(country_code=step.country_code.lower())
+        content_hash = hashlib.sha256(response.content).hexdigest()
+        map_path = maps_cache_path.joinpath("objects", f"{content_hash}.svg")
+        if not map_path.exists():
+            tmp_path = map_path.with_name(
+                f".{map_path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+            )
+            with open(tmp_path, "wb") as f:
+                f.write(response.content)
+            os.replace(tmp_path, map_path)
 
-            try:
-                response = requests.get(svg_url)
-                response.raise_for_status()
+        with self._maps_index_lock:
+            maps_index[country_code] = {
+                "url": svg_url,
+                "hash": content_hash,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "checked_at": time.time(),
+            }
 
-                svg_path = output_path / f"{step.country_code.lower()}.svg"
+        return map_path
 
-                with open(svg_path, "wb") as svg_file:
-                    svg_file.write(response.content)
+    def _create_session(self) -> requests.Session:
+        """Session reusing connections, retrying failed requests with an exponential backoff."""
+        retry = Retry(
+            total=DOWNLOAD_RETRIES,
+            backoff_factor=DOWNLOAD_BACKOFF_FACTOR,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET",),
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_maxsize=self.max_concurrent_downloads)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
 
-                downloaded_countries.add(step.country_code)
+    def _load_maps_index(self, maps_cache_path: Path) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(maps_cache_path.joinpath(MAPS_CACHE_INDEX_FILE_NAME), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
 
-            except requests.exceptions.RequestException:
-                print(f"ℹ️ Failed to download map for step '{step.name}'")
+    def _save_maps_index(self, maps_cache_path: Path, maps_index: Dict[str, Dict[str, Any]]):
+        index_path = maps_cache_path.joinpath(MAPS_CACHE_INDEX_FILE_NAME)
+        tmp_path = index_path.with_name(
+            f"{index_path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        with self._maps_index_lock:
+            # Keeps the entries saved meanwhile by other builds sharing the cache
+            maps_index = self._load_maps_index(maps_cache_path) | maps_index
+            with open(tmp_path, "w") as f:
+                json.dump(maps_index, f)
+            os.replace(tmp_path, index_path)
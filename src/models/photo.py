@@ -1,10 +1,15 @@
 from enum import Enum
 import os
 from pathlib import Path
-from typing import Any, Dict, Self
+from typing import TYPE_CHECKING, Any, Dict, Self
 from PIL import Image
 
-from constants import OUTPUT_PATH
+if TYPE_CHECKING:
+    from photo_metadata_cache import PhotoMetadataCache
+
+EXIF_ORIENTATION_TAG = 0x0112
+# EXIF orientations for which the stored pixels are rotated by 90 or 270 degrees
+ROTATED_ORIENTATIONS = {5, 6, 7, 8}
 
 
 class PhotoRatio(Enum):
@@ -22,45 +27,111 @@ class PhotoRatio(Enum):
                     return photo_ratio
         return PhotoRatio.UNKNOWN
 
+class PhotoMetadata:
+    def __init__(self, width: int, height: int, orientation: int = 1, ratio: PhotoRatio | None = None):
+        self.width = width
+        self.height = height
+        self.orientation = orientation
+        self.ratio = ratio or PhotoRatio.get_ratio(*self.get_displayed_size())
+
+    @staticmethod
+    def from_image(path: Path):
+        with Image.open(path) as img:
+            width, height = img.size
+            orientation = img.getexif().get(EXIF_ORIENTATION_TAG, 1)
+        return PhotoMetadata(width=width, height=height, orientation=orientation)
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]):
+        return PhotoMetadata(
+            width=data["width"],
+            height=data["height"],
+            orientation=data.get("orientation", 1),
+            ratio=PhotoRatio[data["ratio"]] if "ratio" in data else None,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "width": self.width,
+            "height": self.height,
+            "orientation": self.orientation,
+            "ratio": self.ratio.name,
+        }
+
+    def get_displayed_size(self) -> tuple[int, int]:
+        """Size of the photo once its EXIF orientation is applied."""
+        if self.orientation in ROTATED_ORIENTATIONS:
+            return self.height, self.width
+        return self.width, self.height
+
+
 class Photo:
-    def __init__(self, id: str, index: int, path: Path):
+    def __init__(
+        self,
+        id: str,
+        index: int,
+        path: Path,
+        metadata: PhotoMetadata | None = None,
+        metadata_cache: "PhotoMetadataCache | None" = None,
+    ):
         self.id = id
         self.index = index
         self.path = path
-        self.ratio = self.compute_photo_ratio()
-    
+        self.derivative_path: Path | None = None
+        self.metadata_cache = metadata_cache
+        self._metadata = metadata
+        self._metadata_loaded = metadata is not None
+
     @staticmethod
-    def from_dict(data: Dict[str, Any]):
+    def from_dict(data: Dict[str, Any], metadata_cache: "PhotoMetadataCache | None" = None):
         return Photo(
             id=data.get("id", ""),
             index=data.get("index", 0),
             path=Path(data.get("path", "")),
+            metadata=PhotoMetadata.from_dict(data) if "width" in data else None,
+            metadata_cache=metadata_cache,
         )
 
     def to_dict(self) -> Dict[str, Any]:
-        return {
+        data: Dict[str, Any] = {
             "id": self.id,
             "index": self.index,
             "path": str(self.path),
         }
+        if self.metadata:
+            data |= self.metadata.to_dict()
+        return data
+
+    @property
+    def metadata(self) -> PhotoMetadata | None:
+        """Dimensions of the photo, loaded on first access."""
+        if not self._metadata_loaded:
+            self._metadata = self.load_metadata()
+            self._metadata_loaded = True
+        return self._metadata
+
+    @property
+    def ratio(self) -> PhotoRatio:
+        return self.metadata.ratio if self.metadata else PhotoRatio.UNKNOWN
 
     def can_be_side_by_side(self, other_photo: Self) -> bool:
         return self.ratio == PhotoRatio.PORTRAIT and other_photo.ratio == PhotoRatio.PORTRAIT
 
-    def compute_photo_ratio(self) -> PhotoRatio:
+    def load_metadata(self) -> PhotoMetadata | None:
         try:
-            with Image.open(self.path) as img:
-                width, height = img.size
-                return PhotoRatio.get_ratio(width, height)
+            if self.metadata_cache:
+                return self.metadata_cache.get(self.path)
+            return PhotoMetadata.from_image(self.path)
         except Exception:
             print(f"Unknown photo ratio for '{self.id}'.")
-            return PhotoRatio.UNKNOWN
+            return None
 
-    def get_relative_path(self):
-        return os.path.relpath(self.path, OUTPUT_PATH)
+    def get_relative_path(self, base_path: Path):
+        return os.path.relpath(self.derivative_path or self.path, base_path)
 
-    def get_template_vars(self):
-        return {"path": self.get_relative_path() }
+    def get_template_vars(self, base_path: Path):
+        """Template vars of the photo, with its path relative to the HTML file directory."""
+        return {"path": self.get_relative_path(base_path) }
 
     def __eq__(self, other: Any):
         if isinstance(other, Photo):
@@ -1,4 +1,5 @@
 from datetime import datetime
+from pathlib import Path
 import random
 from typing import Any, Dict, List
 
@@ -137,19 +138,16 @@ class Step:
     def get_lat_lon_as_tuple(self):
         return (self.lat, self.lon)
 
-    def get_day_number(self, trip_start_date: datetime):
-        return (self.start_time - trip_start_date).days + 1
-
-    def get_trip_percentage(
-        self,
-        trip_start_date: datetime,
-        trip_duration_in_days: int,
-    ):
-        return self.get_day_number(trip_start_date) * 100 / trip_duration_in_days
-
     def get_template_vars(
-        self, trip_start_date: datetime, trip_duration_in_days: int
+        self,
+        day_number: int,
+        trip_percentage: float,
+        lat: tuple[int, int, int],
+        lon: tuple[int, int, int],
+        base_path: Path,
+        month: str,
     ) -> Dict[str, Any]:
+        """Template vars of the step, from the values precomputed by the trip."""
         return {
             "name": self.name,
             "description": self.description,
@@ -158,17 +156,18 @@ class Step:
             "weather_condition": self.weather_condition,
             "weather_temperature": self.weather_temperature,
             "start_time": self.start_time,
-            "day_number": self.get_day_number(trip_start_date),
-            "trip_percentage": self.get_trip_percentage(
-                trip_start_date, trip_duration_in_days
-            ),
+            "month": month,
+            "day_number": day_number,
+            "trip_percentage": trip_percentage,
             "elevation": self.elevation,
             "position_percentage": self.position_percentage,
             "photos_by_pages": [
-                [photo.get_template_vars() for photo in page]
+                [photo.get_template_vars(base_path) for photo in page]
                 for page in self.photos_by_pages
             ],
-            "cover_photo": self.cover_photo.get_template_vars() if self.cover_photo else None,
-            "lat": decdeg2dms(self.lat),
-            "lon": decdeg2dms(self.lon),
+            "cover_photo": (
+                self.cover_photo.get_template_vars(base_path) if self.cover_photo else None
+            ),
+            "lat": lat,
+            "lon": lon,
         }
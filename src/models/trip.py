@@ -1,6 +1,8 @@
 from datetime import datetime
+from pathlib import Path
 from typing import Any, Dict, List
-from models.step import Step
+from models.step import Step, decdeg2dms
+from translations import MONTHS
 
 
 class Trip:
@@ -12,7 +14,8 @@ class Trip:
         self.steps = steps
         self.start_date = datetime.fromtimestamp(start_date)
         self.end_date = datetime.fromtimestamp(end_date) if end_date else None
-    
+        self._derived_fields: Dict[str, List[Any]] | None = None
+
     def compute_default_photos_by_pages(self):
         for step in self.steps:
             step.compute_default_photos_by_pages()
@@ -28,10 +31,57 @@ class Trip:
             return (self.end_date - self.start_date).days
         return (self.get_last_step_date() - self.start_date).days
 
-    def get_template_vars(self) -> Dict[str, Any]:
-        out: Dict[str, Any] = {"steps": []}
+    def get_derived_fields(self) -> Dict[str, List[Any]]:
+        """
+        Per-step values derived from the trip dates and the step locations, as
+        one column per field. They are computed once for all steps and reused
+        by every later build of the template vars.
+        """
+        if self._derived_fields is None:
+            duration_in_days = self.get_duration_in_days()
+            day_numbers = [
+                (step.start_time - self.start_date).days + 1 for step in self.steps
+            ]
 
-        for step in self.steps:
-            out["steps"].append(step.get_template_vars(self.start_date, self.get_duration_in_days()))
+            self._derived_fields = {
+                "day_number": day_numbers,
+                "trip_percentage": [
+                    day_number * 100 / duration_in_days for day_number in day_numbers
+                ],
+                "lat": [decdeg2dms(step.lat) for step in self.steps],
+                "lon": [decdeg2dms(step.lon) for step in self.steps],
+            }
+
+        return self._derived_fields
+
+    def invalidate_derived_fields(self):
+        """Drops the derived fields, to compute them again after the steps changed."""
+        self._derived_fields = None
+
+    def get_template_vars(self, base_path: Path, language: str) -> Dict[str, Any]:
+        """
+        Template vars of the trip, with photo paths relative to base_path and
+        month names in the given language.
+        """
+        derived_fields = self.get_derived_fields()
+        month_names = MONTHS[language]
 
-        return out
+        return {
+            "steps": [
+                step.get_template_vars(
+                    day_number=day_number,
+                    trip_percentage=trip_percentage,
+                    lat=lat,
+                    lon=lon,
+                    base_path=base_path,
+                    month=month_names[step.start_time.month - 1],
+                )
+                for step, day_number, trip_percentage, lat, lon in zip(
+                    self.steps,
+                    derived_fields["day_number"],
+                    derived_fields["trip_percentage"],
+                    derived_fields["lat"],
+                    derived_fields["lon"],
+                )
+            ]
+        }
@@ -1,20 +1,383 @@
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import os
 from pathlib import Path
-from playwright.sync_api import sync_playwright
+import re
+import shutil
+import tempfile
+from typing import Any, Dict, Iterator, List, Set, Tuple
+from playwright.sync_api import Browser, Playwright, sync_playwright
+from pypdf import PdfWriter
 
-from arguments_manager import ArgumentManager
+from file_sync import hash_file
+from profiler import Profiler
 
+STEP_START_MARKER = "<!-- step:start -->"
+STEP_END_MARKER = "<!-- step:end -->"
+PAGE_CLASS = 'class="break-after"'
+SHARDS_DIRECTORY_NAME = "pdf_shards"
+FRAGMENTS_DIRECTORY_NAME = "pdf_fragments"
+ASSET_REFERENCE_PATTERN = re.compile(r"""(?:url\(\s*['"]?|src="|href=")([^'")]+)""")
+# Started in place of Chromium to cap the memory of each of its processes
+MEMORY_LIMITED_LAUNCHER = """#!/bin/sh
+ulimit -d {memory_limit_kb}
+exec "{executable_path}" "$@"
+"""
+# Hidden element shifting `.break-after:nth-child` so pages keep their odd/even margins
+PARITY_SPACER = '<div style="display: none"></div>'
 
-class PDFGenerator:
-    def generate(self, html_file_path: Path, pdf_file_path: Path):
-        with sync_playwright() as p:
-            browser = p.chromium.launch()
-            context = browser.new_context()
-            page = context.new_page()
-            page.goto(f"file://{html_file_path}")
+
+def print_pdfs(
+    jobs: List[Tuple[Path, Path]],
+    paper_format: str,
+    memory_limit_mb: int | None = None,
+    profiler: Profiler | None = None,
+):
+    """Prints each (html file, pdf file) job with a single Chromium instance."""
+    profiler = profiler or Profiler()
+    with sync_playwright() as p:
+        with profiler.span("pdf.launch_browser", category="pdf"):
+            browser = launch_browser(p, memory_limit_mb)
+        print_pdfs_with_browser(browser, jobs, paper_format, profiler)
+        browser.close()
+
+
+def print_pdfs_in_worker(
+    jobs: List[Tuple[Path, Path]],
+    paper_format: str,
+    memory_limit_mb: int | None,
+    profiler_origin: float | None,
+) -> List[Dict[str, Any]]:
+    """
+    Prints PDFs in a worker process. Returns the trace events of the worker
+    when profiling, on the timeline starting at profiler_origin.
+    """
+    profiler = Profiler(enabled=profiler_origin is not None, origin=profiler_origin)
+    print_pdfs(jobs, paper_format, memory_limit_mb, profiler)
+    return profiler.events
+
+
+def launch_browser(playwright: Playwright, memory_limit_mb: int | None = None) -> Browser:
+    """
+    Launches Chromium. With a memory limit, each Chromium process (renderer,
+    GPU, image decoding) can allocate at most memory_limit_mb, and the
+    JavaScript heap is collected before reaching it.
+    """
+    if not memory_limit_mb:
+        return playwright.chromium.launch()
+
+    args = [f"--js-flags=--max-old-space-size={memory_limit_mb}"]
+    if os.name != "posix":
+        print("ℹ️ The memory of Chromium processes can only be limited on Linux and macOS. Only the JavaScript heap is limited.")
+        return playwright.chromium.launch(args=args)
+
+    launcher_path = get_memory_limited_launcher(playwright.chromium.executable_path, memory_limit_mb)
+    return playwright.chromium.launch(executable_path=launcher_path, args=args)
+
+
+def get_memory_limited_launcher(executable_path: str, memory_limit_mb: int) -> Path:
+    """
+    Writes a script starting the executable with a limit on the data segment
+    (RLIMIT_DATA) of each of its processes, inherited by the processes it
+    starts. Unlike the address space, it does not count the memory Chromium
+    only reserves, so the limit applies to the memory actually allocated.
+    """
+    launcher = MEMORY_LIMITED_LAUNCHER.format(
+        memory_limit_kb=memory_limit_mb * 1024, executable_path=executable_path
+    )
+    launcher_hash = hashlib.sha256(launcher.encode()).hexdigest()[:16]
+    launcher_path = Path(tempfile.gettempdir()).joinpath(f"travel-book-chromium-{launcher_hash}.sh")
+
+    if not launcher_path.exists():
+        tmp_path = launcher_path.with_name(f"{launcher_path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(launcher)
+        tmp_path.chmod(0o755)
+        os.replace(tmp_path, launcher_path)
+    return launcher_path
+
+
+def print_pdfs_with_browser(
+    browser: Browser,
+    jobs: List[Tuple[Path, Path]],
+    paper_format: str,
+    profiler: Profiler | None = None,
+):
+    profiler = profiler or Profiler()
+    for html_file_path, pdf_file_path in jobs:
+        # A context per job, so the memory of a shard is released before the next one
+        context = browser.new_context()
+        page = context.new_page()
+        with profiler.span("pdf.load", category="pdf", documents=1):
+            page.goto(html_file_path.as_uri())
+        with profiler.span("pdf.print", category="pdf", documents=1) as span:
             page.pdf(
                 path=pdf_file_path,
-                format=ArgumentManager().paper_format,
+                format=paper_format,
                 landscape=True,
                 print_background=True,
             )
-            browser.close()
+            span.add(pdf_bytes=os.path.getsize(pdf_file_path))
+        context.close()
+
+
+def merge_pdfs(
+    pdf_file_paths: List[Path], output_file_path: Path, profiler: Profiler | None = None
+):
+    profiler = profiler or Profiler()
+    with profiler.span("pdf.merge", category="pdf", documents=len(pdf_file_paths)):
+        writer = PdfWriter()
+        for pdf_file_path in pdf_file_paths:
+            writer.append(pdf_file_path)
+        with open(output_file_path, "wb") as f:
+            writer.write(f)
+
+
+def split_html_by_steps(html: str) -> Tuple[str, List[str], str]:
+    """Splits a travel book into the document head, one chunk per step and the document tail."""
+    first_step_position = html.find(STEP_START_MARKER)
+    if first_step_position == -1:
+        return html, [], ""
+    last_step_position = html.rindex(STEP_END_MARKER) + len(STEP_END_MARKER)
+
+    steps_html = [
+        STEP_START_MARKER + step_html
+        for step_html in html[first_step_position:last_step_position].split(STEP_START_MARKER)
+        if step_html.strip()
+    ]
+    return html[:first_step_position], steps_html, html[last_step_position:]
+
+
+def build_partial_html(
+    head: str, steps_html: List[str], tail: str, base_url: str, first_page_index: int
+) -> str:
+    """
+    Builds a standalone document with some steps of the book. Relative assets
+    are resolved against base_url, and the odd/even page margins match the
+    position of the first page in the whole book.
+    """
+    head = head.replace("<head>", f'<head>\n    <base href="{base_url}" />', 1)
+    spacer = PARITY_SPACER if first_page_index % 2 else ""
+    return head + spacer + "".join(steps_html) + tail
+
+
+def iter_local_assets(html: str, base_path: Path) -> Iterator[Path]:
+    """Yields the local files referenced by a document, and by the stylesheets it uses."""
+    for reference in ASSET_REFERENCE_PATTERN.findall(html):
+        if "://" in reference or reference.startswith(("data:", "#")):
+            continue
+        asset_path = base_path.joinpath(reference)
+        yield asset_path
+
+        if asset_path.suffix == ".css" and asset_path.exists():
+            with open(asset_path, "r") as f:
+                yield from iter_local_assets(f.read(), asset_path.parent)
+
+
+class PDFGenerator:
+    def __init__(
+        self,
+        paper_format: str = "A4",
+        workers: int = 1,
+        shards: int | None = None,
+        shard_memory_mb: int | None = None,
+        cache_path: Path | None = None,
+        incremental: bool = False,
+        profiler: Profiler | None = None,
+        browser: Browser | None = None,
+    ):
+        self.paper_format = paper_format
+        self.profiler = profiler or Profiler()
+        # Browser kept open by the caller, which may share it with the generators of its thread
+        self.shared_browser = browser
+        self.workers = max(1, workers)
+        self.shards = shards or self.workers
+        self.shard_memory_mb = shard_memory_mb
+        self.cache_path = cache_path
+        self.incremental = incremental
+        self._playwright: Playwright | None = None
+        self._browser: Browser | None = None
+
+    def start(self):
+        """Launches a browser kept open to print the next PDFs in this process."""
+        self._playwright = sync_playwright().start()
+        self._browser = launch_browser(self._playwright, self.shard_memory_mb)
+
+    def stop(self):
+        if self._browser:
+            self._browser.close()
+            self._browser = None
+        if self._playwright:
+            self._playwright.stop()
+            self._playwright = None
+
+    def generate(self, html_file_path: Path, pdf_file_path: Path):
+        with self.profiler.span("pdf.generate", category="pdf"):
+            self._generate(html_file_path, pdf_file_path)
+
+    def _generate(self, html_file_path: Path, pdf_file_path: Path):
+        if self.incremental:
+            self._generate_incremental(html_file_path, pdf_file_path)
+            return
+
+        if self.shards > 1:
+            self._generate_sharded(html_file_path, pdf_file_path)
+            return
+
+        self._print([(html_file_path, pdf_file_path)])
+
+    def _generate_sharded(self, html_file_path: Path, pdf_file_path: Path):
+        """
+        Splits the book at step boundaries into shards of similar page count,
+        prints them concurrently in separate Chromium processes and merges the
+        resulting PDFs in order.
+        """
+        with open(html_file_path, "r") as f:
+            head, steps_html, tail = split_html_by_steps(f.read())
+
+        if len(steps_html) < 2:
+            self._print([(html_file_path, pdf_file_path)])
+            return
+
+        shards_path = (self.cache_path or html_file_path.parent).joinpath(SHARDS_DIRECTORY_NAME)
+        shutil.rmtree(shards_path, ignore_errors=True)
+        shards_path.mkdir(parents=True)
+
+        base_url = html_file_path.parent.as_uri() + "/"
+        jobs: List[Tuple[Path, Path]] = []
+        page_index = 0
+
+        for shard_index, shard_steps in enumerate(self._split_in_shards(steps_html)):
+            shard_html_path = shards_path.joinpath(f"shard_{shard_index:04d}.html")
+            with open(shard_html_path, "w") as f:
+                f.write(build_partial_html(head, shard_steps, tail, base_url, page_index))
+            jobs.append((shard_html_path, shards_path.joinpath(f"shard_{shard_index:04d}.pdf")))
+            page_index += sum(step_html.count(PAGE_CLASS) for step_html in shard_steps)
+
+        self._print_concurrently(jobs)
+
+        merge_pdfs([pdf_path for _, pdf_path in jobs], pdf_file_path, self.profiler)
+        shutil.rmtree(shards_path, ignore_errors=True)
+
+    def _generate_incremental(self, html_file_path: Path, pdf_file_path: Path):
+        """
+        Prints each step to its own PDF fragment, cached by a hash of the step
+        HTML and of the assets it references, and assembles the book from the
+        cached and freshly printed fragments.
+        """
+        with open(html_file_path, "r") as f:
+            head, steps_html, tail = split_html_by_steps(f.read())
+
+        fragments_path = (self.cache_path or html_file_path.parent).joinpath(
+            FRAGMENTS_DIRECTORY_NAME
+        )
+        fragments_path.mkdir(parents=True, exist_ok=True)
+
+        base_url = html_file_path.parent.as_uri() + "/"
+        jobs: List[Tuple[Path, Path]] = []
+        fragment_paths: List[Path] = []
+        printed_fragments: Set[Path] = set()
+        page_index = 0
+        # Content hash of each asset, hashed once for all the steps using it
+        asset_hashes: Dict[Path, str] = {}
+
+        for step_html in steps_html:
+            key = self._get_fragment_key(
+                head, step_html, tail, page_index % 2, html_file_path.parent, asset_hashes
+            )
+            fragment_path = fragments_path.joinpath(f"{key}.pdf")
+            fragment_paths.append(fragment_path)
+
+            if not fragment_path.exists() and fragment_path not in printed_fragments:
+                printed_fragments.add(fragment_path)
+                fragment_html_path = fragments_path.joinpath(f"{key}.html")
+                with open(fragment_html_path, "w") as f:
+                    f.write(build_partial_html(head, [step_html], tail, base_url, page_index))
+                jobs.append((fragment_html_path, fragment_path))
+
+            page_index += step_html.count(PAGE_CLASS)
+
+        if jobs:
+            print(f"ℹ️ Printing {len(jobs)} of {len(steps_html)} steps, reusing the others...")
+            self._print_concurrently(jobs)
+
+        merge_pdfs(fragment_paths, pdf_file_path, self.profiler)
+        self._remove_unused_fragments(fragments_path, {path.name for path in fragment_paths})
+
+    def _get_fragment_key(
+        self,
+        head: str,
+        step_html: str,
+        tail: str,
+        parity: int,
+        base_path: Path,
+        asset_hashes: Dict[Path, str],
+    ) -> str:
+        """
+        Hash of the step HTML and of the content of the assets it references,
+        so copying or touching an unchanged asset keeps its fragment.
+        """
+        digest = hashlib.sha256(
+            f"{self.paper_format}|{parity}|{head}|{step_html}|{tail}".encode()
+        )
+        for asset_path in sorted(set(iter_local_assets(head + step_html, base_path))):
+            if asset_path not in asset_hashes:
+                try:
+                    asset_hashes[asset_path] = hash_file(asset_path)
+                except (FileNotFoundError, IsADirectoryError):
+                    asset_hashes[asset_path] = "missing"
+            digest.update(f"{asset_path}|{asset_hashes[asset_path]}".encode())
+        return digest.hexdigest()
+
+    def _remove_unused_fragments(self, fragments_path: Path, used_fragments: Set[str]):
+        for filename in os.listdir(fragments_path):
+            if filename not in used_fragments:
+                fragments_path.joinpath(filename).unlink(missing_ok=True)
+
+    def _print(self, jobs: List[Tuple[Path, Path]]):
+        browser = self._browser or self.shared_browser
+        if browser:
+            print_pdfs_with_browser(browser, jobs, self.paper_format, self.profiler)
+        else:
+            print_pdfs(jobs, self.paper_format, self.shard_memory_mb, self.profiler)
+
+    def _print_concurrently(self, jobs: List[Tuple[Path, Path]]):
+        workers = min(self.workers, len(jobs))
+        if workers <= 1:
+            self._print(jobs)
+            return
+
+        profiler_origin = self.profiler.origin if self.profiler.enabled else None
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    print_pdfs_in_worker,
+                    jobs[i::workers],
+                    self.paper_format,
+                    self.shard_memory_mb,
+                    profiler_origin,
+                )
+                for i in range(workers)
+            ]
+            for future in futures:
+                self.profiler.merge(future.result())
+
+    def _split_in_shards(self, steps_html: List[str]) -> List[List[str]]:
+        """Groups consecutive steps into shards holding about the same number of pages."""
+        shard_count = min(self.shards, len(steps_html))
+        pages_by_step = [step_html.count(PAGE_CLASS) for step_html in steps_html]
+        pages_per_shard = sum(pages_by_step) / shard_count
+
+        shards: List[List[str]] = [[]]
+        printed_pages = 0
+        for i, (step_html, step_pages) in enumerate(zip(steps_html, pages_by_step)):
+            remaining_shards = shard_count - len(shards)
+            # Cut at the step boundary closest to the shard target
+            is_full = printed_pages + step_pages / 2 >= pages_per_shard * len(shards)
+            # Every shard gets at least one step
+            is_needed = len(steps_html) - i <= remaining_shards
+            if shards[-1] and remaining_shards and (is_full or is_needed):
+                shards.append([])
+            shards[-1].append(step_html)
+            printed_pages += step_pages
+
+        return shards
@@ -1,18 +1,77 @@
+from concurrent.futures import Future, ThreadPoolExecutor
 import json
 import os
 from pathlib import Path
 import shutil
-from typing import List
+from typing import Any, Dict, List, Tuple
+from file_sync import FileSyncManifest
 from models.photo import Photo
+from models.step import Step
 from models.trip import Trip
+from photo_metadata_cache import PhotoMetadataCache
+from profiler import Profiler
 
 
 PHOTOS_BY_PAGES_FILE_NAME = "photos_by_pages.txt"
 PHOTOS_MAPPING_FILE_NAME = "photos_mapping.json"
+# Version 1 was a bare {step_id: {index: photo}} dict without dimensions
+PHOTOS_MAPPING_VERSION = 2
 COVER_PHOTO_TEXT_IN_FILE = "Cover photo: "
 
 
+class StepPhotosLayout:
+    """Block of a step in the photos by pages file, with photos as mapping indices."""
+
+    def __init__(self, header: str):
+        self.header = header
+        self.cover_photo_index: str | None = None
+        self.pages: List[List[str]] = []
+
+    def get_photo_indexes(self) -> List[str]:
+        indexes = [photo_index for page in self.pages for photo_index in page]
+        if self.cover_photo_index:
+            indexes.append(self.cover_photo_index)
+        return indexes
+
+
+def parse_photos_by_pages(lines: List[str]) -> Dict[str, List[StepPhotosLayout]]:
+    """
+    Parses the photos by pages file in a single pass and indexes the step
+    blocks by their header line. Blocks are kept in file order for headers
+    appearing more than once.
+    """
+    layouts_by_header: Dict[str, List[StepPhotosLayout]] = {}
+    layout: StepPhotosLayout | None = None
+
+    for line in lines:
+        line = line.strip()
+
+        if not line:
+            layout = None
+        elif layout is None:
+            layout = StepPhotosLayout(line)
+            layouts_by_header.setdefault(line, []).append(layout)
+        elif line.startswith(COVER_PHOTO_TEXT_IN_FILE.strip()) and not layout.pages:
+            layout.cover_photo_index = line.removeprefix(COVER_PHOTO_TEXT_IN_FILE.strip()).strip()
+        else:
+            layout.pages.append(line.split())
+
+    return layouts_by_header
+
+
 class PhotoManager:
+    def __init__(
+        self,
+        workers: int = 1,
+        incremental_sync: bool = False,
+        metadata_cache: PhotoMetadataCache | None = None,
+        profiler: Profiler | None = None,
+    ):
+        self.workers = max(1, workers)
+        self.incremental_sync = incremental_sync
+        self.metadata_cache = metadata_cache
+        self.profiler = profiler or Profiler()
+
     def save_photos_pages(self, trip: Trip, save_path: Path):
         export_photos_mapping_json = {}
         export_line_by_line: List[str] = []
@@ -24,7 +83,7 @@ class PhotoManager:
             for photo in step.photos:
                 step_photos_mapping[photo.index] = photo.to_dict()
 
-            export_photos_mapping_json[step.id] = step_photos_mapping
+            export_photos_mapping_json[str(step.id)] = step_photos_mapping
 
             if step.cover_photo:
                 export_line_by_line.append(COVER_PHOTO_TEXT_IN_FILE + str(step.cover_photo.index))
@@ -38,7 +97,14 @@ class PhotoManager:
             save_path.joinpath(PHOTOS_MAPPING_FILE_NAME),
             "w",
         ) as f:
-            json.dump(export_photos_mapping_json, f, indent=4)
+            json.dump(
+                {
+                    "version": PHOTOS_MAPPING_VERSION,
+                    "steps": export_photos_mapping_json,
+                },
+                f,
+                indent=4,
+            )
 
         with open(
             save_path.joinpath(PHOTOS_BY_PAGES_FILE_NAME),
@@ -52,7 +118,11 @@ class PhotoManager:
                 save_path.joinpath(PHOTOS_MAPPING_FILE_NAME),
                 "r",
             ) as f:
-                return json.load(f)
+                photos_mapping = json.load(f)
+
+            if "version" not in photos_mapping:
+                return photos_mapping
+            return photos_mapping["steps"]
 
         except FileNotFoundError:
             print(
@@ -72,6 +142,10 @@ class PhotoManager:
             )
 
     def load_photos_pages(self, trip: Trip, save_path: Path):
+        with self.profiler.span("photos.layout", category="photos", steps=len(trip.steps)):
+            self._load_photos_pages(trip, save_path)
+
+    def _load_photos_pages(self, trip: Trip, save_path: Path):
         photos_mapping = self.get_photos_mapping_from_file(trip, save_path)
         photos_by_pages = self.get_photos_by_pages_from_file(trip, save_path)
 
@@ -79,77 +153,240 @@ class PhotoManager:
             trip.compute_default_photos_by_pages()
             return
 
-        for step in trip.steps:
-            line_index = None
+        layouts_by_header = parse_photos_by_pages(photos_by_pages)
+        # Steps sharing the same header line each report their own problems
+        problems_by_step: List[Tuple[str, List[str]]] = []
+        steps_with_default_layout: List[Step] = []
 
-            try:
-                line_index = (
-                    photos_by_pages.index(step.get_name_for_photos_by_pages_export())
-                    + 1
-                )
-            except ValueError:
-                print(
-                    f"ℹ️ Step '{step.get_name_for_photos_by_pages_export()}' is present in PolarSteps export but not in '{PHOTOS_BY_PAGES_FILE_NAME}' file. Using default layout..."
+        for step in trip.steps:
+            header = step.get_name_for_photos_by_pages_export()
+            # Steps sharing the same header line get the blocks in file order
+            layouts = layouts_by_header.get(header)
+            if not layouts:
+                problems_by_step.append(
+                    (
+                        header,
+                        [f"step is present in PolarSteps export but not in '{PHOTOS_BY_PAGES_FILE_NAME}' file"],
+                    )
                 )
-                step.compute_default_photos_by_pages()
+                steps_with_default_layout.append(step)
                 continue
 
-            # Handle cover photo
-            if photos_by_pages[line_index].startswith(COVER_PHOTO_TEXT_IN_FILE):
-                cover_photo_index = photos_by_pages[line_index].removeprefix(COVER_PHOTO_TEXT_IN_FILE)
-                step.cover_photo = Photo.from_dict(photos_mapping[str(step.id)][cover_photo_index])
-                line_index += 1
+            problems = self._apply_layout(
+                step, layouts.pop(0), photos_mapping.get(str(step.id), {})
+            )
+            if problems:
+                problems_by_step.append((header, problems))
+                steps_with_default_layout.append(step)
+
+        if problems_by_step:
+            print(
+                f"ℹ️ Found layout problems in '{PHOTOS_BY_PAGES_FILE_NAME}' file. Using default layout for these steps:"
+            )
+            for header, problems in problems_by_step:
+                print(f"  - '{header}': {'; '.join(problems)}")
 
-            while (
-                len(photos_by_pages) > line_index and photos_by_pages[line_index] != ""
-            ):
-                photo_indexes = photos_by_pages[line_index].split(" ")
+        for step in steps_with_default_layout:
+            step.cover_photo = None
+            step.compute_default_photos_by_pages()
 
-                photos_for_this_page = [
-                    Photo.from_dict(photos_mapping[str(step.id)][photo_index])
-                    for photo_index in photo_indexes
-                ]
+    def _apply_layout(
+        self,
+        step: Step,
+        layout: "StepPhotosLayout",
+        step_photos_mapping: Dict[str, Dict[str, Any]],
+    ) -> List[str]:
+        """Sets the step pages from its layout block and returns the problems found."""
+        # Pages reuse the photos loaded from the export, so each photo is a
+        # single object and is never probed again.
+        photos_by_id = {photo.id: photo for photo in step.photos}
+        problems: List[str] = []
+        step.cover_photo = None
 
-                step.photos_by_pages.append(photos_for_this_page)
+        unknown_indexes = [
+            photo_index
+            for photo_index in layout.get_photo_indexes()
+            if photo_index not in step_photos_mapping
+        ]
+        if unknown_indexes:
+            problems.append(f"unknown photo index(es) {', '.join(unknown_indexes)}")
 
-                line_index += 1
+        # The known indexes are still checked, to report all the problems at once
+        if layout.cover_photo_index in step_photos_mapping:
+            step.cover_photo = self._resolve_photo(
+                step_photos_mapping[layout.cover_photo_index], photos_by_id
+            )
 
-            # Check if all photos loaded from PolarSteps export are present in pages.
-            photos_not_in_pages = [
-                photo
-                for photo in step.photos
-                if not any(photo in page for page in step.photos_by_pages)
+        step.photos_by_pages = [
+            [
+                self._resolve_photo(step_photos_mapping[photo_index], photos_by_id)
+                for photo_index in page
+                if photo_index in step_photos_mapping
             ]
+            for page in layout.pages
+        ]
 
-            if step.cover_photo:
-                photos_not_in_pages.remove(step.cover_photo)
+        placed_photos = [photo for page in step.photos_by_pages for photo in page]
+        if step.cover_photo:
+            placed_photos.append(step.cover_photo)
+        placed_photos_set = set(placed_photos)
 
-            if photos_not_in_pages:
-                print(
-                    f"ℹ️ A photo is present in the PolarSteps export but not in '{PHOTOS_BY_PAGES_FILE_NAME}' file. Using default layout for the step '{step.get_name_for_photos_by_pages_export()}'..."
-                )
+        if len(placed_photos_set) != len(placed_photos):
+            problems.append("a photo is used more than once")
+
+        oversized_pages = [page for page in layout.pages if len(page) > 4]
+        if oversized_pages:
+            problems.append(f"{len(oversized_pages)} page(s) have more than 4 photos")
+
+        # Check if all photos loaded from PolarSteps export are present in pages.
+        photos_not_in_pages = set(step.photos) - placed_photos_set
+        if photos_not_in_pages:
+            missing_indexes = sorted(photo.index for photo in photos_not_in_pages)
+            problems.append(
+                f"photo(s) {', '.join(map(str, missing_indexes))} are present in the PolarSteps export but not in pages"
+            )
+
+        return problems
+
+    def get_photos(self, trip: Trip) -> Dict[str, List[Dict[str, Any]]]:
+        """Photos loaded for each step, by step id."""
+        return {str(step.id): [photo.to_dict() for photo in step.photos] for step in trip.steps}
+
+    def set_photos(self, trip: Trip, photos: Dict[str, List[Dict[str, Any]]]):
+        """Sets the photos returned by get_photos, without copying nor opening them."""
+        for step in trip.steps:
+            step.photos = [
+                Photo.from_dict(photo_data, self.metadata_cache)
+                for photo_data in photos.get(str(step.id), [])
+            ]
+
+    def get_layout(self, trip: Trip) -> Dict[str, Dict[str, Any]]:
+        """Cover photo and pages of each step, with the print versions of the photos."""
+
+        def get_photo_data(photo: Photo) -> Dict[str, Any]:
+            derivative_path = str(photo.derivative_path) if photo.derivative_path else None
+            return photo.to_dict() | {"derivative_path": derivative_path}
+
+        return {
+            str(step.id): {
+                "cover_photo": get_photo_data(step.cover_photo) if step.cover_photo else None,
+                "pages": [[get_photo_data(photo) for photo in page] for page in step.photos_by_pages],
+            }
+            for step in trip.steps
+        }
+
+    def set_layout(self, trip: Trip, layout: Dict[str, Dict[str, Any]]):
+        """Sets the layout returned by get_layout on the photos of the trip."""
+        for step in trip.steps:
+            step_layout = layout.get(str(step.id))
+            if step_layout is None:
+                step.cover_photo = None
                 step.compute_default_photos_by_pages()
+                continue
+
+            photos_by_id = {photo.id: photo for photo in step.photos}
+
+            def resolve(photo_data: Dict[str, Any]) -> Photo:
+                photo = self._resolve_photo(photo_data, photos_by_id)
+                derivative_path = photo_data.get("derivative_path")
+                photo.derivative_path = Path(derivative_path) if derivative_path else None
+                return photo
+
+            cover_photo_data = step_layout["cover_photo"]
+            step.cover_photo = resolve(cover_photo_data) if cover_photo_data else None
+            step.photos_by_pages = [
+                [resolve(photo_data) for photo_data in page] for page in step_layout["pages"]
+            ]
+
+    def _resolve_photo(
+        self, photo_data: Dict[str, Any], photos_by_id: Dict[str, Photo]
+    ) -> Photo:
+        photo = photos_by_id.get(photo_data.get("id", ""))
+        if photo:
+            return photo
+        # Photo not part of the export anymore: rely on the stored dimensions
+        return Photo.from_dict(photo_data, self.metadata_cache)
 
     def load_from_polarsteps_export(
         self, data_path: Path, output_path_for_photos: Path, trip: Trip
+    ):
+        with self.profiler.span("photos.ingest", category="photos") as span:
+            self._load_from_polarsteps_export(data_path, output_path_for_photos, trip)
+            span.add(steps=len(trip.steps), photos=sum(len(step.photos) for step in trip.steps))
+
+    def _load_from_polarsteps_export(
+        self, data_path: Path, output_path_for_photos: Path, trip: Trip
     ):
         output_path_for_photos.mkdir(parents=True, exist_ok=True)
 
         total_steps = len(trip.steps)
         num_digits_prefix = len(str(total_steps))
-        for step_num, step in enumerate(trip.steps, start=1):
-            photo_directory = data_path.joinpath(step.get_photo_directory_name())
-            prefix = str(step_num).zfill(num_digits_prefix) + "_"
-            if os.path.exists(photo_directory):
-                index = 1
-                for photo_filename in os.listdir(photo_directory):
-                    photo_path = photo_directory.joinpath(photo_filename)
-                    destination_path = output_path_for_photos.joinpath(prefix + photo_filename)
-                    shutil.copy(photo_path, destination_path)
-                    photo = Photo(
-                        id=photo_filename,
-                        index=index,
-                        path=destination_path,
+        manifest = (
+            FileSyncManifest(output_path_for_photos) if self.incremental_sync else None
+        )
+
+        # Copies and ratio probing run in a worker pool. Futures are kept in
+        # listing order so each step gets its photos back in the same order
+        # as a sequential run.
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending_steps: List[Tuple[Step, List[Future[Photo]]]] = []
+
+            for step_num, step in enumerate(trip.steps, start=1):
+                photo_directory = data_path.joinpath(step.get_photo_directory_name())
+                prefix = str(step_num).zfill(num_digits_prefix) + "_"
+                if not os.path.exists(photo_directory):
+                    continue
+
+                futures = [
+                    executor.submit(
+                        self._ingest_photo,
+                        photo_directory.joinpath(photo_filename),
+                        output_path_for_photos.joinpath(prefix + photo_filename),
+                        photo_filename,
+                        index,
+                        manifest,
                     )
-                    step.photos.append(photo)
-                    index += 1
+                    for index, photo_filename in enumerate(
+                        os.listdir(photo_directory), start=1
+                    )
+                ]
+                pending_steps.append((step, futures))
+
+            for step, futures in pending_steps:
+                step.photos.extend(future.result() for future in futures)
+
+        if manifest:
+            # Drops photos deleted from the export and photos of steps that are
+            # no longer selected with --step_ranges.
+            removed = manifest.remove_stale()
+            if removed:
+                print(f"ℹ️ Removed {removed} outdated photo(s) from '{output_path_for_photos}'.")
+            manifest.save()
+
+    def _ingest_photo(
+        self,
+        photo_path: Path,
+        destination_path: Path,
+        photo_id: str,
+        index: int,
+        manifest: FileSyncManifest | None,
+    ) -> Photo:
+        with self.profiler.span("photos.copy", category="photos", photos=1):
+            if manifest:
+                manifest.sync(photo_path, destination_path)
+            else:
+                # The destination may be a hardlink left by an incremental sync:
+                # copying onto it would write into the exported photo itself.
+                destination_path.unlink(missing_ok=True)
+                # Keeping the mtime keeps the metadata and derivative caches valid
+                shutil.copy2(photo_path, destination_path)
+        photo = Photo(
+            id=photo_id,
+            index=index,
+            path=destination_path,
+            metadata_cache=self.metadata_cache,
+        )
+        # Probe the dimensions while still in the worker
+        with self.profiler.span("photos.probe", category="photos", photos=1):
+            photo.metadata
+        return photo
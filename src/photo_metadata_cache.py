@@ -0,0 +1,75 @@
+import json
+import os
+from pathlib import Path
+import threading
+from typing import Any, Dict
+
+from models.photo import PhotoMetadata
+
+METADATA_CACHE_FILE_NAME = "photos_metadata_cache.json"
+
+
+class PhotoMetadataCache:
+    """
+    Persistent store of photo dimensions, EXIF orientation and ratio, keyed by
+    path and invalidated when the size or mtime of the file changes.
+    """
+
+    def __init__(self, cache_directory: Path) -> None:
+        self.cache_file = cache_directory.joinpath(METADATA_CACHE_FILE_NAME)
+        self.entries: Dict[str, Dict[str, Any]] = self._load_cache()
+        self._lock = threading.Lock()
+
+    def get(self, path: Path) -> PhotoMetadata:
+        """
+        Return the metadata of the photo at path, opening the image only when
+        it is not cached yet or when the file changed since it was cached.
+        """
+        key = str(path)
+        stat = os.stat(path)
+
+        with self._lock:
+            entry = self.entries.get(key)
+
+        if (
+            entry
+            and entry["size"] == stat.st_size
+            and entry["mtime_ns"] == stat.st_mtime_ns
+        ):
+            return PhotoMetadata.from_dict(entry)
+
+        metadata = PhotoMetadata.from_image(path)
+
+        with self._lock:
+            self.entries[key] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                **metadata.to_dict(),
+            }
+
+        return metadata
+
+    def _load_cache(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Load the cache from a JSON file if it exists, otherwise return an empty dictionary.
+        """
+        try:
+            with open(self.cache_file, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save(self) -> None:
+        """
+        Save the cache to a JSON file.
+        """
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.cache_file.with_name(self.cache_file.name + ".tmp")
+        with self._lock:
+            # Forget photos that were removed from the output directory
+            self.entries = {
+                key: entry for key, entry in self.entries.items() if os.path.exists(key)
+            }
+            with open(tmp_file, "w") as f:
+                json.dump(self.entries, f)
+        os.replace(tmp_file, self.cache_file)
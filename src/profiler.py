@@ -0,0 +1,181 @@
+import json
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Any, Dict, List, Set, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROC_SELF_IO_PATH = "/proc/self/io"
+
+
+def read_io_counters() -> Dict[str, int]:
+    """Bytes read and written by the process through system calls (Linux only)."""
+    try:
+        with open(PROC_SELF_IO_PATH, "r") as f:
+            counters = dict(line.split(": ") for line in f.read().splitlines())
+        return {"read_bytes": int(counters["rchar"]), "written_bytes": int(counters["wchar"])}
+    except (OSError, KeyError, ValueError):
+        return {}
+
+
+def get_peak_rss_kb() -> int | None:
+    if resource is None:
+        return None
+    # Kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Span:
+    """
+    Measures a block of code: wall time, CPU time of the thread and of the
+    process (and of its finished child processes, like Chromium), peak RSS and
+    bytes read and written. Process-wide measures include the work of the
+    spans running concurrently.
+    """
+
+    def __init__(self, profiler: "Profiler", name: str, category: str, args: Dict[str, Any]):
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def add(self, **counts: int):
+        """Adds to the item counts of the span."""
+        for key, count in counts.items():
+            self.args[key] = self.args.get(key, 0) + count
+
+    def __enter__(self) -> "Span":
+        self.io_start = read_io_counters()
+        self.times_start = os.times()
+        self.process_time_start = time.process_time()
+        self.thread_time_start = time.thread_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        thread_time = time.thread_time() - self.thread_time_start
+        process_time = time.process_time() - self.process_time_start
+        times = os.times()
+        io = read_io_counters()
+
+        self.args |= {
+            "cpu_ms": round(thread_time * 1000, 3),
+            "process_cpu_ms": round(process_time * 1000, 3),
+            "children_cpu_ms": round(
+                (
+                    times.children_user
+                    + times.children_system
+                    - self.times_start.children_user
+                    - self.times_start.children_system
+                )
+                * 1000,
+                3,
+            ),
+        }
+        for key, value in io.items():
+            self.args[key] = value - self.io_start.get(key, value)
+
+        peak_rss_kb = get_peak_rss_kb()
+        if peak_rss_kb is not None:
+            self.args["peak_rss_kb"] = peak_rss_kb
+
+        self.profiler.record(self, self.start, end)
+        return False
+
+
+class NullSpan:
+    def add(self, **counts: int):
+        pass
+
+    def __enter__(self) -> "NullSpan":
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class Profiler:
+    """
+    Collects spans into a trace in the Chrome trace event format, which can be
+    opened in chrome://tracing or https://ui.perfetto.dev. A disabled profiler
+    records nothing.
+    """
+
+    def __init__(self, enabled: bool = False, origin: float | None = None):
+        self.enabled = enabled
+        self.events: List[Dict[str, Any]] = []
+        # Processes sharing an origin share a timeline, perf_counter being system-wide on Linux
+        self.origin = time.perf_counter() if origin is None else origin
+        self._named_threads: Set[Tuple[int, int]] = set()
+        self._null_span = NullSpan()
+        self._lock = threading.Lock()
+
+    def span(self, name: str, category: str = "build", **args: Any) -> Span | NullSpan:
+        if not self.enabled:
+            return self._null_span
+        return Span(self, name, category, dict(args))
+
+    def record(self, span: Span, start: float, end: float):
+        event = {
+            "name": span.name,
+            "cat": span.category,
+            "ph": "X",
+            "ts": round((start - self.origin) * 1_000_000, 1),
+            "dur": round((end - start) * 1_000_000, 1),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": span.args,
+        }
+        with self._lock:
+            thread_key = (event["pid"], event["tid"])
+            if thread_key not in self._named_threads:
+                self._named_threads.add(thread_key)
+                self.events.append(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": event["pid"],
+                        "tid": event["tid"],
+                        "args": {"name": threading.current_thread().name},
+                    }
+                )
+            self.events.append(event)
+            if "peak_rss_kb" in span.args:
+                # Counter track of the memory high-water mark
+                self.events.append(
+                    {
+                        "name": "peak_rss_mb",
+                        "ph": "C",
+                        "ts": event["ts"] + event["dur"],
+                        "pid": event["pid"],
+                        "args": {"peak_rss_mb": round(span.args["peak_rss_kb"] / 1024, 1)},
+                    }
+                )
+
+    def reset(self):
+        """Drops the recorded events, to record the trace of another build."""
+        with self._lock:
+            self.events = []
+            self._named_threads = set()
+            self.origin = time.perf_counter()
+
+    def merge(self, events: List[Dict[str, Any]]):
+        """Adds the events recorded by the profiler of another process."""
+        with self._lock:
+            self.events.extend(events)
+
+    def save(self, trace_file_path: Path):
+        trace_file_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            events = list(self.events)
+
+        tmp_path = trace_file_path.with_name(trace_file_path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        os.replace(tmp_path, trace_file_path)
@@ -0,0 +1,210 @@
+import math
+import re
+from typing import List, Tuple
+
+PATH_DATA_PATTERN = re.compile(r'(<path\b[^>]*?\sd=")([^"]*)(")')
+PATH_TOKEN_PATTERN = re.compile(
+    r"[MmLlHhVvCcSsQqTtZzAa]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+)
+VIEWBOX_PATTERN = re.compile(r'viewBox="([^"]+)"')
+SCALE_PATTERN = re.compile(r"scale\(\s*([-+\d.eE]+)(?:[\s,]+([-+\d.eE]+))?\s*\)")
+PARAMETER_COUNTS = {"M": 2, "L": 2, "H": 1, "V": 1, "C": 6, "S": 4, "Q": 4, "T": 2, "Z": 0}
+
+Point = Tuple[float, float]
+# Absolute segment: ("M" | "L" | "C" | "Q" | "Z", points)
+Segment = Tuple[str, List[Point]]
+
+
+class UnsupportedPathError(ValueError):
+    pass
+
+
+def simplify_svg(svg: str, resolution: float) -> str:
+    """
+    Snaps the coordinates of the paths of an SVG to a grid of half the size
+    of a pixel, when the SVG is drawn `resolution` pixels wide, and drops the
+    segments and curve control points that become invisible at that size.
+    Paths using unsupported commands are left unchanged.
+    """
+    view_box = VIEWBOX_PATTERN.search(svg)
+    if not view_box or resolution <= 0:
+        return svg
+    _, _, width, height = map(float, view_box.group(1).replace(",", " ").split())
+
+    # Path coordinates are scaled by the transform of their group (potrace output)
+    scale = SCALE_PATTERN.search(svg)
+    scale_factor = abs(float(scale.group(1))) if scale else 1
+    tolerance = max(width, height) / resolution / 2 / scale_factor
+    grid = _get_grid_step(tolerance)
+
+    def simplify_match(match: re.Match) -> str:
+        try:
+            segments = _parse_path(match.group(2))
+        except UnsupportedPathError:
+            return match.group(0)
+        return match.group(1) + _format_path(segments, grid, tolerance) + match.group(3)
+
+    return PATH_DATA_PATTERN.sub(simplify_match, svg)
+
+
+def _get_grid_step(tolerance: float) -> float:
+    """Largest 1, 2 or 5 times a power of ten below the tolerance."""
+    magnitude = 10 ** math.floor(math.log10(tolerance))
+    return next(step * magnitude for step in (5, 2, 1) if step * magnitude <= tolerance)
+
+
+def _parse_path(path_data: str) -> List[Segment]:
+    """Converts path data to absolute segments, with S and T expanded and H and V as lines."""
+    tokens = PATH_TOKEN_PATTERN.findall(path_data)
+    segments: List[Segment] = []
+    current: Point = (0, 0)
+    subpath_start: Point = (0, 0)
+    previous_control: Point | None = None
+    command = ""
+    position = 0
+
+    while position < len(tokens):
+        if tokens[position].isalpha():
+            command = tokens[position]
+            position += 1
+        elif not command or command in "Zz":
+            raise UnsupportedPathError(path_data)
+        elif command == "M":
+            command = "L"
+        elif command == "m":
+            command = "l"
+
+        upper = command.upper()
+        if upper not in PARAMETER_COUNTS:
+            raise UnsupportedPathError(path_data)
+
+        count = PARAMETER_COUNTS[upper]
+        values = [float(value) for value in tokens[position : position + count]]
+        if len(values) < count:
+            raise UnsupportedPathError(path_data)
+        position += count
+
+        origin = current if command.islower() else (0, 0)
+        points = [
+            (origin[0] + values[i], origin[1] + values[i + 1]) for i in range(0, count - 1, 2)
+        ]
+        control: Point | None = None
+
+        if upper == "Z":
+            segments.append(("Z", []))
+            current = subpath_start
+        elif upper == "M":
+            segments.append(("M", points))
+            current = subpath_start = points[0]
+        elif upper in ("L", "H", "V"):
+            if upper == "H":
+                points = [(origin[0] + values[0], current[1])]
+            elif upper == "V":
+                points = [(current[0], (current[1] if command.islower() else 0) + values[0])]
+            segments.append(("L", points))
+            current = points[0]
+        elif upper in ("C", "S"):
+            if upper == "S":
+                points = [_reflect(previous_control, current)] + points
+            segments.append(("C", points))
+            control, current = points[1], points[2]
+        else:
+            if upper == "T":
+                points = [_reflect(previous_control, current)] + points
+            segments.append(("Q", points))
+            control, current = points[0], points[1]
+
+        previous_control = control
+
+    return segments
+
+
+def _reflect(control: Point | None, current: Point) -> Point:
+    if control is None:
+        return current
+    return (2 * current[0] - control[0], 2 * current[1] - control[1])
+
+
+def _format_path(segments: List[Segment], grid: float, tolerance: float) -> str:
+    """Formats absolute segments as relative commands on the grid, simplifying them."""
+    # Relative commands, with offsets counted in grid steps
+    commands: List[Tuple[str, List[Tuple[int, int]]]] = []
+    current = (0, 0)
+    subpath_start = (0, 0)
+
+    def snap(point: Point) -> Tuple[int, int]:
+        return (round(point[0] / grid), round(point[1] / grid))
+
+    def add(command: str, points: List[Tuple[int, int]]):
+        nonlocal current
+        offsets = [(x - current[0], y - current[1]) for x, y in points]
+        previous_command, previous_offsets = commands[-1] if commands else ("", [])
+
+        # Merge a line continuing the previous line in the same direction
+        if command == previous_command == "l":
+            (dx, dy), (previous_dx, previous_dy) = offsets[0], previous_offsets[0]
+            if dx * previous_dy == dy * previous_dx and dx * previous_dx + dy * previous_dy > 0:
+                previous_offsets[0] = (previous_dx + dx, previous_dy + dy)
+                current = points[-1]
+                return
+
+        commands.append((command, offsets))
+        if points:
+            current = points[-1]
+
+    for command, points in segments:
+        if command == "Z":
+            add("z", [])
+            current = subpath_start
+            continue
+
+        snapped = [snap(point) for point in points]
+        end = snapped[-1]
+
+        if command == "M":
+            add("m", snapped)
+            subpath_start = end
+            continue
+
+        controls = points[:-1]
+        if end == current and all(snap(point) == current for point in controls):
+            # The segment is smaller than the grid
+            continue
+
+        start = (current[0] * grid, current[1] * grid)
+        if command == "L" or all(
+            _distance_to_segment(point, start, points[-1]) <= tolerance for point in controls
+        ):
+            add("l", [end])
+        else:
+            add(command.lower(), snapped)
+
+    decimals = max(0, -math.floor(math.log10(grid)))
+    parts: List[str] = []
+    previous_command = ""
+    for command, offsets in commands:
+        values = " ".join(
+            f"{_format_number(dx * grid, decimals)} {_format_number(dy * grid, decimals)}"
+            for dx, dy in offsets
+        )
+        # Repeated commands can be omitted, except after a moveto
+        letter = "" if command == previous_command and command != "m" else command
+        parts.append(letter + values)
+        previous_command = command
+
+    return " ".join(parts)
+
+
+def _distance_to_segment(point: Point, start: Point, end: Point) -> float:
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    length = dx * dx + dy * dy
+    t = 0 if length == 0 else ((point[0] - start[0]) * dx + (point[1] - start[1]) * dy) / length
+    t = min(1, max(0, t))
+    return math.hypot(point[0] - start[0] - t * dx, point[1] - start[1] - t * dy)
+
+
+def _format_number(value: float, decimals: int) -> str:
+    formatted = f"{value:.{decimals}f}"
+    if "." in formatted:
+        formatted = formatted.rstrip("0").rstrip(".")
+    return "0" if formatted == "-0" else formatted
@@ -58,3 +58,14 @@ COUNTRIES = {
 }
 UNKNOWN_WEATHER = "Meteo inconnue"
 UNKNOWN_COUNTRY = "Pays inconnu"
+# Month names by language, as printed on the steps
+MONTHS = {
+    "en": [
+        "January", "February", "March", "April", "May", "June",
+        "July", "August", "September", "October", "November", "December",
+    ],
+    "fr": [
+        "janvier", "février", "mars", "avril", "mai", "juin",
+        "juillet", "août", "septembre", "octobre", "novembre", "décembre",
+    ],
+}
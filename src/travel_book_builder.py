@@ -0,0 +1,420 @@
+from contextlib import AbstractContextManager, nullcontext
+from pathlib import Path
+import time
+import traceback
+from typing import Any, Dict, List
+from jinja2 import Environment
+from playwright.sync_api import Browser
+
+from asset_bundler import AssetBundler
+from build_config import BuildConfig
+from build_graph import BuildGraph, Stage
+from constants import (
+    CACHE_DIRECTORY,
+    HTML_FILE_NAME,
+    PDF_FILE_NAME,
+    PROFILE_FILE_NAME,
+)
+from data_parser import DataParser
+from derivative_manager import DerivativeManager
+from elevation_api import ElevationAPI
+from elevation_providers import ElevationProvider, LocalDEMProvider, OpenTopoDataProvider
+from file_watcher import FileWatcher
+from html_generator import MAPS_DIRECTORY, HTMLGenerator
+from map_manager import COUNTRY_BOUNDING_BOXES_PATH, MapManager
+from models.trip import Trip
+from pdf_generator import PDFGenerator, iter_local_assets
+from photo_manager import PHOTOS_BY_PAGES_FILE_NAME, PHOTOS_MAPPING_FILE_NAME, PhotoManager
+from photo_metadata_cache import PhotoMetadataCache
+from profiler import Profiler
+
+WATCH_INTERVAL_IN_SECONDS = 1
+PHOTOS_DIRECTORY = "assets/images/photos"
+DERIVATIVES_DIRECTORY = "assets/images/derivatives"
+
+
+class TravelBookBuilder:
+    """
+    Runs the pipeline generating the travel book as a graph of stages, skipping
+    the stages whose inputs did not change since their last run. The parsed
+    trip, the photo metadata, the Jinja environment and, in watch mode, the
+    browser are kept between builds.
+
+    The read-only resources and the caches of maps and elevations may be
+    shared by the builders of several trips (see BatchBuilder), printing
+    the PDF only when a slot of browser_slots is free. A Playwright browser
+    is bound to the thread which launched it: a browser passed to the builder
+    must only be used by builds running in that thread.
+    """
+
+    def __init__(
+        self,
+        config: BuildConfig,
+        shared_cache_path: Path | None = None,
+        map_manager: MapManager | None = None,
+        templates_env: Environment | None = None,
+        elevation_provider: ElevationProvider | None = None,
+        browser: Browser | None = None,
+        browser_slots: AbstractContextManager | None = None,
+        profiler: Profiler | None = None,
+    ):
+        self.config = config
+        self.data_path = config.data_path
+        self.output_path = output_path = config.output_path
+        self.cache_path = output_path.joinpath(CACHE_DIRECTORY)
+        # Caches of downloaded data, which the builders of several trips may share
+        self.shared_cache_path = shared_cache_path or self.cache_path
+        self.elevation_cache_path = shared_cache_path or output_path
+        self.photos_path = output_path.joinpath(PHOTOS_DIRECTORY)
+        self.derivatives_path = output_path.joinpath(DERIVATIVES_DIRECTORY)
+        self.maps_path = output_path.joinpath(MAPS_DIRECTORY)
+        self.html_file_path = output_path.joinpath(HTML_FILE_NAME)
+        self.pdf_file_path = output_path.joinpath(PDF_FILE_NAME)
+        self.elevation_provider = elevation_provider
+        self.browser_slots = browser_slots or nullcontext()
+
+        # A shared map manager or elevation provider records to the profiler they were given
+        self.profiler = profiler or Profiler(enabled=config.profile)
+        self.html_generator = HTMLGenerator(
+            incremental_sync=config.incremental_sync,
+            cache_path=self.cache_path,
+            inline_maps=config.inline_maps,
+            offline=config.offline,
+            language=config.language,
+            profiler=self.profiler,
+            env=templates_env,
+        )
+        self.asset_bundler = AssetBundler(
+            cache_path=self.shared_cache_path.joinpath("bundle"),
+            flags_directory=config.flags_directory,
+        )
+        self.map_manager = map_manager or MapManager(
+            cache_path=self.shared_cache_path,
+            simplify_dpi=config.dpi if config.simplify_maps else None,
+            profiler=self.profiler,
+        )
+        self.pdf_generator = PDFGenerator(
+            paper_format=config.paper_format,
+            workers=config.pdf_workers,
+            shards=config.pdf_shards,
+            shard_memory_mb=config.pdf_shard_memory_mb,
+            cache_path=self.cache_path,
+            incremental=config.incremental_pdf,
+            profiler=self.profiler,
+            browser=browser,
+        )
+        self.photo_metadata_cache = PhotoMetadataCache(cache_directory=output_path)
+        self.photo_manager = PhotoManager(
+            workers=config.workers,
+            incremental_sync=config.incremental_sync,
+            metadata_cache=self.photo_metadata_cache,
+            profiler=self.profiler,
+        )
+        self.build_graph = BuildGraph(cache_path=self.cache_path, profiler=self.profiler)
+        self.trip: Trip | None = None
+        self.elevation_api: ElevationAPI | None = None
+
+    def build(self):
+        try:
+            with self.profiler.span("build"):
+                self.build_graph.run(self.get_stages())
+        finally:
+            # The trace grows with each build in watch mode
+            if self.profiler.enabled:
+                self.profiler.save(self.output_path.joinpath(PROFILE_FILE_NAME))
+                print(f"ℹ️ Profile written to '{self.output_path.joinpath(PROFILE_FILE_NAME)}'")
+
+    def close(self):
+        """Closes the elevation cache opened by the builds."""
+        if self.elevation_api:
+            self.elevation_api.close()
+            self.elevation_api = None
+
+    def get_stages(self) -> List[Stage]:
+        """
+        Stages of the build, with the files and options their result depends
+        on. Photos, elevations and maps only depend on the parsed trip, so
+        they run concurrently.
+        """
+        config = self.config
+        html_file_path = self.html_file_path
+
+        stages = [
+            Stage(
+                "parse",
+                self.parse_trip,
+                inputs=lambda: [self.data_path.joinpath("trip.json")],
+                params=lambda: sorted(config.step_indices or []),
+                # The parsed trip is not stored, only kept in memory
+                cacheable=False,
+            ),
+            Stage(
+                "photos",
+                self.load_photos,
+                dependencies=["parse"],
+                inputs=lambda: [
+                    self.data_path.joinpath(step.get_photo_directory_name())
+                    for step in self.trip.steps
+                ],
+                outputs=lambda: [self.photos_path],
+                apply=lambda photos: self.photo_manager.set_photos(self.trip, photos),
+            ),
+            Stage(
+                "layout",
+                self.load_layout,
+                dependencies=["photos"],
+                inputs=lambda: [
+                    self.output_path.joinpath(PHOTOS_BY_PAGES_FILE_NAME),
+                    self.output_path.joinpath(PHOTOS_MAPPING_FILE_NAME),
+                ],
+                params=lambda: {
+                    "no_derivatives": config.no_derivatives,
+                    "paper_format": config.paper_format,
+                    "dpi": config.dpi,
+                },
+                outputs=lambda: [self.output_path.joinpath(PHOTOS_BY_PAGES_FILE_NAME)]
+                + ([] if config.no_derivatives else [self.derivatives_path]),
+                apply=lambda layout: self.photo_manager.set_layout(self.trip, layout),
+            ),
+            Stage(
+                "elevations",
+                self.fetch_elevations,
+                dependencies=["parse"],
+                inputs=lambda: (
+                    [config.elevation_dem_directory] if config.elevation_dem_directory else []
+                ),
+                params=lambda: {"cache_tolerance": config.elevation_cache_tolerance_m},
+                apply=lambda result: self._set_elevations(result["elevations"]),
+                # Elevations missing after an API error are fetched again next time,
+                # unlike those the provider has no data for
+                is_complete=lambda result: not result["failed_steps"],
+            ),
+            Stage(
+                "maps",
+                self.prepare_maps,
+                dependencies=["parse"],
+                inputs=lambda: [COUNTRY_BOUNDING_BOXES_PATH],
+                params=lambda: {"simplify_maps": config.simplify_maps, "dpi": config.dpi},
+                outputs=lambda: [
+                    self.maps_path.joinpath(f"{country_code}.svg")
+                    for country_code in {step.country_code.lower() for step in self.trip.steps}
+                    if country_code != "00"
+                ],
+                apply=self._set_positions,
+            ),
+            Stage(
+                "html",
+                self.generate_html,
+                dependencies=["layout", "elevations", "maps"],
+                inputs=lambda: [
+                    HTMLGenerator.TEMPLATES_PATH,
+                    HTMLGenerator.CURRENT_FILE_PATH.parent.joinpath("assets"),
+                ]
+                + ([self.maps_path] if config.inline_maps else [])
+                + ([config.flags_directory] if config.offline and config.flags_directory else []),
+                params=lambda: {
+                    "inline_maps": config.inline_maps,
+                    "offline": config.offline,
+                    "language": config.language,
+                },
+                outputs=lambda: [html_file_path],
+            ),
+        ]
+
+        if not config.no_pdf:
+            stages.append(
+                Stage(
+                    "pdf",
+                    self.generate_pdf,
+                    dependencies=["html"],
+                    inputs=lambda: [html_file_path, *self._get_html_assets(html_file_path)],
+                    params=lambda: {"paper_format": config.paper_format},
+                    outputs=lambda: [self.pdf_file_path],
+                    # The browser kept open by watch mode or a batch worker is
+                    # bound to the thread which launched it
+                    inline=True,
+                )
+            )
+
+        return stages
+
+    def parse_trip(self):
+        self.trip = DataParser().load(self.data_path, self.config.step_indices)
+
+    def load_photos(self) -> Dict[str, List[Dict[str, Any]]]:
+        self.photo_manager.load_from_polarsteps_export(self.data_path, self.photos_path, self.trip)
+        return self.photo_manager.get_photos(self.trip)
+
+    def load_layout(self) -> Dict[str, Dict[str, Any]]:
+        self.photo_manager.load_photos_pages(self.trip, self.output_path)
+        self.photo_manager.save_photos_pages(self.trip, self.output_path)
+        self.photo_metadata_cache.save()
+
+        # Resize photos for print
+        if not self.config.no_derivatives:
+            derivative_manager = DerivativeManager(
+                self.derivatives_path,
+                paper_format=self.config.paper_format,
+                dpi=self.config.dpi,
+                workers=self.config.workers,
+            )
+            with self.profiler.span("derivatives.generate", category="photos"):
+                derivative_manager.generate(self.trip)
+
+        return self.photo_manager.get_layout(self.trip)
+
+    def fetch_elevations(self) -> Dict[str, Any]:
+        locations = [step.get_lat_lon_as_tuple() for step in self.trip.steps]
+        elevations, failed_indexes = self._get_elevation_api().get_elevation_with_failures(
+            locations
+        )
+        self._set_elevations(elevations)
+        return {"elevations": elevations, "failed_steps": len(failed_indexes)}
+
+    def _get_elevation_api(self) -> ElevationAPI:
+        # Opened once per builder, so watch mode reuses its cache connection and rate limits
+        if self.elevation_api is None:
+            dem_directory = self.config.elevation_dem_directory
+            provider = self.elevation_provider or (
+                LocalDEMProvider(dem_directory, profiler=self.profiler)
+                if dem_directory
+                else OpenTopoDataProvider(profiler=self.profiler)
+            )
+            self.elevation_api = ElevationAPI(
+                cache_directory=self.elevation_cache_path,
+                provider=provider,
+                cache_tolerance_in_meters=self.config.elevation_cache_tolerance_m,
+                profiler=self.profiler,
+            )
+        return self.elevation_api
+
+    def _set_elevations(self, elevations: List[float | None]):
+        for step, elevation in zip(self.trip.steps, elevations):
+            if elevation is not None:
+                step.elevation = int(elevation)
+
+    def prepare_maps(self) -> List[tuple[float, float] | None]:
+        self.map_manager.download_maps_from_trip(self.trip, self.maps_path)
+
+        positions = self.map_manager.calculate_position_percentages(self.trip.steps)
+        self._set_positions(positions)
+        return positions
+
+    def _set_positions(self, positions: List[tuple[float, float] | None]):
+        for step, position_percentage in zip(self.trip.steps, positions):
+            step.position_percentage = tuple(position_percentage) if position_percentage else None
+
+    def generate_html(self):
+        self.html_generator.generate(self.trip, self.html_file_path)
+
+        # Flags and fonts are reduced to the content of the generated book
+        if self.config.offline:
+            with self.profiler.span("html.bundle_assets", category="html"):
+                self.asset_bundler.bundle(
+                    self.trip,
+                    self.html_file_path,
+                    self.output_path.joinpath("assets/fonts"),
+                )
+
+    def generate_pdf(self):
+        if not self.config.no_pdf:
+            # Waits for a free browser when trips are built concurrently
+            with self.browser_slots:
+                self.pdf_generator.generate(self.html_file_path, self.pdf_file_path)
+
+    def _get_html_assets(self, html_file_path: Path) -> List[Path]:
+        try:
+            with open(html_file_path, "r") as f:
+                return sorted(set(iter_local_assets(f.read(), html_file_path.parent)))
+        except FileNotFoundError:
+            return []
+
+    def watch(self):
+        """
+        Builds the travel book, then rebuilds it each time the trip, the
+        photos layout or the templates change. Only the stages depending on
+        the changed files run again.
+        """
+        if not self.config.no_pdf:
+            self.pdf_generator.start()
+
+        try:
+            self.build()
+            print("✅ Travel book has been successfully generated !")
+
+            watcher = FileWatcher(
+                {
+                    "trip": [self.data_path.joinpath("trip.json")],
+                    "layout": [self.output_path.joinpath(PHOTOS_BY_PAGES_FILE_NAME)],
+                    "templates": [
+                        HTMLGenerator.TEMPLATES_PATH,
+                        HTMLGenerator.CURRENT_FILE_PATH.parent.joinpath("assets"),
+                    ],
+                }
+            )
+            print("👀 Watching for changes. Press Ctrl+C to stop.")
+
+            while True:
+                time.sleep(WATCH_INTERVAL_IN_SECONDS)
+                changed_groups = watcher.poll()
+                if not changed_groups:
+                    continue
+
+                try:
+                    self._rebuild(changed_groups)
+                    print("✅ Travel book has been successfully updated !")
+                except Exception:
+                    # Files may be saved while only partially edited: keep watching
+                    traceback.print_exc()
+
+                # Ignore the files written by the build itself
+                watcher.reset()
+
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.pdf_generator.stop()
+            self.close()
+
+    def _rebuild(self, changed_groups: set[str]):
+        if "trip" in changed_groups:
+            print("ℹ️ Trip data changed. Rebuilding the travel book...")
+        elif "layout" in changed_groups:
+            print(f"ℹ️ '{PHOTOS_BY_PAGES_FILE_NAME}' changed. Updating the photos layout...")
+        else:
+            print("ℹ️ Templates changed. Updating the travel book...")
+
+        # The build graph only runs the stages depending on the changed files
+        self.build()
+
+
+def build_travel_book(
+    config: BuildConfig,
+    shared_cache_path: Path | None = None,
+    map_manager: MapManager | None = None,
+    templates_env: Environment | None = None,
+    elevation_provider: ElevationProvider | None = None,
+    browser_slots: AbstractContextManager | None = None,
+    profiler: Profiler | None = None,
+) -> Path:
+    """
+    Builds the travel book of config and returns the path of the PDF, or of
+    the HTML file without PDF. Builds share no global state, so a process may
+    run several of them in threads, passing the same resources to all of them
+    to load the templates or the country data only once. Each build launches
+    its own browser, Playwright browsers being bound to their thread.
+    """
+    builder = TravelBookBuilder(
+        config,
+        shared_cache_path=shared_cache_path,
+        map_manager=map_manager,
+        templates_env=templates_env,
+        elevation_provider=elevation_provider,
+        browser_slots=browser_slots,
+        profiler=profiler,
+    )
+    try:
+        builder.build()
+    finally:
+        builder.close()
+    return builder.html_file_path if config.no_pdf else builder.pdf_file_path
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The modules of src import each other as top-level modules, like src/main.py does
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.joinpath("src")))
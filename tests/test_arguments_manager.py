@@ -0,0 +1,19 @@
+from pathlib import Path
+
+from arguments_manager import ArgumentManager
+from build_config import BuildConfig
+
+
+def test_default_arguments_build_the_default_config():
+    assert vars(ArgumentManager([]).get_build_config()) == vars(BuildConfig())
+
+
+def test_arguments_are_passed_to_the_config():
+    config = ArgumentManager(
+        ["--dpi", "150", "--pdf_workers", "2", "--step_ranges", "1-3", "--flags_directory", "flags"]
+    ).get_build_config()
+
+    assert config.dpi == 150
+    assert config.pdf_workers == 2
+    assert config.step_indices == {1, 2, 3}
+    assert config.flags_directory == Path("flags")
@@ -0,0 +1,55 @@
+import multiprocessing
+
+import pytest
+
+from batch_builder import BatchBuilder, BatchTrip, BrowserSlots, read_batch_file
+from build_config import BuildConfig
+
+
+def test_read_batch_file(tmp_path):
+    batch_file_path = tmp_path.joinpath("trips.txt")
+    batch_file_path.write_text(
+        "# Trips of 2024\n"
+        "\n"
+        "exports/japan books/japan\n"
+        '"exports/new zealand" /books/nz\n'
+    )
+
+    trips = read_batch_file(batch_file_path)
+
+    assert [(trip.data_path, trip.output_path) for trip in trips] == [
+        (tmp_path.joinpath("exports/japan"), tmp_path.joinpath("books/japan")),
+        (tmp_path.joinpath("exports/new zealand"), tmp_path.joinpath("/books/nz")),
+    ]
+
+
+def test_read_batch_file_reports_invalid_lines(tmp_path):
+    batch_file_path = tmp_path.joinpath("trips.txt")
+    batch_file_path.write_text("exports/japan\n")
+
+    with pytest.raises(ValueError, match="Line 1"):
+        read_batch_file(batch_file_path)
+
+
+def test_browser_slots_take_a_slot_per_chromium_process():
+    context = multiprocessing.get_context()
+    semaphore = context.Semaphore(3)
+    browser_slots = BrowserSlots(semaphore, context.Lock(), 2)
+
+    with browser_slots:
+        assert semaphore.acquire(block=False)
+        assert not semaphore.acquire(block=False)
+        semaphore.release()
+
+    for _ in range(3):
+        assert semaphore.acquire(block=False)
+
+
+def test_pdf_workers_are_limited_by_max_browsers(tmp_path):
+    config = BuildConfig(pdf_workers=4, dpi=150)
+
+    batch_builder = BatchBuilder(config, [BatchTrip(tmp_path, tmp_path)], max_browsers=2)
+
+    assert batch_builder.config.pdf_workers == 2
+    assert batch_builder.config.dpi == 150
+    assert config.pdf_workers == 4
@@ -0,0 +1,31 @@
+from pathlib import Path
+
+import pytest
+
+from build_config import BuildConfig, parse_step_ranges
+
+
+def test_parse_step_ranges():
+    assert parse_step_ranges("1-3,7,10-11") == {1, 2, 3, 7, 10, 11}
+
+
+@pytest.mark.parametrize(
+    "locale, language", [("fr_FR.UTF-8", "fr"), ("en_US.UTF-8", "en"), ("en_GB", "en"), ("fr", "fr")]
+)
+def test_language_of_the_locale(locale, language):
+    assert BuildConfig(locale=locale).language == language
+
+
+def test_unsupported_locale_is_an_error():
+    with pytest.raises(ValueError, match="Unsupported locale"):
+        BuildConfig(locale="de_DE.UTF-8")
+
+
+def test_with_paths_keeps_the_other_options():
+    config = BuildConfig(step_indices={1}, locale="en_US.UTF-8", dpi=150)
+
+    other = config.with_paths(Path("export"), Path("book"))
+
+    assert (other.data_path, other.output_path) == (Path("export"), Path("book"))
+    assert (other.step_indices, other.locale, other.dpi) == ({1}, "en_US.UTF-8", 150)
+    assert config.data_path != Path("export")
@@ -0,0 +1,179 @@
+import json
+import threading
+
+import pytest
+
+from build_graph import BUILD_GRAPH_FILE_NAME, BUILD_GRAPH_VERSION, BuildGraph, Stage
+
+
+class Recorder:
+    """Stage functions counting their runs and the results they replay."""
+
+    def __init__(self):
+        self.runs = []
+        self.applied = []
+
+    def stage(self, name, result=None, **kwargs):
+        def run():
+            self.runs.append(name)
+            return result
+
+        return Stage(name, run, apply=self.applied.append, **kwargs)
+
+
+def run_graph(cache_path, stages):
+    BuildGraph(cache_path).run(stages)
+
+
+def test_unchanged_stage_is_skipped_and_its_result_replayed(tmp_path):
+    input_path = tmp_path.joinpath("input.txt")
+    input_path.write_text("a")
+    recorder = Recorder()
+
+    for _ in range(2):
+        run_graph(tmp_path, [recorder.stage("parse", result=[1, 2], inputs=lambda: [input_path])])
+
+    assert recorder.runs == ["parse"]
+    assert recorder.applied == [[1, 2]]
+
+
+def test_changed_input_params_or_missing_output_run_the_stage_again(tmp_path):
+    input_path = tmp_path.joinpath("input.txt")
+    output_path = tmp_path.joinpath("output.txt")
+    input_path.write_text("a")
+    runs = []
+    params = {"dpi": 300}
+
+    def run():
+        runs.append("stage")
+        output_path.write_text("")
+
+    def stages():
+        return [
+            Stage(
+                "stage",
+                run,
+                inputs=lambda: [input_path],
+                params=lambda: dict(params),
+                outputs=lambda: [output_path],
+            )
+        ]
+
+    run_graph(tmp_path, stages())
+    input_path.write_text("b")
+    run_graph(tmp_path, stages())
+    params["dpi"] = 150
+    run_graph(tmp_path, stages())
+    output_path.unlink()
+    run_graph(tmp_path, stages())
+    run_graph(tmp_path, stages())
+
+    assert runs == ["stage"] * 4
+
+
+def test_dependent_stage_runs_again_when_its_dependency_ran(tmp_path):
+    trip_path = tmp_path.joinpath("trip.json")
+    templates_path = tmp_path.joinpath("template.html")
+    recorder = Recorder()
+
+    def stages():
+        return [
+            recorder.stage("parse", inputs=lambda: [trip_path]),
+            recorder.stage("maps", dependencies=["parse"]),
+            recorder.stage("html", dependencies=["maps"], inputs=lambda: [templates_path]),
+        ]
+
+    trip_path.write_text("a")
+    templates_path.write_text("a")
+    run_graph(tmp_path, stages())
+    templates_path.write_text("b")
+    run_graph(tmp_path, stages())
+    trip_path.write_text("b")
+    run_graph(tmp_path, stages())
+
+    assert recorder.runs == ["parse", "maps", "html", "html", "parse", "maps", "html"]
+
+
+def test_incomplete_result_is_not_stored(tmp_path):
+    recorder = Recorder()
+
+    for _ in range(2):
+        run_graph(
+            tmp_path,
+            [
+                recorder.stage(
+                    "elevations",
+                    result={"failed_steps": 1},
+                    is_complete=lambda result: not result["failed_steps"],
+                )
+            ],
+        )
+
+    assert recorder.runs == ["elevations", "elevations"]
+
+
+def test_non_cacheable_stage_is_only_skipped_within_the_same_graph(tmp_path):
+    recorder = Recorder()
+    graph = BuildGraph(tmp_path)
+    stages = [recorder.stage("parse", cacheable=False)]
+
+    graph.run(stages)
+    graph.run(stages)
+    BuildGraph(tmp_path).run(stages)
+
+    assert recorder.runs == ["parse", "parse"]
+
+
+def test_state_of_another_version_is_dropped(tmp_path):
+    recorder = Recorder()
+    run_graph(tmp_path, [recorder.stage("parse", result=[1])])
+
+    state_path = tmp_path.joinpath(BUILD_GRAPH_FILE_NAME)
+    state = json.loads(state_path.read_text())
+    assert state["version"] == BUILD_GRAPH_VERSION
+    state["version"] = BUILD_GRAPH_VERSION - 1
+    state_path.write_text(json.dumps(state))
+    run_graph(tmp_path, [recorder.stage("parse", result=[1])])
+
+    assert recorder.runs == ["parse", "parse"]
+
+
+def test_cyclic_dependencies_are_an_error(tmp_path):
+    recorder = Recorder()
+
+    with pytest.raises(ValueError, match="cyclic"):
+        run_graph(
+            tmp_path,
+            [
+                recorder.stage("a", dependencies=["b"]),
+                recorder.stage("b", dependencies=["a"]),
+            ],
+        )
+
+
+class ThreadBound:
+    """Stands for a Playwright browser, only usable by the thread which created it."""
+
+    def __init__(self):
+        self.thread_id = threading.get_ident()
+
+    def use(self):
+        if threading.get_ident() != self.thread_id:
+            raise RuntimeError("Cannot switch to a different thread")
+
+
+def test_inline_stage_runs_in_the_thread_running_the_graph(tmp_path):
+    browser = ThreadBound()
+    recorder = Recorder()
+
+    run_graph(
+        tmp_path,
+        [
+            recorder.stage("parse"),
+            recorder.stage("html", dependencies=["parse"]),
+            Stage("pdf", browser.use, dependencies=["html"], cacheable=False, inline=True),
+            recorder.stage("report", dependencies=["pdf"]),
+        ],
+    )
+
+    assert recorder.runs == ["parse", "html", "report"]
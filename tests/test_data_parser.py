@@ -0,0 +1,74 @@
+import io
+import json
+
+import pytest
+
+from data_parser import READ_CHUNK_SIZE, DataParser, JSONStreamReader
+
+
+def create_step(index: int):
+    return {
+        "id": index,
+        "slug": f"step-{index}",
+        "display_name": f"Step {index}",
+        "description": "",
+        "start_time": 1_700_000_000 + index * 86_400,
+        "weather_condition": "rain",
+        "weather_temperature": 10,
+        "location": {"detail": "France", "country_code": "FR", "lat": 45.0, "lon": 6.0},
+    }
+
+
+def write_trip(trip_path, steps):
+    trip_path.mkdir(parents=True, exist_ok=True)
+    trip = {
+        "id": 1,
+        "name": "Trip",
+        "start_date": 1_700_000_000,
+        "end_date": None,
+        "summary": {"ignored": [1, 2, 3]},
+        "all_steps": steps,
+    }
+    trip_path.joinpath("trip.json").write_text(json.dumps(trip))
+
+
+def test_stream_reader_reads_values_spanning_chunks():
+    text = json.dumps({"a": "x" * (READ_CHUNK_SIZE + 10), "b": [1, 2.5, None], "c": 12345})
+    reader = JSONStreamReader(io.StringIO(text))
+    values = {}
+
+    for key in reader.iter_object():
+        values[key] = reader.read_value()
+
+    assert values == json.loads(text)
+
+
+def test_stream_reader_iterates_arrays():
+    reader = JSONStreamReader(io.StringIO(' [ {"a": 1} , [] , 3 ] '))
+
+    assert [reader.read_value() for _ in reader.iter_array()] == [{"a": 1}, [], 3]
+
+
+def test_stream_reader_reports_invalid_json(tmp_path):
+    file_path = tmp_path.joinpath("trip.json")
+    file_path.write_text('{"a" 1}')
+
+    with open(file_path, "r") as f:
+        reader = JSONStreamReader(f)
+        with pytest.raises(ValueError, match="expected ':'"):
+            list(reader.iter_object())
+
+
+def test_load_builds_only_the_selected_steps(tmp_path):
+    write_trip(tmp_path, [create_step(index) for index in range(1, 6)])
+
+    trip = DataParser().load(tmp_path, step_indices={2, 4})
+
+    assert trip.name == "Trip"
+    assert [step.id for step in trip.steps] == [2, 4]
+
+
+def test_load_builds_all_steps_without_selection(tmp_path):
+    write_trip(tmp_path, [create_step(index) for index in range(1, 4)])
+
+    assert len(DataParser().load(tmp_path).steps) == 3
@@ -0,0 +1,33 @@
+import json
+
+from elevation_cache import LEGACY_CACHE_FILE_NAME, ElevationCache
+
+
+def test_exact_location_is_found_without_tolerance(tmp_path):
+    cache = ElevationCache(tmp_path)
+    cache.set_many([(45.0, 6.0, 1200.0), (45.1, 6.0, None)])
+
+    assert cache.get_many([(45.0, 6.0), (45.1, 6.0), (45.2, 6.0)]) == {0: 1200.0, 1: None}
+    cache.close()
+
+
+def test_closest_point_within_the_tolerance_is_reused(tmp_path):
+    cache = ElevationCache(tmp_path, tolerance_in_meters=100)
+    # At 60° of latitude a degree of longitude is half a degree of latitude:
+    # the first point is about 39 m away, the second one about 67 m
+    cache.set_many([(60.0, 10.0007, 1.0), (60.0006, 10.0, 2.0), (60.01, 10.0, 3.0)])
+
+    assert cache.get_many([(60.0, 10.0), (60.01, 10.01)]) == {0: 1.0}
+    cache.close()
+
+
+def test_legacy_cache_is_imported_once(tmp_path):
+    legacy_cache_path = tmp_path.joinpath(LEGACY_CACHE_FILE_NAME)
+    legacy_cache_path.write_text(json.dumps({"45.0,6.0": 1200.0}))
+
+    cache = ElevationCache(tmp_path)
+
+    assert cache.get_many([(45.0, 6.0)]) == {0: 1200.0}
+    assert not legacy_cache_path.exists()
+    assert tmp_path.joinpath(LEGACY_CACHE_FILE_NAME + ".imported").exists()
+    cache.close()
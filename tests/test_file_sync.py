@@ -0,0 +1,44 @@
+import os
+
+from file_sync import FileSyncManifest
+
+
+def test_unchanged_files_are_skipped_and_stale_files_removed(tmp_path):
+    source_path = tmp_path.joinpath("source")
+    output_path = tmp_path.joinpath("output")
+    source_path.mkdir()
+    output_path.mkdir()
+    for name in ("a.jpg", "b.jpg"):
+        source_path.joinpath(name).write_text(name)
+
+    manifest = FileSyncManifest(output_path)
+    for name in ("a.jpg", "b.jpg"):
+        manifest.sync(source_path.joinpath(name), output_path.joinpath(name))
+    manifest.remove_stale()
+    manifest.save()
+    a_inode = os.stat(output_path.joinpath("a.jpg")).st_ino
+
+    # Next run: a.jpg is unchanged, b.jpg is no longer part of the book
+    manifest = FileSyncManifest(output_path)
+    manifest.sync(source_path.joinpath("a.jpg"), output_path.joinpath("a.jpg"))
+    removed = manifest.remove_stale()
+
+    assert removed == 1
+    assert not output_path.joinpath("b.jpg").exists()
+    assert os.stat(output_path.joinpath("a.jpg")).st_ino == a_inode
+
+
+def test_changed_file_is_synced_again(tmp_path):
+    source_file_path = tmp_path.joinpath("a.jpg")
+    output_path = tmp_path.joinpath("output")
+    output_path.mkdir()
+    source_file_path.write_text("before")
+
+    manifest = FileSyncManifest(output_path)
+    manifest.sync(source_file_path, output_path.joinpath("a.jpg"))
+    # Replaced rather than modified in place, as output files may be links to the source
+    os.remove(source_file_path)
+    source_file_path.write_text("after!")
+    manifest.sync(source_file_path, output_path.joinpath("a.jpg"))
+
+    assert output_path.joinpath("a.jpg").read_text() == "after!"
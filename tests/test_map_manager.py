@@ -0,0 +1,82 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+
+import pytest
+
+import map_manager
+from map_manager import MAPS_CACHE_DIRECTORY_NAME, MAPS_CACHE_INDEX_FILE_NAME, MapManager
+from models.step import Step
+from models.trip import Trip
+
+SVG = '<svg><g fill="#000000" stroke="none"><path d="M0 0 L10 10 z"/></g></svg>'
+
+
+class MapHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        # Slow downloads, so that the downloads of the builds overlap
+        time.sleep(0.05)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/svg+xml")
+        self.end_headers()
+        self.wfile.write(SVG.replace("M0", f"M{len(self.path)}").encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def data_source():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MapHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/{{country_code}}/vector.svg"
+    server.shutdown()
+    server.server_close()
+
+
+def create_trip(country_codes):
+    steps = [
+        Step(
+            name=f"Step {index}",
+            description=None,
+            country="",
+            country_code=country_code,
+            weather_condition="",
+            weather_temperature=20,
+            start_time=datetime(2024, 3, 1).timestamp(),
+            lat=45.0,
+            lon=5.0,
+            slug=f"step-{index}",
+            id=index,
+        )
+        for index, country_code in enumerate(country_codes)
+    ]
+    return Trip(id=1, name="Trip", start_date=datetime(2024, 3, 1).timestamp(), end_date=None, steps=steps)
+
+
+def test_threaded_builds_share_a_map_manager(tmp_path, monkeypatch, data_source):
+    monkeypatch.setattr(map_manager, "COUNTRY_EXTENTS_PATH", tmp_path.joinpath("extents.json"))
+    manager = MapManager(cache_path=tmp_path.joinpath("cache"), data_source=data_source)
+    trips = [create_trip(["FR", "IT"]), create_trip(["ES", "PT"]), create_trip(["DE", "FR"])] * 4
+
+    def build(index):
+        trip = trips[index]
+        manager.download_maps_from_trip(trip, tmp_path.joinpath(f"book_{index}"))
+        return manager.calculate_position_percentages(trip.steps)
+
+    with ThreadPoolExecutor(max_workers=len(trips)) as executor:
+        positions = list(executor.map(build, range(len(trips))))
+
+    for index, trip in enumerate(trips):
+        for step in trip.steps:
+            assert tmp_path.joinpath(f"book_{index}", f"{step.country_code.lower()}.svg").exists()
+    assert all(position != (0, 0) for trip_positions in positions for position in trip_positions)
+
+    index_path = tmp_path.joinpath("cache", MAPS_CACHE_DIRECTORY_NAME, MAPS_CACHE_INDEX_FILE_NAME)
+    assert sorted(json.loads(index_path.read_text())) == ["de", "es", "fr", "it", "pt"]
+    extents = json.loads(tmp_path.joinpath("extents.json").read_text())
+    assert sorted(extents) == ["de", "es", "fr", "it", "pt"]
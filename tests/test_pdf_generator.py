@@ -0,0 +1,63 @@
+import os
+
+from pdf_generator import PAGE_CLASS, STEP_END_MARKER, STEP_START_MARKER, PDFGenerator, split_html_by_steps
+
+
+def create_step_html(pages: int) -> str:
+    return STEP_START_MARKER + f"<div {PAGE_CLASS}></div>" * pages + STEP_END_MARKER
+
+
+def test_split_html_by_steps():
+    steps_html = [create_step_html(1), create_step_html(2)]
+    html = "<html><body>" + "\n".join(steps_html) + "</body></html>"
+
+    head, split_steps_html, tail = split_html_by_steps(html)
+
+    assert head == "<html><body>"
+    assert [step_html.strip() for step_html in split_steps_html] == steps_html
+    assert tail == "</body></html>"
+    assert head + "".join(split_steps_html) + tail == html
+
+
+def test_split_html_without_steps():
+    assert split_html_by_steps("<html></html>") == ("<html></html>", [], "")
+
+
+def test_shards_hold_about_the_same_number_of_pages():
+    steps_html = [create_step_html(pages) for pages in (4, 1, 1, 1, 1, 4)]
+
+    shards = PDFGenerator(shards=2)._split_in_shards(steps_html)
+
+    assert [len(shard) for shard in shards] == [3, 3]
+
+
+def test_every_shard_gets_a_step():
+    steps_html = [create_step_html(pages) for pages in (10, 1, 1)]
+
+    shards = PDFGenerator(shards=3)._split_in_shards(steps_html)
+
+    assert [len(shard) for shard in shards] == [1, 1, 1]
+
+
+def test_shards_are_limited_to_the_number_of_steps():
+    shards = PDFGenerator(shards=4)._split_in_shards([create_step_html(1), create_step_html(1)])
+
+    assert len(shards) == 2
+
+
+def test_fragment_key_depends_on_the_content_of_the_assets(tmp_path):
+    photo_path = tmp_path.joinpath("photo.jpg")
+    photo_path.write_bytes(b"aaaa")
+    step_html = '<img src="photo.jpg">'
+    pdf_generator = PDFGenerator(incremental=True)
+
+    def get_key():
+        return pdf_generator._get_fragment_key("", step_html, "", 0, tmp_path, {})
+
+    key = get_key()
+    os.utime(photo_path, ns=(1, 1))
+    assert get_key() == key
+
+    photo_path.write_bytes(b"bbbb")
+    os.utime(photo_path, ns=(1, 1))
+    assert get_key() != key
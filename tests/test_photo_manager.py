@@ -0,0 +1,126 @@
+from datetime import datetime
+from pathlib import Path
+
+from models.photo import Photo, PhotoMetadata
+from models.step import Step
+from photo_manager import PhotoManager, StepPhotosLayout, parse_photos_by_pages
+
+
+def create_step(id: int = 1, photos_count: int = 3) -> Step:
+    step = Step(
+        name="Lisbon",
+        description=None,
+        country="Portugal",
+        country_code="PT",
+        weather_condition="rain",
+        weather_temperature=12,
+        start_time=datetime(2024, 3, 1).timestamp(),
+        lat=38.7,
+        lon=-9.1,
+        slug="lisbon",
+        id=id,
+    )
+    step.photos = [
+        Photo(
+            id=f"photo-{index}",
+            index=index,
+            path=Path(f"photo-{index}.jpg"),
+            metadata=PhotoMetadata(width=1600, height=1200),
+        )
+        for index in range(1, photos_count + 1)
+    ]
+    return step
+
+
+def get_photos_mapping(step: Step):
+    return {str(photo.index): photo.to_dict() for photo in step.photos}
+
+
+def test_parse_photos_by_pages():
+    layouts = parse_photos_by_pages(
+        [
+            "01/03/2024 Lisbon (1)",
+            "Cover photo: 1",
+            "2 3",
+            "4",
+            "",
+            "",
+            "02/03/2024 Porto (2)",
+            "1 2",
+        ]
+    )
+
+    assert list(layouts) == ["01/03/2024 Lisbon (1)", "02/03/2024 Porto (2)"]
+    lisbon = layouts["01/03/2024 Lisbon (1)"][0]
+    assert lisbon.cover_photo_index == "1"
+    assert lisbon.pages == [["2", "3"], ["4"]]
+    assert lisbon.get_photo_indexes() == ["2", "3", "4", "1"]
+    porto = layouts["02/03/2024 Porto (2)"][0]
+    assert porto.cover_photo_index is None
+    assert porto.pages == [["1", "2"]]
+
+
+def test_parse_photos_by_pages_keeps_blocks_with_the_same_header_in_order():
+    layouts = parse_photos_by_pages(["Step (1)", "1", "", "Step (1)", "2"])
+
+    assert [layout.pages for layout in layouts["Step (1)"]] == [[["1"]], [["2"]]]
+
+
+def test_cover_photo_line_after_a_page_is_a_page():
+    layouts = parse_photos_by_pages(["Step (1)", "1", "Cover photo: 2"])
+
+    layout = layouts["Step (1)"][0]
+    assert layout.cover_photo_index is None
+    assert len(layout.pages) == 2
+
+
+def test_apply_layout_places_the_photos_of_the_step():
+    step = create_step()
+    layout = StepPhotosLayout("Lisbon")
+    layout.cover_photo_index = "1"
+    layout.pages = [["3", "2"]]
+
+    problems = PhotoManager()._apply_layout(step, layout, get_photos_mapping(step))
+
+    assert problems == []
+    assert step.cover_photo is step.photos[0]
+    assert step.photos_by_pages == [[step.photos[2], step.photos[1]]]
+
+
+def test_apply_layout_reports_unknown_indexes():
+    step = create_step()
+    layout = StepPhotosLayout("Lisbon")
+    layout.pages = [["1", "2", "3", "9"]]
+
+    problems = PhotoManager()._apply_layout(step, layout, get_photos_mapping(step))
+
+    assert problems == ["unknown photo index(es) 9"]
+
+
+def test_apply_layout_reports_unknown_indexes_with_the_other_problems():
+    step = create_step(photos_count=4)
+    layout = StepPhotosLayout("Lisbon")
+    layout.cover_photo_index = "8"
+    layout.pages = [["1", "1", "9"], ["2"]]
+
+    problems = PhotoManager()._apply_layout(step, layout, get_photos_mapping(step))
+
+    assert problems == [
+        "unknown photo index(es) 9, 8",
+        "a photo is used more than once",
+        "photo(s) 3, 4 are present in the PolarSteps export but not in pages",
+    ]
+
+
+def test_apply_layout_reports_duplicate_missing_photos_and_oversized_pages():
+    step = create_step(photos_count=6)
+    layout = StepPhotosLayout("Lisbon")
+    layout.pages = [["1", "1", "2", "3", "4"]]
+
+    problems = PhotoManager()._apply_layout(step, layout, get_photos_mapping(step))
+
+    assert problems == [
+        "a photo is used more than once",
+        "1 page(s) have more than 4 photos",
+        "photo(s) 5, 6 are present in the PolarSteps export but not in pages",
+    ]
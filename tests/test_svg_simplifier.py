@@ -0,0 +1,19 @@
+from svg_simplifier import simplify_svg
+
+SVG = (
+    '<svg viewBox="0 0 1000 1000">'
+    '<path d="M0 0 L100.123 0.004 L200.456 0.002 L300 0 L300 300 Z"/>'
+    "</svg>"
+)
+
+
+def test_points_are_snapped_and_collinear_points_dropped():
+    simplified = simplify_svg(SVG, resolution=100)
+
+    assert simplified == '<svg viewBox="0 0 1000 1000"><path d="m0 0 l300 0 0 300 z"/></svg>'
+
+
+def test_svg_without_view_box_is_unchanged():
+    svg = '<svg><path d="M0 0 L1 1"/></svg>'
+
+    assert simplify_svg(svg, resolution=100) == svg